@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Incremental asset pipeline for the app's PNG assets.
+
+Runs the background-removal transforms as stages over assets/:
+
+    white_bg      clean_badges_bg.clean_file            assets/badges/*.png
+    checkerboard  remove_checkerboard.flood_fill_seeds  assets/pixel-*.png
+    optimize_png  png_optimize.optimize_png             both, after the above
+
+A local, git-ignored manifest (scripts/asset_manifest.json) records, per
+file, the hash of the file as the pipeline last left it plus the stage
+parameters used. A file is only reprocessed when its content or its
+parameters change; size and mtime are checked first so unchanged files are
+not even hashed. Changed files are fanned out to a process pool and timed
+individually, and the bytes saved by optimize_png are totalled.
+
+Usage:
+    python asset_pipeline.py [--stage NAME ...] [--threshold N] [--tolerance N]
+        [--edge-stride N] [--workers N] [--force] [--dry-run]
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+import clean_badges_bg
+import png_optimize
+import remove_checkerboard
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+ASSETS_DIR = SCRIPT_DIR.parent / "assets"
+MANIFEST_PATH = SCRIPT_DIR / "asset_manifest.json"
+PIPELINE_VERSION = 2  # bump when a stage's output changes for the same parameters
+
+
+def run_white_bg(path, threshold):
+    return {"pixels": clean_badges_bg.clean_file(path, threshold)}
+
+
+def run_checkerboard(path, tolerance, edge_stride):
+    with Image.open(path) as img:
+        img = img.convert("RGBA")
+        seeds = remove_checkerboard.edge_seeds(img.width, img.height, edge_stride)
+        removed = remove_checkerboard.flood_fill_seeds(img, seeds, tolerance)
+        # Nothing filled: leave the file (palette or not) as it is rather than re-encode it
+        if removed:
+            img.save(path, "PNG")
+    return {"pixels": removed}
+
+
+def run_optimize_png(path):
+    before, after, _ = png_optimize.optimize_png(path)
+    return {"bytes_before": before, "bytes_after": after}
+
+
+# Stage name -> (glob patterns relative to assets/, default parameters, function(path, **params)).
+# Stages run in this order; each function returns a dict of numeric metrics.
+STAGES = {
+    "white_bg": (
+        ["badges/*.png"],
+        {"threshold": clean_badges_bg.DEFAULT_THRESHOLD},
+        run_white_bg,
+    ),
+    "checkerboard": (
+        ["pixel-*.png"],
+        {"tolerance": remove_checkerboard.DEFAULT_TOLERANCE,
+         "edge_stride": remove_checkerboard.DEFAULT_EDGE_STRIDE},
+        run_checkerboard,
+    ),
+    "optimize_png": (
+        ["badges/*.png", "pixel-*.png"],
+        {},
+        run_optimize_png,
+    ),
+}
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def load_manifest(path):
+    if not path.exists():
+        return {"version": PIPELINE_VERSION, "files": {}}
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    if manifest.get("version") != PIPELINE_VERSION:
+        return {"version": PIPELINE_VERSION, "files": {}}
+    return manifest
+
+
+def save_manifest(path, manifest):
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def plan(assets_dir, stage_params):
+    """Map each asset (relative posix path) to the stages that apply to it, in stage order."""
+    files = {}
+    all_files = sorted(
+        p.relative_to(assets_dir).as_posix() for p in assets_dir.rglob("*.png") if p.is_file()
+    )
+    for name, params in stage_params.items():
+        patterns = STAGES[name][0]
+        for rel in all_files:
+            if any(fnmatch.fnmatchcase(rel, pattern) for pattern in patterns):
+                files.setdefault(rel, {})[name] = params
+    return files
+
+
+def is_current(assets_dir, rel, stages, entry):
+    """True if the manifest entry says `rel` was produced by exactly these stages and parameters."""
+    if not entry or entry.get("stages") != stages:
+        return False
+    stat = (assets_dir / rel).stat()
+    if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    if entry.get("size") != stat.st_size:
+        return False
+    # Touched but maybe not changed (checkout, copy): fall back to the content hash
+    if file_sha256(assets_dir / rel) == entry.get("sha256"):
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+    return False
+
+
+def format_metrics(stage_results):
+    parts = []
+    for name, metrics in stage_results.items():
+        if "bytes_before" in metrics:
+            before, after = metrics["bytes_before"], metrics["bytes_after"]
+            parts.append(f"{name}: {before / 1024:.1f} -> {after / 1024:.1f} KB, "
+                         f"{(before - after) / max(before, 1):.1%} saved")
+        else:
+            parts.append(f"{name}: " + ", ".join(f"{value} {key}" for key, value in metrics.items()))
+    return "; ".join(parts)
+
+
+def process_file(path, stages):
+    """Apply stages to one file in order. Returns (per-stage results, seconds, new sha256)."""
+    started = time.perf_counter()
+    results = {}
+    for name, params in stages.items():
+        results[name] = STAGES[name][2](path, **params)
+    return results, time.perf_counter() - started, file_sha256(path)
+
+
+def run_pipeline(assets_dir=ASSETS_DIR, manifest_path=MANIFEST_PATH, stage_params=None,
+                 workers=None, force=False, dry_run=False):
+    """Process every asset whose content or stage parameters changed. Returns the number processed."""
+    started = time.perf_counter()
+    if stage_params is None:
+        stage_params = {name: dict(spec[1]) for name, spec in STAGES.items()}
+
+    manifest = load_manifest(manifest_path)
+    files = plan(assets_dir, stage_params)
+    # Forget assets that were deleted or are no longer covered by a selected stage
+    manifest["files"] = {
+        rel: entry for rel, entry in manifest["files"].items()
+        if (assets_dir / rel).exists() and (rel in files or not set(entry["stages"]) <= set(stage_params))
+    }
+
+    pending = [
+        rel for rel, stages in files.items()
+        if force or not is_current(assets_dir, rel, stages, manifest["files"].get(rel))
+    ]
+    print(f"{len(files)} assets, {len(pending)} to process")
+
+    if dry_run:
+        for rel in pending:
+            print(f"  would process: {rel} ({', '.join(files[rel])})")
+        return 0
+
+    if pending:
+        paths = [str(assets_dir / rel) for rel in pending]
+        stages = [files[rel] for rel in pending]
+        if workers == 1 or len(pending) == 1:
+            results = map(process_file, paths, stages)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(process_file, paths, stages)
+        totals = {}
+        try:
+            for rel, (stage_results, seconds, digest) in zip(pending, results):
+                stat = (assets_dir / rel).stat()
+                manifest["files"][rel] = {
+                    "sha256": digest,
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "stages": files[rel],
+                }
+                print(f"  {seconds:6.2f}s  {rel}  ({format_metrics(stage_results)})")
+                for name, metrics in stage_results.items():
+                    stage_totals = totals.setdefault(name, {})
+                    for key, value in metrics.items():
+                        stage_totals[key] = stage_totals.get(key, 0) + value
+        finally:
+            if pool:
+                pool.shutdown()
+        print(f"Total: {format_metrics({name: totals[name] for name in STAGES if name in totals})}")
+
+    save_manifest(manifest_path, manifest)
+    print(f"Done in {time.perf_counter() - started:.2f}s")
+    return len(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally clean the app's PNG assets")
+    parser.add_argument(
+        "--stage",
+        action="append",
+        choices=sorted(STAGES),
+        help="Run only this stage (repeatable; default: all stages)"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        default=clean_badges_bg.DEFAULT_THRESHOLD,
+        help=f"white_bg: R, G and B above this are background (default: {clean_badges_bg.DEFAULT_THRESHOLD})"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=int,
+        default=remove_checkerboard.DEFAULT_TOLERANCE,
+        help=f"checkerboard: max per-channel difference from a seed's color "
+             f"(default: {remove_checkerboard.DEFAULT_TOLERANCE})"
+    )
+    parser.add_argument(
+        "--edge-stride",
+        type=int,
+        default=remove_checkerboard.DEFAULT_EDGE_STRIDE,
+        help=f"checkerboard: seed every Nth edge pixel (default: {remove_checkerboard.DEFAULT_EDGE_STRIDE})"
+    )
+    parser.add_argument("--workers", type=int, help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true", help="Reprocess every asset, ignoring the manifest")
+    parser.add_argument("--dry-run", action="store_true", help="List assets that would be processed")
+    parser.add_argument("--assets-dir", default=str(ASSETS_DIR), help="Assets directory (default: assets/)")
+    parser.add_argument("--manifest", default=str(MANIFEST_PATH), help="Manifest file (default: scripts/asset_manifest.json)")
+    args = parser.parse_args()
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.edge_stride < 1:
+        parser.error("--edge-stride must be at least 1")
+
+    params = {
+        "white_bg": {"threshold": args.threshold},
+        "checkerboard": {"tolerance": args.tolerance, "edge_stride": args.edge_stride},
+        "optimize_png": {},
+    }
+    selected = args.stage or list(STAGES)
+    stage_params = {name: params[name] for name in STAGES if name in selected}
+
+    assets_dir = Path(args.assets_dir)
+    if not assets_dir.is_dir():
+        print(f"Directory not found: {assets_dir}")
+        sys.exit(1)
+
+    run_pipeline(assets_dir, Path(args.manifest), stage_params, args.workers, args.force, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the scraper against the local stand-in site.
+
+Starts standin_site.py in a subprocess (so serving does not compete with the
+scraper for the GIL), points `scrape_machines` at it with a site-origin
+override, and scrapes machines 1..--machines into a temporary directory with
+fresh state. Reports machines/s and bytes/s over the whole run, request
+latency percentiles per kind (exact, from the metrics event log), retries
+and failures, and what the server saw. Use it to compare fetch-path changes
+offline: same seed and fault settings, same request stream.
+
+Pacing defaults far above the real site's rates, so the scraper itself is
+what gets measured; pass --page-rate/--image-rate to test the throttle.
+
+Usage:
+    python load_test.py [--machines 200] [--concurrency N] [--page-rate RPS] [--image-rate RPS]
+        [--parser {soup,lxml}] [--parse-workers N] [--no-image-processing] [--json <file>]
+        [--latency S] [--jitter S] [--bandwidth KBPS] [--error-rate P]
+        [--throttle-rate P] [--retry-after S] [--truncate-rate P]
+        [--image-size WxH] [--seed N]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+SCRAPER_DIR = BENCH_DIR.parent / "scraper"
+sys.path.insert(0, str(SCRAPER_DIR))
+
+from jihanki_scraper import (  # noqa: E402
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_DIMENSION,
+    DEFAULT_PARSER,
+    DEFAULT_THUMB_DIMENSION,
+    PARSERS,
+    scrape_machines,
+)
+from metrics import Metrics  # noqa: E402
+
+from standin_site import add_site_arguments, check_site_arguments  # noqa: E402
+
+DEFAULT_MACHINES = 200
+DEFAULT_RATE = 1000.0  # requests per second; effectively unpaced
+SITE_URL = "https://jihanki.sagase.com/jihanki/{}/"
+PERCENTILES = (50, 95, 99)
+
+
+def start_server(site_args: list[str]) -> tuple[subprocess.Popen, str]:
+    """Run standin_site.py on a free port. Returns the process and its origin."""
+    process = subprocess.Popen(
+        [sys.executable, str(BENCH_DIR / "standin_site.py"), "--port", "0", *site_args],
+        stdout=subprocess.PIPE, text=True,
+    )
+    line = process.stdout.readline()
+    if not line.startswith("Serving "):
+        process.kill()
+        raise RuntimeError(f"Stand-in site did not start: {line!r}")
+    return process, line.split()[1]
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def request_latencies(log_path: Path) -> dict[str, list[float]]:
+    """Sorted request latencies per kind from a metrics event log."""
+    latencies: dict[str, list[float]] = {}
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            if event["event"] == "request":
+                latencies.setdefault(event["kind"], []).append(event["seconds"])
+    return {kind: sorted(values) for kind, values in latencies.items()}
+
+
+def failed_images(json_path: Optional[str]) -> int:
+    """Count the images in the scraper's JSON output that ended up without a local file."""
+    if not json_path:
+        return 0  # nothing was scraped
+    with open(json_path, "r", encoding="utf-8") as f:
+        machines = json.load(f)["machines"]
+    return sum(1 for machine in machines for img_info in machine["images"] if not img_info["local_path"])
+
+
+def run_load_test(origin: str, machines: int, workdir: Path, **scrape_options) -> dict:
+    """Scrape machines 1..`machines` from `origin`. Returns the measurements."""
+    input_file = workdir / "machines.md"
+    input_file.write_text("\n".join(SITE_URL.format(i) for i in range(1, machines + 1)) + "\n", encoding="utf-8")
+    log_path = workdir / "metrics.jsonl"
+    metrics = Metrics(str(log_path))
+
+    started = time.perf_counter()
+    # The scraper reports every machine; only the measurements matter here
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = scrape_machines(
+            str(input_file), str(workdir / "output"),
+            state_db=str(workdir / "output" / "scrape_state.db"),
+            image_store_dir=str(workdir / "output" / "image_store"),
+            metrics=metrics, delta=False, site_origin=origin,
+            **scrape_options,
+        )
+    seconds = time.perf_counter() - started
+    metrics.close()
+
+    latencies = request_latencies(log_path)
+    result = {
+        "machines": summary["machines"],
+        "failed": len(summary["errors"]),
+        "failed_images": failed_images(summary["json_path"]),
+        "seconds": seconds,
+        "machines_per_second": summary["machines"] / seconds,
+        "bytes": metrics.counter("request_bytes_total"),
+        "bytes_per_second": metrics.counter("request_bytes_total") / seconds,
+        "requests": {},
+    }
+    for kind, values in latencies.items():
+        result["requests"][kind] = {
+            "count": len(values),
+            "retries": metrics.counter("retries_total", kind=kind),
+            "errors": {
+                error_type: metrics.counter("errors_total", kind=kind, type=error_type)
+                for error_type in metrics.label_values("errors_total", "type")
+                if metrics.counter("errors_total", kind=kind, type=error_type)
+            },
+            "bytes": metrics.counter("request_bytes_total", kind=kind),
+            "latency": {f"p{p}": percentile(values, p) for p in PERCENTILES} | {"max": values[-1]},
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the scraper against a local stand-in site")
+    parser.add_argument(
+        "--concurrency", "-c",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Max in-flight requests per host (default: {DEFAULT_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--page-rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=f"Page requests per second (default: {DEFAULT_RATE:g}, effectively unpaced)"
+    )
+    parser.add_argument(
+        "--image-rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=f"Image requests per second (default: {DEFAULT_RATE:g}, effectively unpaced)"
+    )
+    parser.add_argument(
+        "--parser",
+        choices=sorted(PARSERS),
+        default=DEFAULT_PARSER,
+        help=f"Page parser (default: {DEFAULT_PARSER})"
+    )
+    parser.add_argument("--parse-workers", type=int, help="Parser processes, 0 for in-process (default: CPUs)")
+    parser.add_argument("--no-image-processing", action="store_true", help="Skip WebP variants and thumbnails")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    add_site_arguments(parser)
+    parser.set_defaults(machines=DEFAULT_MACHINES)
+    args = parser.parse_args()
+    check_site_arguments(parser, args)
+    if args.concurrency < 1 or args.page_rate <= 0 or args.image_rate <= 0:
+        parser.error("--concurrency must be at least 1 and the rates positive")
+
+    site_args = [
+        "--machines", str(args.machines), "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--bandwidth", str(args.bandwidth), "--error-rate", str(args.error_rate),
+        "--throttle-rate", str(args.throttle_rate), "--retry-after", str(args.retry_after),
+        "--truncate-rate", str(args.truncate_rate), "--image-size", args.image_size, "--seed", str(args.seed),
+    ]
+    server, origin = start_server(site_args)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run_load_test(
+                origin, args.machines, Path(tmp),
+                concurrency=args.concurrency, page_rate=args.page_rate, image_rate=args.image_rate,
+                parser=args.parser, parse_workers=args.parse_workers,
+                image_sizes=None if args.no_image_processing else (DEFAULT_MAX_DIMENSION, DEFAULT_THUMB_DIMENSION),
+            )
+        with urllib.request.urlopen(f"{origin}/_stats") as response:
+            result["server"] = json.load(response)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"Scraped {result['machines']} machines ({result['failed']} failed, "
+          f"{result['failed_images']} images failed) in {result['seconds']:.1f}s: "
+          f"{result['machines_per_second']:.1f} machines/s, {result['bytes_per_second'] / 1e6:.2f} MB/s")
+    for kind, stats in sorted(result["requests"].items()):
+        latency = "  ".join(f"{name} {value * 1000:.0f} ms" for name, value in stats["latency"].items())
+        errors = ", ".join(f"{name} {count:g}" for name, count in sorted(stats["errors"].items()))
+        print(f"  {kind:<6} {stats['count']:>6} requests, {stats['retries']:g} retries  {latency}"
+              + (f"  errors: {errors}" if errors else ""))
+    print("  server: " + ", ".join(f"{status} {count}" for status, count in sorted(result["server"].items())))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the scraper parser and the asset-cleaning scripts.
+
+Measures throughput (pages/s or megapixels/s) and peak Python heap memory for:
+
+- parse_machine_page (BeautifulSoup) and the lxml extractor, over the fixture
+  corpus in scraper/fixtures/pages and generated pages of increasing size
+- extract_coordinates_from_scripts on a script-heavy page
+- remove_white_bg (clean_badges_bg.py) on synthetic badge and photo PNGs
+- flood_fill_transparent / remove_background (remove_checkerboard.py) on
+  synthetic pixel-art and photo PNGs
+
+Results are compared against baseline.json; a benchmark that is slower or
+uses more memory than its baseline by more than --tolerance fails the run.
+Baselines are machine-specific, so none is committed: record one with
+--update-baseline on the machine that runs the comparison. Without a
+baseline the results are only reported.
+
+Usage:
+    python run_benchmarks.py [--only <substring>] [--repeat N] [--tolerance 0.25]
+        [--baseline <file>] [--update-baseline] [--json <file>]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from PIL import Image
+
+BENCH_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = BENCH_DIR.parent
+SCRAPER_DIR = SCRIPTS_DIR / "scraper"
+sys.path.insert(0, str(SCRIPTS_DIR))
+sys.path.insert(0, str(SCRAPER_DIR))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import clean_badges_bg  # noqa: E402
+import remove_checkerboard  # noqa: E402
+from jihanki_scraper import PARSERS, extract_coordinates_from_scripts  # noqa: E402
+
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_TOLERANCE = 0.25
+FIXTURES_DIR = SCRAPER_DIR / "fixtures" / "pages"
+FIXTURE_URL = "https://jihanki.sagase.com/jihanki/{}/"
+
+# Synthetic image sizes: badges in assets/badges are 2048x2048, pixel-* icons 1024x1024
+BADGE_SIZE = (2048, 2048)
+ICON_SIZE = (1024, 1024)
+PHOTO_SIZE = (3000, 2000)
+FLOOD_PHOTO_SIZE = (2048, 1536)
+UHD_SIZE = (3840, 2160)
+# Generated page size (KB) -> passes per timed run, so every run takes a measurable time
+GENERATED_PAGES = {32: 20, 256: 4, 1024: 1}
+FIXTURE_PASSES = 10
+MEMORY_SLACK_MB = 1.0  # ignore peak-memory growth below this
+
+
+# Inputs
+
+def load_fixture_pages() -> list[tuple[str, str, str]]:
+    return [
+        (FIXTURE_URL.format(path.stem), path.stem, path.read_text(encoding="utf-8"))
+        for path in sorted(FIXTURES_DIR.glob("*.html"))
+    ]
+
+
+def generate_page(target_kb: int) -> str:
+    """A fixture page grown to about `target_kb` with sidebar items and article text."""
+    html = (FIXTURES_DIR / "3492.html").read_text(encoding="utf-8")
+    item = ('<li class="p-postList__item"><a href="https://jihanki.sagase.com/jihanki/{n}/" '
+            'class="p-postList__link"><div class="p-postList__thumb"><img '
+            'src="https://jihanki.sagase.com/wp/wp-content/uploads/2022/01/thumb-{n}-150x150.jpg" '
+            'width="150" height="150" alt=""></div><div class="p-postList__title">'
+            '自販機 {n} の紹介</div></a></li>\n')
+    paragraph = '<p>この自販機は駅から徒歩5分の場所にあります。営業時間は24時間、商品は毎日補充されます。</p>\n'
+    items, paragraphs = [], []
+    n = 0
+    while len(html.encode("utf-8")) + sum(len(x.encode("utf-8")) for x in items + paragraphs) < target_kb * 1024:
+        items.append(item.format(n=5000 + n))
+        paragraphs.append(paragraph)
+        n += 1
+    html = html.replace('</ul>\n  </div>\n  <div id="tag_cloud"', "".join(items) + '</ul>\n  </div>\n  <div id="tag_cloud"', 1)
+    return html.replace("</article>", "".join(paragraphs) + "</article>", 1)
+
+
+def generate_script_page(scripts: int = 300) -> str:
+    """A page with many inline scripts; only the last one holds coordinates."""
+    filler = "<script>window.ads = window.ads || []; window.ads.push({slot: 'side-%d', size: [300, 250]});</script>\n"
+    body = "".join(filler % i for i in range(scripts))
+    body += "<script>var machineMap = {\"lat\": 35.702839, \"lng\": 139.737497};</script>\n"
+    return f"<html><head><title>scripts</title></head><body>{body}</body></html>"
+
+
+def badge_image(size: tuple[int, int]) -> Image.Image:
+    """Near-white background with a shaded disc and ring, like the badge art."""
+    w, h = size
+    rng = np.random.default_rng(7)
+    y, x = np.mgrid[0:h, 0:w]
+    r = np.hypot(x - w / 2, y - h / 2) / (min(w, h) / 2)
+    rgb = np.empty((h, w, 3), dtype=np.uint8)
+    rgb[...] = 246 + rng.integers(0, 10, size=(h, w, 1), dtype=np.uint8)
+    disc = r < 0.8
+    rgb[disc, 0] = (200 * (1 - r[disc])).astype(np.uint8) + 40
+    rgb[disc, 1] = (120 * r[disc]).astype(np.uint8) + 60
+    rgb[disc, 2] = 180
+    ring = (r >= 0.8) & (r < 0.86)
+    rgb[ring] = (250, 250, 240)
+    alpha = np.full((h, w, 1), 255, dtype=np.uint8)
+    return Image.fromarray(np.concatenate([rgb, alpha], axis=2), "RGBA")
+
+
+def photo_image(size: tuple[int, int]) -> Image.Image:
+    """Noisy colour gradient with a white border, like a product photo."""
+    w, h = size
+    rng = np.random.default_rng(11)
+    y, x = np.mgrid[0:h, 0:w]
+    rgb = np.stack([x * 255 // w, y * 255 // h, (x + y) * 255 // (w + h)], axis=2).astype(np.int16)
+    rgb += rng.integers(-12, 12, size=rgb.shape, dtype=np.int16)
+    rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+    border = max(w, h) // 20
+    rgb[:border], rgb[-border:], rgb[:, :border], rgb[:, -border:] = 255, 255, 255, 255
+    return Image.fromarray(rgb, "RGB").convert("RGBA")
+
+
+def pixel_art_image(size: tuple[int, int], cell: int = 16) -> Image.Image:
+    """Light checkerboard background around a blocky figure, like the pixel-* icons."""
+    w, h = size
+    y, x = np.mgrid[0:h, 0:w]
+    checker = ((x // cell + y // cell) % 2).astype(bool)
+    rgb = np.where(checker[..., None], np.uint8(236), np.uint8(212)).repeat(3, axis=2).astype(np.uint8)
+    block = max(w, h) // 32
+    figure = (np.abs(x - w // 2) < w // 4) & (np.abs(y - h // 2) < h // 3)
+    pattern = ((x // block) * 7 + (y // block) * 3) % 5
+    palette = np.array([[30, 30, 60], [200, 60, 40], [250, 200, 60], [40, 140, 90], [90, 60, 30]], dtype=np.uint8)
+    rgb[figure] = palette[pattern[figure]]
+    alpha = np.full((h, w, 1), 255, dtype=np.uint8)
+    return Image.fromarray(np.concatenate([rgb, alpha], axis=2), "RGBA")
+
+
+# Benchmarks. Each returns (setup, run, units per run, unit name).
+
+def parser_bench(parser: str, pages: list[tuple[str, str, str]], passes: int = 1):
+    parse = PARSERS[parser]
+
+    def run():
+        for _ in range(passes):
+            for url, machine_id, html in pages:
+                parse(html, url, machine_id)
+    return (lambda: None), run, passes * len(pages), "pages/s"
+
+
+def coordinates_bench(passes: int = 200):
+    soup = BeautifulSoup(generate_script_page(), "lxml")
+
+    def run():
+        for _ in range(passes):
+            assert extract_coordinates_from_scripts(soup) == (35.702839, 139.737497)
+    return (lambda: None), run, passes, "pages/s"
+
+
+def white_bg_bench(image: Image.Image, workdir: Path):
+    target = workdir / "white_bg"
+    source = workdir / "white_bg_source.png"
+    image.save(source)
+
+    def setup():
+        shutil.rmtree(target, ignore_errors=True)
+        target.mkdir()
+        shutil.copy(source, target / "badge.png")
+
+    def run():
+        clean_badges_bg.remove_white_bg(str(target), workers=1)
+    return setup, run, image.width * image.height / 1e6, "MP/s"
+
+
+def flood_fill_bench(image: Image.Image):
+    state = {}
+
+    def setup():
+        state["img"] = image.copy()
+
+    def run():
+        remove_checkerboard.flood_fill_transparent(state["img"], 0, 0, 35)
+    return setup, run, image.width * image.height / 1e6, "MP/s"
+
+
+def remove_background_bench(image: Image.Image, workdir: Path):
+    source = workdir / "checkerboard_source.png"
+    output = workdir / "checkerboard_output.png"
+    image.save(source)
+
+    def run():
+        remove_checkerboard.remove_background(str(source), str(output), tolerance=35)
+    return (lambda: None), run, image.width * image.height / 1e6, "MP/s"
+
+
+def build_benchmarks(workdir: Path) -> dict[str, Callable]:
+    """Benchmark name -> factory. Inputs are only built for selected benchmarks."""
+    benches: dict[str, Callable] = {}
+    for parser in ("soup", "lxml"):
+        benches[f"parse_{parser}_fixtures"] = lambda p=parser: parser_bench(
+            p, load_fixture_pages(), FIXTURE_PASSES
+        )
+        for kb, passes in GENERATED_PAGES.items():
+            benches[f"parse_{parser}_generated_{kb}kb"] = lambda p=parser, kb=kb, n=passes: parser_bench(
+                p, [(FIXTURE_URL.format(9000 + kb), str(9000 + kb), generate_page(kb))], n
+            )
+    benches["extract_coordinates_300_scripts"] = coordinates_bench
+    benches["remove_white_bg_badge_2048"] = lambda: white_bg_bench(badge_image(BADGE_SIZE), workdir)
+    benches["remove_white_bg_photo_3000x2000"] = lambda: white_bg_bench(photo_image(PHOTO_SIZE), workdir)
+    benches["flood_fill_icon_1024"] = lambda: flood_fill_bench(pixel_art_image(ICON_SIZE))
+    benches["flood_fill_icon_3840x2160"] = lambda: flood_fill_bench(pixel_art_image(UHD_SIZE))
+    benches["remove_background_icon_1024"] = lambda: remove_background_bench(pixel_art_image(ICON_SIZE), workdir)
+    benches["remove_background_photo_2048x1536"] = lambda: remove_background_bench(
+        photo_image(FLOOD_PHOTO_SIZE), workdir
+    )
+    return benches
+
+
+def quiet(run: Callable) -> Callable:
+    """Wrap `run` so the scripts' per-file progress output does not clutter the report."""
+    def wrapped():
+        with contextlib.redirect_stdout(io.StringIO()):
+            run()
+    return wrapped
+
+
+def measure(factory: Callable, repeat: int) -> dict:
+    """Best-of-`repeat` throughput, then one traced run for peak Python heap memory."""
+    setup, run, units, unit = factory()
+    run = quiet(run)
+    best = float("inf")
+    for _ in range(repeat):
+        setup()
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+
+    setup()
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "throughput": units / best,
+        "unit": unit,
+        "seconds": best,
+        "peak_mb": peak / (1024 * 1024),
+    }
+
+
+def compare(name: str, result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regression messages for one benchmark (empty when within tolerance)."""
+    problems = []
+    base = baseline.get(name)
+    if not base:
+        return problems
+    if result["throughput"] < base["throughput"] * (1 - tolerance):
+        problems.append(
+            f"throughput {result['throughput']:.2f} {result['unit']} < baseline "
+            f"{base['throughput']:.2f} ({result['throughput'] / base['throughput'] - 1:+.0%})"
+        )
+    if result["peak_mb"] > base["peak_mb"] * (1 + tolerance) + MEMORY_SLACK_MB:
+        problems.append(f"peak memory {result['peak_mb']:.1f} MB > baseline {base['peak_mb']:.1f} MB "
+                        f"(+{result['peak_mb'] - base['peak_mb']:.1f} MB)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper parser and asset scripts")
+    parser.add_argument("--only", help="Run only benchmarks whose name contains this substring")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark, best kept (default: 3)")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f"Allowed slowdown / memory growth vs baseline (default: {DEFAULT_TOLERANCE})"
+    )
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="Write results to the baseline file")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    if not baseline and not args.update_baseline:
+        print(f"No baseline at {baseline_path}: reporting only (record one with --update-baseline)\n")
+
+    results = {}
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        benches = build_benchmarks(Path(tmp))
+        selected = [name for name in benches if not args.only or args.only in name]
+        if not selected:
+            print(f"No benchmarks match '{args.only}'")
+            sys.exit(1)
+
+        print(f"{'benchmark':<40} {'throughput':>16} {'time':>10} {'peak mem':>10}  vs baseline")
+        for name in selected:
+            result = measure(benches[name], args.repeat)
+            results[name] = result
+            base = baseline.get(name)
+            change = f"{result['throughput'] / base['throughput']:.2f}x" if base else "new"
+            problems = compare(name, result, baseline, args.tolerance)
+            status = "REGRESSION" if problems else "ok"
+            print(f"{name:<40} {result['throughput']:>10.2f} {result['unit']:<5} {result['seconds']:>9.3f}s "
+                  f"{result['peak_mb']:>8.1f}MB  {change} {status}")
+            for problem in problems:
+                print(f"    {problem}")
+            if problems:
+                failures.append(name)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.update_baseline:
+        baseline.update({
+            name: {k: round(v, 4) if isinstance(v, float) else v for k, v in result.items()}
+            for name, result in results.items()
+        })
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaseline updated: {baseline_path}")
+    elif failures:
+        print(f"\n{len(failures)} benchmark(s) regressed: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for jihanki.sagase.com, for load-testing the scraper offline.
+
+Serves machine pages at /jihanki/<id>/ for ids 1..--machines, built from the
+fixture corpus in scraper/fixtures/pages: machine N gets fixture N mod the
+corpus size, with its site links pointed at this server and its machine
+image URLs renamed after N, so every machine has images of its own. Images
+under /wp/wp-content/uploads/ are synthetic JPEGs, unique per URL. Pages
+carry an ETag and answer If-None-Match with 304, like the real site.
+
+Faults are injected per request, from a seeded random stream:
+
+- latency: a fixed delay plus uniform jitter before the response
+- bandwidth: response bodies are sent at a capped rate per connection
+- errors: 500 responses
+- throttling: 429 responses with a Retry-After header
+- truncation: the full Content-Length is announced, half the body is sent,
+  then the connection is closed
+
+GET /_stats returns the responses served so far, by status, as JSON.
+
+Usage:
+    python standin_site.py [--host 127.0.0.1] [--port 8000] [--machines N]
+        [--latency S] [--jitter S] [--bandwidth KBPS] [--error-rate P]
+        [--throttle-rate P] [--retry-after S] [--truncate-rate P]
+        [--image-size WxH] [--seed N]
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+BENCH_DIR = Path(__file__).resolve().parent
+FIXTURES_DIR = BENCH_DIR.parent / "scraper" / "fixtures" / "pages"
+
+SITE_PATTERN = re.compile(r"https?://jihanki\.sagase\.com")
+MACHINE_IMAGE_PATTERN = re.compile(r"(/uploads/jihanki/)\d+-")
+PAGE_PATH_PATTERN = re.compile(r"^/jihanki/(\d+)/?$")
+IMAGE_PATH_PREFIXES = ("/wp/wp-content/uploads/", "/wp-content/uploads/")
+IMAGE_VARIANTS = 8
+CHUNK_BYTES = 16 * 1024
+
+DEFAULT_MACHINES = 1000
+DEFAULT_IMAGE_SIZE = (800, 600)
+DEFAULT_RETRY_AFTER = 1
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    """'800x600' -> (800, 600)."""
+    width, _, height = value.lower().partition("x")
+    size = (int(width), int(height))
+    if min(size) < 1:
+        raise ValueError(f"invalid image size: {value}")
+    return size
+
+
+def base_images(size: tuple[int, int], seed: int) -> list[bytes]:
+    """A few photo-like JPEGs: smooth random colour fields with some grain."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    images = []
+    for _ in range(IMAGE_VARIANTS):
+        coarse = rng.integers(0, 256, (max(height // 32, 2), max(width // 32, 2), 3), dtype=np.uint8)
+        smooth = np.asarray(Image.fromarray(coarse).resize(size, Image.BICUBIC), dtype=np.int16)
+        grain = rng.integers(-12, 13, smooth.shape, dtype=np.int16)
+        pixels = np.clip(smooth + grain, 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def unique_jpeg(base: bytes, path: str) -> bytes:
+    """`base` with a JPEG comment segment naming `path` after its SOI marker,
+    so every URL has different bytes (and content hash) but decodes the same."""
+    comment = path.encode("utf-8")[:65000]
+    return base[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + base[2:]
+
+
+class StandinSite:
+    """Pages, images and fault settings shared by all request handlers."""
+
+    def __init__(self, machines: int = DEFAULT_MACHINES, latency: float = 0.0, jitter: float = 0.0,
+                 bandwidth: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = DEFAULT_RETRY_AFTER, truncate_rate: float = 0.0,
+                 image_size: tuple[int, int] = DEFAULT_IMAGE_SIZE, seed: int = 0):
+        self.templates = [path.read_text(encoding="utf-8") for path in sorted(FIXTURES_DIR.glob("*.html"))]
+        if not self.templates:
+            raise FileNotFoundError(f"No fixture pages in {FIXTURES_DIR}")
+        self.images = base_images(image_size, seed)
+        self.machines = machines
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth * 1024  # bytes per second, 0 for unlimited
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.truncate_rate = truncate_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: dict[str, int] = {}
+
+    def page(self, machine_id: int, origin: str) -> bytes:
+        html = self.templates[machine_id % len(self.templates)]
+        html = SITE_PATTERN.sub(origin, html)
+        html = MACHINE_IMAGE_PATTERN.sub(rf"\g<1>{machine_id}-", html)
+        return html.encode("utf-8")
+
+    def image(self, path: str) -> bytes:
+        return unique_jpeg(self.images[zlib.crc32(path.encode("utf-8")) % IMAGE_VARIANTS], path)
+
+    def fault(self) -> tuple[float, str]:
+        """Delay before responding, and the fault to inject: "", "error", "throttle" or "truncate"."""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            roll = self._random.random()
+        for name, rate in (("error", self.error_rate), ("throttle", self.throttle_rate),
+                           ("truncate", self.truncate_rate)):
+            if roll < rate:
+                return delay, name
+            roll -= rate
+        return delay, ""
+
+    def count(self, outcome: str) -> None:
+        with self._lock:
+            self.stats[outcome] = self.stats.get(outcome, 0) + 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as the scraper's connection pool expects
+    # Headers and body are separate writes; with Nagle on, each response waits for a delayed ACK
+    disable_nagle_algorithm = True
+    site: StandinSite
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        site = self.site
+        path = self.path.split("?", 1)[0]
+        if path == "/_stats":
+            with site._lock:
+                body = json.dumps(site.stats).encode("utf-8")
+            self.respond(200, body, "application/json")
+            return
+
+        delay, fault = site.fault()
+        if delay:
+            time.sleep(delay)
+        if fault == "error":
+            self.respond(500, b"Internal Server Error", "text/plain")
+            return
+        if fault == "throttle":
+            self.respond(429, b"Too Many Requests", "text/plain", headers={"Retry-After": f"{site.retry_after:g}"})
+            return
+
+        match = PAGE_PATH_PATTERN.match(path)
+        if match and 1 <= int(match.group(1)) <= site.machines:
+            body = site.page(int(match.group(1)), f"http://{self.headers.get('Host', '')}")
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.respond(304, b"", None, headers={"ETag": etag})
+                return
+            self.respond(200, body, "text/html; charset=UTF-8", headers={"ETag": etag},
+                         truncate=fault == "truncate")
+        elif path.startswith(IMAGE_PATH_PREFIXES) and path.lower().endswith((".jpg", ".jpeg", ".png")):
+            self.respond(200, site.image(path), "image/jpeg", truncate=fault == "truncate")
+        else:
+            self.respond(404, b"Not Found", "text/plain")
+
+    def respond(self, status: int, body: bytes, content_type: Optional[str],
+                headers: Optional[dict] = None, truncate: bool = False) -> None:
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if truncate:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+
+        if truncate:
+            body = body[:len(body) // 2]
+        rate = self.site.bandwidth
+        try:
+            for start in range(0, len(body), CHUNK_BYTES):
+                chunk = body[start:start + CHUNK_BYTES]
+                self.wfile.write(chunk)
+                if rate:
+                    time.sleep(len(chunk) / rate)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        self.site.count("truncated" if truncate else str(status))
+
+
+class SiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is routine, not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_site(site: StandinSite, host: str = "127.0.0.1", port: int = 0) -> SiteServer:
+    """Serve `site` from a background thread. Returns the server; its origin is
+    http://<host>:<server.server_port>."""
+    handler = type("SiteHandler", (Handler,), {"site": site})
+    server = SiteServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_site_arguments(parser: argparse.ArgumentParser) -> None:
+    """Site and fault options, shared with load_test.py."""
+    parser.add_argument(
+        "--machines",
+        type=int,
+        default=DEFAULT_MACHINES,
+        help=f"Machine pages served, ids 1..N (default: {DEFAULT_MACHINES})"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each response (default: 0)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay, up to this many seconds")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="KB/s per response body, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=DEFAULT_RETRY_AFTER,
+        help=f"Retry-After seconds on 429 responses, fractions allowed (default: {DEFAULT_RETRY_AFTER})"
+    )
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Fraction of bodies cut off halfway")
+    parser.add_argument(
+        "--image-size",
+        default="{}x{}".format(*DEFAULT_IMAGE_SIZE),
+        help="Width x height of the served images (default: {}x{})".format(*DEFAULT_IMAGE_SIZE)
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for faults and images (default: 0)")
+
+
+def check_site_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> tuple[int, int]:
+    """Validate the site options. Returns the image size."""
+    rates = (args.error_rate, args.throttle_rate, args.truncate_rate)
+    if any(rate < 0 for rate in rates) or sum(rates) > 1:
+        parser.error("fault rates must be non-negative and add up to at most 1")
+    if args.machines < 1 or min(args.latency, args.jitter, args.bandwidth, args.retry_after) < 0:
+        parser.error("--machines must be at least 1; --latency, --jitter, --bandwidth and --retry-after "
+                     "cannot be negative")
+    try:
+        return parse_size(args.image_size)
+    except ValueError:
+        parser.error("--image-size must look like 800x600")
+
+
+def site_from_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> StandinSite:
+    image_size = check_site_arguments(parser, args)
+    return StandinSite(
+        args.machines, args.latency, args.jitter, args.bandwidth, args.error_rate, args.throttle_rate,
+        args.retry_after, args.truncate_rate, image_size, args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for jihanki.sagase.com")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind, 0 for any free port (default: 8000)")
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    site = site_from_args(parser, args)
+    server = start_site(site, args.host, args.port)
+    print(f"Serving http://{args.host}:{server.server_port} ({site.machines} machines)", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(site.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Pack the badge and pixel-art PNGs into sprite sheets.
+
+Each group of assets (assets/badges/*.png, assets/pixel-*.png) is scaled to
+its display resolution, trimmed to its opaque bounding box and bin-packed
+(MaxRects, best short side fit) into one or more sheets. For every group the
+script writes:
+
+    assets/atlases/<group>-<n>.png   the sheets
+    assets/atlases/<group>.json      frame map: sheet, frame rect, trim offsets
+    assets/atlases/index.ts          require() map of every sheet and frame map
+
+The build is deterministic: inputs are sorted by name, packing has no
+randomness, and files are only rewritten when their bytes change, so the
+atlases change only when the inputs (or the packing options) do.
+
+Usage:
+    python build_atlas.py [--group NAME ...] [--max-sheet-size PX]
+        [--sprite-size PX] [--padding PX] [--clean] [--output-dir <dir>]
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+ASSETS_DIR = SCRIPT_DIR.parent / "assets"
+DEFAULT_OUTPUT_DIR = ASSETS_DIR / "atlases"
+DEFAULT_MAX_SHEET_SIZE = 2048
+DEFAULT_PADDING = 2  # pixels around each sprite, filled by extruding its edges
+
+# Group -> (glob relative to assets/, longest side of a sprite in the atlas, resampling filter)
+GROUPS = {
+    "badges": ("badges/*.png", 256, Image.Resampling.LANCZOS),
+    "pixel": ("pixel-*.png", 256, Image.Resampling.NEAREST),
+}
+
+
+def load_sprite(path, sprite_size, resample):
+    """Scale an asset so its longest side is `sprite_size` and trim transparent borders.
+
+    Returns (trimmed image, source size after scaling, trim box in that size).
+    """
+    with Image.open(path) as img:
+        img = img.convert("RGBA")
+        scale = sprite_size / max(img.size)
+        if scale < 1:
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), resample)
+        source_size = img.size
+        box = img.getchannel("A").getbbox() or (0, 0, 1, 1)
+        return img.crop(box), source_size, box
+
+
+class MaxRects:
+    """MaxRects bin packer for one sheet, best short side fit, no rotation."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.free = [(0, 0, width, height)]
+
+    def insert(self, w, h):
+        """Place a w x h rect. Returns (x, y) or None if it does not fit."""
+        best = None
+        for fx, fy, fw, fh in self.free:
+            if w <= fw and h <= fh:
+                short, long = sorted((fw - w, fh - h))
+                score = (short, long, fy, fx)
+                if best is None or score < best[0]:
+                    best = (score, fx, fy)
+        if best is None:
+            return None
+        _, x, y = best
+        self._split(x, y, w, h)
+        return x, y
+
+    def _split(self, x, y, w, h):
+        result = []
+        for fx, fy, fw, fh in self.free:
+            if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+                result.append((fx, fy, fw, fh))
+                continue
+            if x > fx:
+                result.append((fx, fy, x - fx, fh))
+            if x + w < fx + fw:
+                result.append((x + w, fy, fx + fw - x - w, fh))
+            if y > fy:
+                result.append((fx, fy, fw, y - fy))
+            if y + h < fy + fh:
+                result.append((fx, y + h, fw, fy + fh - y - h))
+        # Drop free rects contained in another one
+        result = sorted(set(result))
+        self.free = [
+            r for r in result
+            if not any(o != r and o[0] <= r[0] and o[1] <= r[1] and
+                       o[0] + o[2] >= r[0] + r[2] and o[1] + o[3] >= r[1] + r[3] for o in result)
+        ]
+
+
+def pack(sizes, max_sheet_size):
+    """Assign (sheet, x, y) to each (name, w, h), largest first. Raises ValueError if one cannot fit."""
+    order = sorted(sizes, key=lambda s: (-max(s[1], s[2]), -s[1] * s[2], s[0]))
+    sheets = []
+    placements = {}
+    for name, w, h in order:
+        if w > max_sheet_size or h > max_sheet_size:
+            raise ValueError(f"{name} ({w}x{h}) does not fit in a {max_sheet_size}px sheet")
+        for index, sheet in enumerate(sheets):
+            position = sheet.insert(w, h)
+            if position:
+                break
+        else:
+            sheets.append(MaxRects(max_sheet_size, max_sheet_size))
+            index = len(sheets) - 1
+            position = sheets[index].insert(w, h)
+        placements[name] = (index, *position)
+    return placements, len(sheets)
+
+
+def write_if_changed(path, data):
+    """Write bytes unless the file already holds them. Returns True if written."""
+    if path.exists() and path.read_bytes() == data:
+        return False
+    path.write_bytes(data)
+    return True
+
+
+def encode_png(img):
+    buffer = BytesIO()
+    img.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def build_group(name, paths, output_dir, sprite_size, resample, max_sheet_size, padding):
+    """Pack one group. Returns the list of files written (unchanged files are left alone)."""
+    inputs = hashlib.sha256()
+    sprites = {}
+    for path in paths:
+        inputs.update(path.name.encode("utf-8") + b"\0" + path.read_bytes())
+        sprites[path.stem] = load_sprite(path, sprite_size, resample)
+
+    sizes = [(key, img.width + 2 * padding, img.height + 2 * padding) for key, (img, _, _) in sprites.items()]
+    # Pack within the limit rounded down to a multiple of 4, so the rounded-up canvas still fits it
+    placements, sheet_count = pack(sizes, max_sheet_size // 4 * 4)
+
+    # Shrink each sheet to its used area, rounded up to a multiple of 4
+    extents = [[0, 0] for _ in range(sheet_count)]
+    for key, (sheet, x, y) in placements.items():
+        img = sprites[key][0]
+        extents[sheet][0] = max(extents[sheet][0], x + img.width + 2 * padding)
+        extents[sheet][1] = max(extents[sheet][1], y + img.height + 2 * padding)
+    canvases = [np.zeros(((h + 3) // 4 * 4, (w + 3) // 4 * 4, 4), dtype=np.uint8) for w, h in extents]
+
+    frames = {}
+    for key in sorted(sprites):
+        img, (source_w, source_h), (left, top, right, bottom) = sprites[key]
+        sheet, x, y = placements[key]
+        pixels = np.pad(np.asarray(img), ((padding, padding), (padding, padding), (0, 0)), mode="edge")
+        canvases[sheet][y:y + pixels.shape[0], x:x + pixels.shape[1]] = pixels
+        frames[key] = {
+            "sheet": sheet,
+            "frame": {"x": x + padding, "y": y + padding, "w": img.width, "h": img.height},
+            "trimmed": (left, top, right, bottom) != (0, 0, source_w, source_h),
+            "spriteSourceSize": {"x": left, "y": top, "w": img.width, "h": img.height},
+            "sourceSize": {"w": source_w, "h": source_h},
+        }
+
+    written = []
+    sheets = []
+    for index, canvas in enumerate(canvases):
+        filename = f"{name}-{index}.png"
+        sheets.append({"image": filename, "size": {"w": canvas.shape[1], "h": canvas.shape[0]}})
+        if write_if_changed(output_dir / filename, encode_png(Image.fromarray(canvas, "RGBA"))):
+            written.append(filename)
+
+    # Sheets left over from a previous, larger build
+    for stale in sorted(output_dir.glob(f"{name}-*.png")):
+        if stale.name not in {sheet["image"] for sheet in sheets}:
+            stale.unlink()
+            written.append(stale.name)
+
+    frame_map = {
+        "meta": {
+            "app": "scripts/build_atlas.py",
+            "inputs_sha256": inputs.hexdigest(),
+            "sprite_size": sprite_size,
+            "padding": padding,
+        },
+        "sheets": sheets,
+        "frames": frames,
+    }
+    data = (json.dumps(frame_map, indent=2, sort_keys=True) + "\n").encode("utf-8")
+    if write_if_changed(output_dir / f"{name}.json", data):
+        written.append(f"{name}.json")
+    return written
+
+
+def write_index(output_dir):
+    """Write index.ts requiring every sheet and frame map in `output_dir`."""
+    lines = [
+        "// Generated by scripts/build_atlas.py. Do not edit.",
+        "",
+        "export const ATLAS_SHEETS: Record<string, any> = {",
+    ]
+    lines += [f"  '{p.name}': require('./{p.name}')," for p in sorted(output_dir.glob("*-*.png"))]
+    lines += ["};", "", "export const ATLAS_FRAMES: Record<string, any> = {"]
+    lines += [f"  {p.stem}: require('./{p.name}')," for p in sorted(output_dir.glob("*.json"))]
+    lines += ["};", ""]
+    return write_if_changed(output_dir / "index.ts", "\n".join(lines).encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack badge and pixel-art assets into sprite sheets")
+    parser.add_argument("--group", action="append", choices=sorted(GROUPS), help="Build only this group (repeatable)")
+    parser.add_argument(
+        "--max-sheet-size",
+        type=int,
+        default=DEFAULT_MAX_SHEET_SIZE,
+        help=f"Maximum sheet width and height in pixels (default: {DEFAULT_MAX_SHEET_SIZE})"
+    )
+    parser.add_argument("--sprite-size", type=int, help="Longest side of each sprite (default: per group, 256)")
+    parser.add_argument(
+        "--padding",
+        type=int,
+        default=DEFAULT_PADDING,
+        help=f"Extruded border around each sprite in pixels (default: {DEFAULT_PADDING})"
+    )
+    parser.add_argument("--clean", action="store_true", help="Run the incremental asset pipeline first")
+    parser.add_argument("--output-dir", default=str(DEFAULT_OUTPUT_DIR), help="Output directory (default: assets/atlases)")
+    args = parser.parse_args()
+    if args.padding < 0 or (args.sprite_size is not None and args.sprite_size < 1):
+        parser.error("--padding cannot be negative and --sprite-size must be at least 1")
+    if args.max_sheet_size < 4:
+        parser.error("--max-sheet-size must be at least 4")
+
+    if args.clean:
+        import asset_pipeline
+        asset_pipeline.run_pipeline()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    for name in args.group or list(GROUPS):
+        pattern, sprite_size, resample = GROUPS[name]
+        paths = sorted(ASSETS_DIR.glob(pattern))
+        if not paths:
+            print(f"{name}: no assets match {pattern}")
+            continue
+        try:
+            written = build_group(name, paths, output_dir, args.sprite_size or sprite_size, resample,
+                                  args.max_sheet_size, args.padding)
+        except ValueError as e:
+            print(f"{name}: {e}")
+            sys.exit(1)
+        status = ", ".join(written) if written else "unchanged"
+        print(f"{name}: {len(paths)} sprites ({status})")
+
+    if write_index(output_dir):
+        print("index.ts updated")
+
+
+if __name__ == "__main__":
+    main()
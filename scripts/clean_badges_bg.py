@@ -1,34 +1,85 @@
+import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 from PIL import Image
 
-def remove_white_bg(directory):
+DEFAULT_THRESHOLD = 245
+TRANSPARENT_WHITE = (255, 255, 255, 0)
+
+
+def clean_file(filepath, threshold=DEFAULT_THRESHOLD, dry_run=False):
+    """Make near-white pixels of one PNG transparent. Returns the number of pixels changed.
+
+    A pixel is background when R, G and B are all above `threshold`. Files
+    with nothing to change are left untouched, whatever their mode.
+    """
+    with Image.open(filepath) as img:
+        img = img.convert("RGBA")
+        pixels = np.array(img)
+
+        # Pure white background removal (Safe version)
+        mask = (pixels[..., :3] > threshold).all(axis=2)
+        changed = int((mask & (pixels != TRANSPARENT_WHITE).any(axis=2)).sum())
+        if dry_run or changed == 0:
+            return changed
+
+        pixels[mask] = TRANSPARENT_WHITE
+        img.frombytes(pixels.tobytes())
+        img.save(filepath, "PNG")
+    return changed
+
+
+def remove_white_bg(directory, threshold=DEFAULT_THRESHOLD, dry_run=False, workers=None):
+    """Clean every PNG in `directory`, across `workers` processes (1 runs in-process)."""
     if not os.path.exists(directory):
         print(f"Directory not found: {directory}")
         return
 
-    for filename in os.listdir(directory):
-        if filename.endswith(".png"):
-            filepath = os.path.join(directory, filename)
-            
-            with Image.open(filepath) as img:
-                img = img.convert("RGBA")
-                datas = img.getdata()
-
-                newData = []
-                for item in datas:
-                    # Pure white background removal (Safe version)
-                    if item[0] > 245 and item[1] > 245 and item[2] > 245:
-                        newData.append((255, 255, 255, 0))
-                    else:
-                        newData.append(item)
-
-                img.putdata(newData)
-                img.save(filepath, "PNG")
-                print(f"Cleaned: {filename}")
+    filenames = sorted(filename for filename in os.listdir(directory) if filename.endswith(".png"))
+    filepaths = [os.path.join(directory, filename) for filename in filenames]
+    args = ([threshold] * len(filepaths), [dry_run] * len(filepaths))
+
+    if workers == 1 or len(filepaths) <= 1:
+        results = map(clean_file, filepaths, *args)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(clean_file, filepaths, *args)
+
+    try:
+        for filename, changed in zip(filenames, results):
+            if dry_run:
+                print(f"Would clean: {filename} ({changed} pixels)")
+            elif changed == 0:
+                print(f"Already clean: {filename}")
+            else:
+                print(f"Cleaned: {filename} ({changed} pixels)")
+    finally:
+        if pool:
+            pool.shutdown()
+
 
 if __name__ == "__main__":
     script_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(script_dir)
     badges_dir = os.path.join(project_root, "assets", "badges")
-    
-    remove_white_bg(badges_dir)
+
+    parser = argparse.ArgumentParser(description="Make the white background of badge PNGs transparent")
+    parser.add_argument("directory", nargs="?", default=badges_dir, help="Directory of PNGs (default: assets/badges)")
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        default=DEFAULT_THRESHOLD,
+        help=f"Pixels with R, G and B all above this are background (default: {DEFAULT_THRESHOLD})"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Report pixels that would change, write nothing")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+    if not 0 <= args.threshold <= 255:
+        parser.error("--threshold must be between 0 and 255")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    remove_white_bg(args.directory, args.threshold, args.dry_run, args.workers)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Lossless size optimisation for PNG assets.
+
+Images with at most 256 distinct RGBA colours are written as indexed PNGs
+with an exact palette and per-entry alpha (tRNS), at the smallest bit depth
+that holds the palette. Every image is also tried as RGBA with zlib
+optimisation. Each candidate is decoded again and must match the original
+RGBA pixels exactly; the smallest one is kept, and only if it beats the
+file on disk.
+
+Usage:
+    python png_optimize.py [<file or directory> ...] [--dry-run]
+"""
+
+import argparse
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+MAX_PALETTE_COLORS = 256
+
+
+def exact_palette(pixels):
+    """Indexed form of an (h, w, 4) array with at most 256 colours, or None.
+
+    Returns (indices, palette, alphas). Translucent colours come first so
+    the tRNS chunk can stop at the last one.
+    """
+    packed = pixels.view(np.uint32).reshape(pixels.shape[:2])
+    colors, inverse, counts = np.unique(packed, return_inverse=True, return_counts=True)
+    if len(colors) > MAX_PALETTE_COLORS:
+        return None
+
+    rgba = colors.view(np.uint8).reshape(-1, 4)
+    # Translucent first, then most frequent, ties by colour value: deterministic
+    order = np.lexsort((colors, -counts, rgba[:, 3] == 255))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    indices = rank[inverse].reshape(packed.shape).astype(np.uint8)
+    return indices, rgba[order, :3], rgba[order, 3]
+
+
+def encode_candidates(img):
+    """Yield (label, PNG bytes) for each lossless encoding of an RGBA image."""
+    for options in ({"optimize": True}, {"compress_level": 9}):
+        buffer = BytesIO()
+        img.save(buffer, "PNG", **options)
+        yield "rgba", buffer.getvalue()
+
+    indexed = exact_palette(np.array(img))
+    if indexed is None:
+        return
+    indices, palette, alphas = indexed
+    paletted = Image.fromarray(indices, "P")
+    paletted.putpalette(palette.tobytes())
+    transparency = alphas.tobytes().rstrip(b"\xff")
+    # Pillow picks the bit depth (1, 2, 4 or 8) from the palette length
+    for options in ({"optimize": True}, {"compress_level": 9}):
+        buffer = BytesIO()
+        save_options = dict(options)
+        if transparency:
+            save_options["transparency"] = transparency
+        paletted.save(buffer, "PNG", **save_options)
+        yield f"indexed {len(palette)} colours", buffer.getvalue()
+
+
+def decodes_identical(data, pixels):
+    with Image.open(BytesIO(data)) as decoded:
+        return np.array_equal(np.array(decoded.convert("RGBA")), pixels)
+
+
+def optimize_png(path, dry_run=False):
+    """Rewrite `path` with its smallest verified lossless encoding.
+
+    Returns (bytes before, bytes after, label of the encoding kept); the
+    label is "unchanged" if nothing beat the current file.
+    """
+    before = os.path.getsize(path)
+    with Image.open(path) as img:
+        img = img.convert("RGBA")
+    pixels = np.array(img)
+
+    best = None
+    for label, data in encode_candidates(img):
+        if (best is None or len(data) < len(best[1])) and decodes_identical(data, pixels):
+            best = (label, data)
+
+    if best is None or len(best[1]) >= before:
+        return before, before, "unchanged"
+    if not dry_run:
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(best[1])
+        os.replace(tmp, path)
+    return before, len(best[1]), best[0]
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    assets_dir = os.path.join(os.path.dirname(script_dir), "assets")
+
+    parser = argparse.ArgumentParser(description="Losslessly shrink PNGs, using indexed colour where it fits")
+    parser.add_argument("paths", nargs="*", help="PNG files or directories (default: assets/pixel-*.png)")
+    parser.add_argument("--dry-run", action="store_true", help="Report savings without writing")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".png"))
+        else:
+            files.append(path)
+    if not args.paths:
+        files = sorted(
+            os.path.join(assets_dir, f) for f in os.listdir(assets_dir)
+            if f.startswith("pixel-") and f.endswith(".png")
+        )
+
+    total_before = total_after = 0
+    for filepath in files:
+        if not os.path.exists(filepath):
+            print(f"File not found: {filepath}")
+            continue
+        before, after, label = optimize_png(filepath, args.dry_run)
+        total_before += before
+        total_after += after
+        print(f"{os.path.basename(filepath)}: {before / 1024:.1f} KB -> {after / 1024:.1f} KB "
+              f"({(before - after) / 1024:.1f} KB saved, {label})")
+
+    if not files:
+        print("No files to process")
+        sys.exit(1)
+    saved = total_before - total_after
+    print(f"\nTotal: {total_before / 1024:.1f} KB -> {total_after / 1024:.1f} KB "
+          f"({saved / 1024:.1f} KB saved, {saved / max(total_before, 1):.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Columnar export of machines.json, read back through a memory map.
+
+machines.json is one pretty-printed document with nested `location` and
+`images`, so anything that only wants to count or filter machines has to
+parse all of it. `machines.col` holds the same machines column by column in
+flat, 8-byte aligned little-endian arrays:
+
+    b"JNCOL001"                  magic
+    uint64                       header length
+    header                       JSON, padded to 8 bytes: row count, scraped_at,
+                                 source, and every column's type and buffers
+    buffers                      one after another, each 8-byte aligned
+
+Column types, with their buffers (offsets are int64, one more than items):
+
+    float64      values (NaN for null)
+    string       offsets, data (UTF-8), valid (uint8, only if any value is null)
+    string_list  list_offsets (per row into the items), offsets, data
+    json         like string, one JSON document per row
+
+`ColumnarFile` maps the file read-only and turns each buffer into a NumPy
+view without copying, so opening a snapshot costs the header and nothing
+else, and only the pages of the columns a query touches are ever read.
+Filters by source_id, category and bounding box run over whole columns:
+
+    with ColumnarFile("../output/machines.col") as machines:
+        rows = machines.select(["source_id", "name"], category="麺類",
+                               bbox=(35.5, 139.5, 35.9, 139.9))
+
+Usage:
+    python columnar.py export [../output/machines.json] [--output <path>]
+    python columnar.py query [../output/machines.col] [--columns a,b] [--source-id ID ...]
+        [--category NAME] [--bbox MIN_LAT MIN_LNG MAX_LAT MAX_LNG] [--limit N]
+"""
+
+import argparse
+import json
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+COLUMNAR_NAME = "machines.col"
+MAGIC = b"JNCOL001"
+ALIGNMENT = 8
+
+
+def _location(record: dict) -> dict:
+    return record.get("location") or {}
+
+
+# (name, type, value of a machine record), in file order
+COLUMNS = (
+    ("source_id", "string", lambda r: r["source_id"]),
+    ("source_url", "string", lambda r: r.get("source_url")),
+    ("name", "string", lambda r: r.get("name")),
+    ("address", "string", lambda r: _location(r).get("address")),
+    ("latitude", "float64", lambda r: _location(r).get("latitude")),
+    ("longitude", "float64", lambda r: _location(r).get("longitude")),
+    ("prefecture", "string", lambda r: _location(r).get("prefecture")),
+    ("merchandise", "string_list", lambda r: r.get("merchandise") or []),
+    ("categories", "string_list", lambda r: r.get("categories") or []),
+    ("features", "string_list", lambda r: r.get("features") or []),
+    ("images", "json", lambda r: r.get("images") or []),
+)
+
+
+def _encode_strings(values: list[Optional[str]]) -> dict[str, np.ndarray]:
+    encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    buffers = {"offsets": offsets, "data": np.frombuffer(b"".join(encoded), dtype=np.uint8)}
+    if any(value is None for value in values):
+        buffers["valid"] = np.array([value is not None for value in values], dtype=np.uint8)
+    return buffers
+
+
+def _encode_column(kind: str, values: list) -> dict[str, np.ndarray]:
+    if kind == "float64":
+        return {"values": np.array([np.nan if v is None else float(v) for v in values], dtype="<f8")}
+    if kind == "string":
+        return _encode_strings(values)
+    if kind == "json":
+        return _encode_strings([json.dumps(v, ensure_ascii=False, separators=(",", ":")) for v in values])
+    list_offsets = np.zeros(len(values) + 1, dtype="<i8")
+    np.cumsum([len(items) for items in values], out=list_offsets[1:])
+    buffers = _encode_strings([item for items in values for item in items])
+    buffers.pop("valid", None)  # list items are never null
+    return {"list_offsets": list_offsets, **buffers}
+
+
+def write_columnar(json_path: str, columnar_path: Optional[str] = None) -> dict:
+    """Write the columnar export of machines.json (COLUMNAR_NAME next to it by
+    default). Returns the row count, both file sizes and the output path."""
+    columnar_path = columnar_path or str(Path(json_path).parent / COLUMNAR_NAME)
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    records = data.get("machines", [])
+
+    columns, buffers, position = [], [], 0
+    for name, kind, value in COLUMNS:
+        specs = {}
+        for buffer_name, array in _encode_column(kind, [value(record) for record in records]).items():
+            specs[buffer_name] = {"offset": position, "length": len(array), "dtype": array.dtype.str}
+            buffers.append(array)
+            position += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        columns.append({"name": name, "type": kind, "buffers": specs})
+    header = json.dumps({
+        "rows": len(records),
+        "scraped_at": data.get("scraped_at"),
+        "source": data.get("source"),
+        "columns": columns,
+    }, ensure_ascii=False).encode("utf-8")
+    header += b" " * (-len(header) % ALIGNMENT)
+
+    tmp_path = f"{columnar_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for array in buffers:
+            f.write(array.tobytes())
+            f.write(b"\0" * (-array.nbytes % ALIGNMENT))
+    os.replace(tmp_path, columnar_path)
+    return {
+        "rows": len(records),
+        "json_bytes": os.path.getsize(json_path),
+        "columnar_bytes": os.path.getsize(columnar_path),
+        "columnar_path": columnar_path,
+    }
+
+
+class ColumnarFile:
+    """Read-only, memory-mapped view of a columnar export."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+        if self._data[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError(f"{path} is not a columnar machines export")
+        (header_length,) = struct.unpack("<Q", self._data[len(MAGIC):len(MAGIC) + 8].tobytes())
+        start = len(MAGIC) + 8
+        header = json.loads(self._data[start:start + header_length].tobytes())
+        self._base = start + header_length
+        self.rows: int = header["rows"]
+        self.scraped_at: Optional[str] = header["scraped_at"]
+        self.source: Optional[str] = header["source"]
+        self._columns = {column["name"]: column for column in header["columns"]}
+        self._fixed_width: dict[str, np.ndarray] = {}
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._columns)
+
+    def close(self) -> None:
+        # The map is released once no column view refers to it any more
+        self._data = None
+        self._fixed_width.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _buffer(self, column: str, name: str) -> Optional[np.ndarray]:
+        spec = self._columns[column]["buffers"].get(name)
+        if spec is None:
+            return None
+        dtype = np.dtype(spec["dtype"])
+        start = self._base + spec["offset"]
+        return self._data[start:start + spec["length"] * dtype.itemsize].view(dtype)
+
+    def _strings(self, column: str, indexes: Iterable[int]) -> list[Optional[str]]:
+        offsets, data, valid = (self._buffer(column, name) for name in ("offsets", "data", "valid"))
+        indexes = np.fromiter(indexes, dtype=np.int64)
+        text = memoryview(data)
+        strings = [str(text[start:end], "utf-8") for start, end in zip(offsets[indexes].tolist(),
+                                                                        offsets[indexes + 1].tolist())]
+        if valid is not None:
+            strings = [value if present else None for value, present in zip(strings, valid[indexes].tolist())]
+        return strings
+
+    def _items_fixed_width(self, column: str) -> np.ndarray:
+        """Every string of a column as a fixed-width bytes array, for comparing
+        them all at once. Built once per column."""
+        if column not in self._fixed_width:
+            offsets, data = self._buffer(column, "offsets"), self._buffer(column, "data")
+            lengths = np.diff(offsets)
+            width = max(int(lengths.max()) if len(lengths) else 0, 1)
+            positions = np.minimum(offsets[:-1, np.newaxis] + np.arange(width), max(len(data) - 1, 0))
+            padded = data[positions] if len(data) else np.zeros(positions.shape, dtype=np.uint8)
+            padded = np.where(np.arange(width) < lengths[:, np.newaxis], padded, 0).astype(np.uint8)
+            self._fixed_width[column] = padded.view(f"S{width}").ravel()
+        return self._fixed_width[column]
+
+    def _matches(self, column: str, values: Iterable[str]) -> np.ndarray:
+        """Which strings of a column equal one of `values`."""
+        items = self._items_fixed_width(column)
+        width = items.dtype.itemsize
+        wanted = [value.encode("utf-8") for value in values]
+        wanted = np.array([value for value in wanted if 0 < len(value) <= width], dtype=f"S{width}")
+        return np.isin(items, wanted)
+
+    def column(self, name: str, rows: Optional[np.ndarray] = None):
+        """Values of one column, for all rows or for the given row indexes.
+        float64 columns come back as a NumPy array (a view of the file when no
+        rows are given), the others as lists."""
+        kind = self._columns[name]["type"]
+        if kind == "float64":
+            values = self._buffer(name, "values")
+            return values if rows is None else values[rows]
+        indexes = range(self.rows) if rows is None else rows
+        if kind == "string":
+            return self._strings(name, indexes)
+        if kind == "json":
+            return [json.loads(value) for value in self._strings(name, indexes)]
+        list_offsets = self._buffer(name, "list_offsets")
+        bounds = [(int(list_offsets[i]), int(list_offsets[i + 1])) for i in indexes]
+        items = self._strings(name, (j for start, end in bounds for j in range(start, end)))
+        lists, position = [], 0
+        for start, end in bounds:
+            lists.append(items[position:position + end - start])
+            position += end - start
+        return lists
+
+    def mask(self, source_ids: Optional[Iterable[str]] = None, category: Optional[str] = None,
+             bbox: Optional[tuple[float, float, float, float]] = None) -> np.ndarray:
+        """Boolean row mask for the given filters, all of which must hold.
+        `bbox` is (min latitude, min longitude, max latitude, max longitude);
+        machines without coordinates are outside every box."""
+        keep = np.ones(self.rows, dtype=bool)
+        if source_ids is not None:
+            keep &= self._matches("source_id", source_ids)
+        if category is not None:
+            list_offsets = self._buffer("categories", "list_offsets")
+            hits = np.flatnonzero(self._matches("categories", [category]))
+            in_category = np.zeros(self.rows, dtype=bool)
+            in_category[np.searchsorted(list_offsets, hits, side="right") - 1] = True
+            keep &= in_category
+        if bbox is not None:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            lat, lng = self._buffer("latitude", "values"), self._buffer("longitude", "values")
+            keep &= (lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)
+        return keep
+
+    def select(self, columns: Optional[list[str]] = None, limit: Optional[int] = None, **filters) -> dict:
+        """The given columns (all by default) of the rows matching `filters`
+        (see `mask`), at most `limit` of them, as {column: values}."""
+        for name in columns or []:
+            if name not in self._columns:
+                raise KeyError(f"no column {name!r}; columns are {', '.join(self._columns)}")
+        rows = np.flatnonzero(self.mask(**filters))[:limit]
+        return {name: self.column(name, rows) for name in (columns or self.columns)}
+
+    def records(self, columns: Optional[list[str]] = None, limit: Optional[int] = None,
+                **filters) -> Iterator[dict]:
+        """Matching rows one dict at a time, with the selected columns as keys
+        and None for a missing coordinate."""
+        selected = self.select(columns, limit, **filters)
+        names = list(selected)
+        values = [
+            [None if np.isnan(v) else v for v in selected[name].tolist()]
+            if isinstance(selected[name], np.ndarray) else selected[name]
+            for name in names
+        ]
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    output_dir = script_dir.parent / "output"
+
+    parser = argparse.ArgumentParser(description="Write or query the columnar export of machines.json")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write machines.col from machines.json")
+    export.add_argument(
+        "machines_file",
+        nargs="?",
+        default=str(output_dir / "machines.json"),
+        help="machines.json to export (default: ../output/machines.json)"
+    )
+    export.add_argument("--output", help=f"Columnar file to write (default: {COLUMNAR_NAME} next to machines.json)")
+    query = commands.add_parser("query", help="Print matching machines as JSON lines")
+    query.add_argument(
+        "columnar_file",
+        nargs="?",
+        default=str(output_dir / COLUMNAR_NAME),
+        help=f"Columnar export to read (default: ../output/{COLUMNAR_NAME})"
+    )
+    query.add_argument("--columns", help="Comma-separated columns to print (default: all)")
+    query.add_argument("--source-id", nargs="+", help="Only these machines")
+    query.add_argument("--category", help="Only machines in this category")
+    query.add_argument("--bbox", nargs=4, type=float, metavar=("MIN_LAT", "MIN_LNG", "MAX_LAT", "MAX_LNG"),
+                       help="Only machines inside this box")
+    query.add_argument("--limit", type=int, help="Print at most this many machines")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "export":
+        summary = write_columnar(args.machines_file, args.output)
+        print(f"Exported {summary['rows']} machines in {time.perf_counter() - started:.2f}s: "
+              f"{summary['json_bytes'] / 1e6:.1f} MB JSON -> {summary['columnar_bytes'] / 1e6:.1f} MB "
+              f"at {summary['columnar_path']}")
+        return
+
+    with ColumnarFile(args.columnar_file) as machines:
+        columns = args.columns.split(",") if args.columns else None
+        filters = {
+            "source_ids": args.source_id,
+            "category": args.category,
+            "bbox": tuple(args.bbox) if args.bbox else None,
+        }
+        for record in machines.records(columns, args.limit, **filters):
+            print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
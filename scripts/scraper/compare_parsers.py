@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Check that the lxml extractor produces the same records as the BeautifulSoup
+parser, and compare their speed.
+
+Runs both parsers over the fixture corpus (fixtures/pages/<source_id>.html)
+and, optionally, every HTML page in a scraper HTTP cache. Exits non-zero if
+any record differs.
+
+Usage:
+    python compare_parsers.py [--fixtures <dir>] [--cache-dir <dir>] [--repeat N]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+from http_cache import HttpCache
+from jihanki_scraper import PARSERS, cached_response, extract_machine_id
+
+DEFAULT_FIXTURES_DIR = Path(__file__).parent / "fixtures" / "pages"
+FIXTURE_URL = "https://jihanki.sagase.com/jihanki/{}/"
+
+
+def iter_fixture_pages(fixtures_dir: Path) -> Iterator[tuple[str, str, str]]:
+    """Yield (url, machine_id, html) for every <source_id>.html fixture."""
+    for path in sorted(fixtures_dir.glob("*.html")):
+        machine_id = path.stem
+        yield FIXTURE_URL.format(machine_id), machine_id, path.read_text(encoding="utf-8")
+
+
+def iter_cached_pages(cache_dir: str) -> Iterator[tuple[str, str, str]]:
+    """Yield (url, machine_id, html) for every cached machine page."""
+    cache = HttpCache(cache_dir, offline=True)
+    try:
+        for url in cache.urls("text/html"):
+            machine_id = extract_machine_id(url)
+            entry = cache.get(url)
+            if machine_id and entry:
+                yield url, machine_id, cached_response(url, *entry).text
+    finally:
+        cache.close()
+
+
+def diff_records(a: dict, b: dict, prefix: str = "") -> list[str]:
+    """Paths where two records differ, e.g. ['location.latitude']."""
+    diffs = []
+    for key in sorted(set(a) | set(b)):
+        path = f"{prefix}{key}"
+        if isinstance(a.get(key), dict) and isinstance(b.get(key), dict):
+            diffs.extend(diff_records(a[key], b[key], f"{path}."))
+        elif a.get(key) != b.get(key):
+            diffs.append(path)
+    return diffs
+
+
+def time_parser(parse, pages: list[tuple[str, str, str]], repeat: int) -> float:
+    """Seconds per page for `parse` over `pages`."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for url, machine_id, html in pages:
+            parse(html, url, machine_id)
+    return (time.perf_counter() - started) / (repeat * len(pages))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Verify the lxml page parser against the BeautifulSoup parser"
+    )
+    parser.add_argument(
+        "--fixtures",
+        default=str(DEFAULT_FIXTURES_DIR),
+        help="Directory of <source_id>.html fixture pages (default: fixtures/pages)"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Also compare every HTML page in this scraper HTTP cache"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=20,
+        help="Timing passes over the corpus (default: 20)"
+    )
+    args = parser.parse_args()
+
+    pages = list(iter_fixture_pages(Path(args.fixtures)))
+    if args.cache_dir:
+        pages.extend(iter_cached_pages(args.cache_dir))
+    if not pages:
+        print("No pages to compare.")
+        sys.exit(1)
+
+    soup_parse, lxml_parse = PARSERS["soup"], PARSERS["lxml"]
+    mismatches = 0
+    for url, machine_id, html in pages:
+        diffs = diff_records(soup_parse(html, url, machine_id), lxml_parse(html, url, machine_id))
+        if diffs:
+            mismatches += 1
+            print(f"  MISMATCH {url}: {', '.join(diffs)}")
+
+    print(f"Compared {len(pages)} pages: {mismatches} mismatches")
+
+    soup_time = time_parser(soup_parse, pages, args.repeat)
+    lxml_time = time_parser(lxml_parse, pages, args.repeat)
+    print(f"soup: {soup_time * 1000:.2f} ms/page ({1 / soup_time:.0f} pages/s)")
+    print(f"lxml: {lxml_time * 1000:.2f} ms/page ({1 / lxml_time:.0f} pages/s)")
+    print(f"Speedup: {soup_time / lxml_time:.1f}x")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Delta export of machines.json against the previous export.
+
+Every machine gets a fingerprint: the SHA-256 of its normalised content
+fields (name, address, coordinates, merchandise, categories, features) and
+its images, identified by the SHA-256 of their bodies. An image whose
+download failed this time is identified by the hash the image store already
+holds for its URL, so a transient failure does not change a fingerprint;
+local paths and image processing details are left out for the same reason.
+
+Limitations: a new body can only be seen when it is downloaded, and the
+image store never fetches a URL it already holds, so a picture re-uploaded
+under the same URL is detected only after its URL leaves the store (or in a
+run without one). An image that never downloaded and is not in any store is
+identified by its URL.
+
+The fingerprints of the last acknowledged export are kept in a snapshot
+file next to machines.json. Each export is diffed against it into
+`machines.delta.json`:
+
+    {
+      "scraped_at": "...", "previous_scraped_at": "...", "source": "...",
+      "added": [{"fingerprint": "...", "machine": {...}}],
+      "changed": [{"fingerprint": "...", "previous_fingerprint": "...", "machine": {...}}],
+      "removed": ["<source_id>", ...],
+      "unchanged": 1234
+    }
+
+so an upload only has to touch what changed. A partial export (a frontier
+run with --limit, say) never reports removals: machines it did not cover
+keep their fingerprints in the snapshot.
+
+Writing a delta does not move the snapshot. The fingerprints it would move
+to are kept in `machines.fingerprints.pending.json` until the delta is
+acknowledged as uploaded (`--ack`, or seed-machines.ts --delta after an
+upload without errors). Until then every new delta, offline replays and
+test runs included, is diffed against the last acknowledged export, so a
+delta that was never uploaded is folded into the next one, not lost.
+
+Usage:
+    python delta_export.py [../output/machines.json] [--snapshot <path>] [--output <path>] [--partial]
+                           [--image-store <dir>]
+    python delta_export.py --ack [../output/machines.json] [--snapshot <path>]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from image_store import INDEX_NAME, ImageStore
+
+DELTA_NAME = "machines.delta.json"
+SNAPSHOT_NAME = "machines.fingerprints.json"
+PENDING_NAME = "machines.fingerprints.pending.json"
+COORDINATE_DECIMALS = 6  # about 0.1 m; finer differences are float noise
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def _normalise_text(value: Optional[str]) -> Optional[str]:
+    """NFKC-normalised text with whitespace collapsed, so full-width and
+    half-width spellings of the same name compare equal."""
+    if value is None:
+        return None
+    text = WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFKC", value)).strip()
+    return text or None
+
+
+def _normalise_coordinate(value) -> Optional[float]:
+    return None if value is None else round(float(value), COORDINATE_DECIMALS)
+
+
+def _image_identity(image: dict, image_hashes: Optional[Callable[[str], Optional[str]]]) -> Optional[str]:
+    if image.get("sha256"):
+        return image["sha256"]
+    url = image.get("url")
+    known = image_hashes(url) if image_hashes and url else None
+    return known or url or image.get("local_path")
+
+
+def fingerprint(record: dict, image_hashes: Optional[Callable[[str], Optional[str]]] = None) -> str:
+    """Stable hash of a machine record's content. `image_hashes` maps an image
+    URL to the SHA-256 last stored for it, for images without a `sha256`."""
+    location = record.get("location") or {}
+    images = [_image_identity(image, image_hashes) for image in record.get("images", [])]
+    content = {
+        "name": _normalise_text(record.get("name")),
+        "address": _normalise_text(location.get("address")),
+        "latitude": _normalise_coordinate(location.get("latitude")),
+        "longitude": _normalise_coordinate(location.get("longitude")),
+        # Merchandise and categories are sets; features are joined into the
+        # description in order, and the first image is the primary one
+        "merchandise": sorted({_normalise_text(item) for item in record.get("merchandise", [])} - {None}),
+        "categories": sorted({_normalise_text(item) for item in record.get("categories", [])} - {None}),
+        "features": [_normalise_text(item) for item in record.get("features", [])],
+        "images": images,
+    }
+    encoded = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def load_snapshot(path: str) -> dict:
+    """The previous export's fingerprints, or an empty snapshot."""
+    if not os.path.exists(path):
+        return {"scraped_at": None, "fingerprints": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(data: dict, path: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _pending_path(snapshot_path: str) -> str:
+    return str(Path(snapshot_path).with_name(PENDING_NAME))
+
+
+def _stored_hashes(stores: list[ImageStore]) -> Callable[[str], Optional[str]]:
+    def lookup(url: str) -> Optional[str]:
+        return next((digest for store in stores if (digest := store.lookup(url))), None)
+    return lookup
+
+
+def write_delta(json_path: str, snapshot_path: Optional[str] = None,
+                delta_path: Optional[str] = None, partial: bool = False,
+                image_store_dirs: Iterable[str] = ()) -> dict:
+    """Diff machines.json against the acknowledged snapshot, write the delta
+    and the fingerprints to acknowledge with it. Returns the added, changed,
+    removed and unchanged counts, and whether an unacknowledged delta was
+    superseded.
+
+    `snapshot_path` and `delta_path` default to SNAPSHOT_NAME and DELTA_NAME
+    next to `json_path`. With `partial`, machines missing from machines.json
+    are not reported as removed. Images that failed to download are looked up
+    in the image stores at `image_store_dirs` (those that exist).
+    """
+    output_dir = Path(json_path).parent
+    snapshot_path = snapshot_path or str(output_dir / SNAPSHOT_NAME)
+    delta_path = delta_path or str(output_dir / DELTA_NAME)
+    pending_path = _pending_path(snapshot_path)
+    superseded = os.path.exists(pending_path)
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    snapshot = load_snapshot(snapshot_path)
+    previous = snapshot["fingerprints"]
+
+    stores = [ImageStore(path) for path in image_store_dirs if (Path(path) / INDEX_NAME).exists()]
+    image_hashes = _stored_hashes(stores)
+    added, changed = [], []
+    current = {}
+    try:
+        for record in data.get("machines", []):
+            source_id = record["source_id"]
+            digest = fingerprint(record, image_hashes)
+            current[source_id] = digest
+            if source_id not in previous:
+                added.append({"fingerprint": digest, "machine": record})
+            elif previous[source_id] != digest:
+                changed.append({"fingerprint": digest, "previous_fingerprint": previous[source_id], "machine": record})
+    finally:
+        for store in stores:
+            store.close()
+
+    # A machine that failed to scrape this time has not gone away (error URLs end in /<id>/)
+    failed_ids = {error["url"].rstrip("/").rsplit("/", 1)[-1] for error in data.get("errors", [])}
+    removed = [] if partial else sorted(
+        (source_id for source_id in previous if source_id not in current and source_id not in failed_ids),
+        key=lambda source_id: (len(source_id), source_id),
+    )
+
+    _write_json({
+        "scraped_at": data.get("scraped_at"),
+        "previous_scraped_at": snapshot.get("scraped_at"),
+        "source": data.get("source"),
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "unchanged": len(current) - len(added) - len(changed),
+    }, delta_path)
+
+    removed_ids = set(removed)
+    fingerprints = {source_id: digest for source_id, digest in previous.items() if source_id not in removed_ids}
+    fingerprints.update(current)
+    _write_json({"scraped_at": data.get("scraped_at"), "fingerprints": fingerprints}, pending_path)
+
+    return {
+        "added": len(added),
+        "changed": len(changed),
+        "removed": len(removed),
+        "unchanged": len(current) - len(added) - len(changed),
+        "delta_path": delta_path,
+        "superseded": superseded,
+    }
+
+
+def acknowledge_delta(json_path: str, snapshot_path: Optional[str] = None) -> Optional[str]:
+    """Mark the last delta written next to `json_path` as uploaded: its
+    fingerprints become the snapshot the next delta is diffed against.
+    Returns the acknowledged export's scraped_at, or None if there was no
+    delta waiting."""
+    snapshot_path = snapshot_path or str(Path(json_path).parent / SNAPSHOT_NAME)
+    pending_path = _pending_path(snapshot_path)
+    if not os.path.exists(pending_path):
+        return None
+    scraped_at = load_snapshot(pending_path).get("scraped_at")
+    os.replace(pending_path, snapshot_path)
+    return scraped_at
+
+
+def delta_summary(counts: dict) -> str:
+    """One-line report of `write_delta`'s counts."""
+    line = (f"Delta: {counts['added']} added, {counts['changed']} changed, {counts['removed']} removed, "
+            f"{counts['unchanged']} unchanged -> {counts['delta_path']}")
+    if counts["superseded"]:
+        line += ("\n  (the previous delta was never acknowledged; this one is diffed against the last "
+                 "acknowledged export and covers its changes too)")
+    return line
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    output_dir = script_dir.parent / "output"
+
+    parser = argparse.ArgumentParser(description="Diff machines.json against the previous export")
+    parser.add_argument(
+        "machines_file",
+        nargs="?",
+        default=str(output_dir / "machines.json"),
+        help="machines.json to export (default: ../output/machines.json)"
+    )
+    parser.add_argument(
+        "--snapshot",
+        help=f"Fingerprints of the previous export (default: {SNAPSHOT_NAME} next to machines.json)"
+    )
+    parser.add_argument("--output", help=f"Delta file to write (default: {DELTA_NAME} next to machines.json)")
+    parser.add_argument(
+        "--partial",
+        action="store_true",
+        help="machines.json covers only some machines: do not report the others as removed"
+    )
+    parser.add_argument(
+        "--image-store",
+        help="Image store to look up images that failed to download (default: image_store next to machines.json)"
+    )
+    parser.add_argument(
+        "--ack",
+        action="store_true",
+        help="Acknowledge the last delta as uploaded instead of writing one: the next delta is diffed against it"
+    )
+    args = parser.parse_args()
+
+    if args.ack:
+        scraped_at = acknowledge_delta(args.machines_file, args.snapshot)
+        if scraped_at is None:
+            print("No unacknowledged delta")
+        else:
+            print(f"Acknowledged the delta of the export scraped at {scraped_at}")
+        return
+
+    image_store_dir = args.image_store or str(Path(args.machines_file).parent / "image_store")
+    print(delta_summary(write_delta(args.machines_file, args.snapshot, args.output, args.partial,
+                                    image_store_dirs=[image_store_dir])))
+
+
+if __name__ == "__main__":
+    main()
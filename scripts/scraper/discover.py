@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Discover machine URLs on jihanki.sagase.com into a persistent frontier.
+
+Walks the site's sitemaps (from robots.txt, falling back to the usual
+WordPress locations) and its listing pages (the /jihanki/ index, genre and
+area pages and their pagination), and records every machine page found in
+`frontier.db`, canonicalised to https://jihanki.sagase.com/jihanki/<id>/.
+IDs the scrape state has never seen are queued ahead of known ones.
+
+The scraper then takes its URLs from the frontier instead of a markdown file:
+
+    python discover.py
+    python jihanki_scraper.py --frontier ../output/frontier.db [--limit N]
+
+Usage:
+    python discover.py [--output-dir <dir>] [--frontier <path>] [--state-db <path>]
+        [--max-pages N] [--max-depth N] [--page-rate RPS] [--no-listings]
+        [--cache-dir <dir>]
+"""
+
+import argparse
+import gzip
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import urljoin, urlparse
+
+from lxml import etree, html
+
+from frontier import PRIORITY_KNOWN, PRIORITY_NEW, Frontier
+from http_cache import HttpCache
+from jihanki_scraper import (
+    DEFAULT_OUTPUT_DIR,
+    DEFAULT_PAGE_RATE,
+    STATE_DB_NAME,
+    create_session,
+    extract_machine_id,
+    fetch_response,
+)
+from state_store import StateStore
+from throttle import HostBudgets
+
+SITE = "https://jihanki.sagase.com"
+FRONTIER_NAME = "frontier.db"
+FALLBACK_SITEMAPS = ("/wp-sitemap.xml", "/sitemap.xml", "/sitemap_index.xml")
+LISTING_SEEDS = ("/jihanki/",)
+# Paths under these prefixes are listing pages worth walking for machine links
+LISTING_PREFIXES = ("/jihanki/", "/genre/", "/area/", "/page/")
+SKIPPED_PATH_PARTS = ("/wp-content/", "/wp-json/", "/wp-admin/", "/feed/", "/comments/")
+DEFAULT_MAX_PAGES = 2000
+DEFAULT_MAX_DEPTH = 50  # listing pages are mostly pagination chains, so allow long ones
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def canonical_machine_url(url: str) -> Optional[tuple[str, str]]:
+    """(source_id, canonical URL) for a machine page URL on the site, else None."""
+    parsed = urlparse(url)
+    if parsed.netloc.lower() != urlparse(SITE).netloc:
+        return None
+    machine_id = extract_machine_id(parsed.path)
+    if machine_id is None:
+        return None
+    return machine_id, f"{SITE}/jihanki/{machine_id}/"
+
+
+def canonical_page_url(url: str) -> Optional[str]:
+    """Canonical form of a same-site listing page URL (https, no query or
+    fragment, trailing slash), or None if it is not one worth crawling."""
+    parsed = urlparse(url)
+    if parsed.netloc.lower() != urlparse(SITE).netloc:
+        return None
+    path = parsed.path or "/"
+    if extract_machine_id(path) is not None:
+        return None  # a machine page, queued by canonical_machine_url
+    if any(part in path for part in SKIPPED_PATH_PARTS) or not path.startswith(LISTING_PREFIXES):
+        return None
+    if "." in path.rsplit("/", 1)[-1]:
+        return None  # a file, not a page
+    if not path.endswith("/"):
+        path += "/"
+    return f"{SITE}{path}"
+
+
+def sitemap_locations(body: bytes) -> tuple[bool, list[str]]:
+    """Parse a sitemap (optionally gzipped). Returns (is_index, <loc> URLs)."""
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    root = etree.fromstring(body, parser=etree.XMLParser(resolve_entities=False, no_network=True, recover=True))
+    if root is None:
+        return False, []
+    locations = [loc.text.strip() for loc in root.iter(f"{SITEMAP_NS}loc", "loc") if loc.text]
+    return etree.QName(root).localname == "sitemapindex", locations
+
+
+def page_links(body: bytes, base_url: str) -> Iterator[str]:
+    """Absolute href of every link in an HTML page."""
+    try:
+        document = html.fromstring(body)
+    except (etree.ParserError, ValueError):
+        return  # an empty or unparseable page has no links, and must not stop the crawl
+    for href in document.xpath("//a/@href"):
+        yield urljoin(base_url, href.strip())
+
+
+def robots_sitemaps(body: str) -> list[str]:
+    return [
+        line.split(":", 1)[1].strip()
+        for line in body.splitlines()
+        if line.lower().startswith("sitemap:") and line.split(":", 1)[1].strip()
+    ]
+
+
+def discover(frontier: Frontier, session, budgets: HostBudgets,
+             known_ids: Optional[set[str]] = None,
+             cache: Optional[HttpCache] = None,
+             max_pages: int = DEFAULT_MAX_PAGES,
+             max_depth: int = DEFAULT_MAX_DEPTH,
+             listings: bool = True) -> dict:
+    """Crawl sitemaps and listing pages into `frontier`. Returns counts.
+
+    Machines in `known_ids` are queued with PRIORITY_KNOWN, all others with
+    PRIORITY_NEW. An interrupted crawl resumes where it stopped.
+    """
+    known_ids = known_ids or set()
+    counts = {"pages": 0, "machines": 0, "new": 0}
+
+    def add_machine(url: str) -> None:
+        canonical = canonical_machine_url(url)
+        if canonical is None:
+            return
+        machine_id, machine_url = canonical
+        priority = PRIORITY_KNOWN if machine_id in known_ids else PRIORITY_NEW
+        if frontier.add_machine(machine_id, machine_url, priority):
+            counts["machines"] += 1
+            counts["new"] += priority == PRIORITY_NEW
+
+    if not frontier.start_crawl():
+        robots = fetch_response(f"{SITE}/robots.txt", session, budgets, cache=cache)
+        sitemaps = robots_sitemaps(robots.text) if robots is not None and robots.status_code == 200 else []
+        for url in sitemaps or [SITE + path for path in FALLBACK_SITEMAPS]:
+            frontier.add_page(url, "sitemap", 0)
+        if listings:
+            for path in LISTING_SEEDS:
+                frontier.add_page(SITE + path, "listing", 0)
+
+    while counts["pages"] < max_pages:
+        page = frontier.next_page()
+        if page is None:
+            break
+        url, kind, depth = page["url"], page["kind"], page["depth"]
+        counts["pages"] += 1
+        response = fetch_response(url, session, budgets, cache=cache)
+        if response is None or response.status_code != 200:
+            frontier.mark_page(url, "Failed to fetch page")
+            continue
+
+        if kind == "sitemap":
+            try:
+                is_index, locations = sitemap_locations(response.content)
+            except (OSError, etree.XMLSyntaxError) as e:
+                frontier.mark_page(url, f"Invalid sitemap: {e}")
+                continue
+            for location in locations:
+                if is_index:
+                    frontier.add_page(location, "sitemap", depth + 1)
+                else:
+                    add_machine(location)
+        else:
+            for link in page_links(response.content, url):
+                add_machine(link)
+                listing = canonical_page_url(link)
+                if listing and listings and depth < max_depth:
+                    frontier.add_page(listing, "listing", depth + 1)
+        frontier.mark_page(url)
+        print(f"  [{counts['pages']}] {kind} {url} ({counts['machines']} machines found so far)")
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Discover jihanki.sagase.com machine URLs into a frontier")
+    parser.add_argument(
+        "--output-dir", "-o",
+        default=DEFAULT_OUTPUT_DIR,
+        help=f"Output directory (default: {DEFAULT_OUTPUT_DIR})"
+    )
+    parser.add_argument("--frontier", help=f"Frontier database (default: <output-dir>/{FRONTIER_NAME})")
+    parser.add_argument(
+        "--state-db",
+        help=f"Scrape state used to put unseen IDs first (default: <output-dir>/{STATE_DB_NAME})"
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        default=DEFAULT_MAX_PAGES,
+        help=f"Stop after fetching this many sitemaps and listing pages (default: {DEFAULT_MAX_PAGES})"
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=DEFAULT_MAX_DEPTH,
+        help=f"Maximum link depth from the listing seeds (default: {DEFAULT_MAX_DEPTH})"
+    )
+    parser.add_argument(
+        "--page-rate",
+        type=float,
+        default=DEFAULT_PAGE_RATE,
+        help=f"Requests per second (default: {DEFAULT_PAGE_RATE:.2f})"
+    )
+    parser.add_argument("--no-listings", action="store_true", help="Only read sitemaps, do not walk listing pages")
+    parser.add_argument("--cache-dir", help="HTTP cache directory shared with the scraper")
+    args = parser.parse_args()
+    if args.max_pages < 1 or args.max_depth < 0:
+        parser.error("--max-pages must be at least 1 and --max-depth cannot be negative")
+    if args.page_rate <= 0:
+        parser.error("--page-rate must be positive")
+
+    script_dir = Path(__file__).parent
+    output_dir = Path(args.output_dir)
+    if not output_dir.is_absolute():
+        output_dir = script_dir / output_dir
+    frontier_path = Path(args.frontier) if args.frontier else output_dir / FRONTIER_NAME
+    state_db = Path(args.state_db) if args.state_db else output_dir / STATE_DB_NAME
+
+    known_ids = set()
+    if state_db.exists():
+        state = StateStore(str(state_db))
+        known_ids = state.source_ids()
+        state.close()
+
+    frontier = Frontier(str(frontier_path))
+    cache = HttpCache(args.cache_dir) if args.cache_dir else None
+    started = time.monotonic()
+    print(f"Frontier: {frontier_path} ({len(known_ids)} machines in scrape state)")
+    try:
+        counts = discover(
+            frontier, create_session(pool_size=1), HostBudgets({"page": (args.page_rate, 1)}),
+            known_ids, cache, args.max_pages, args.max_depth, listings=not args.no_listings,
+        )
+    finally:
+        if cache:
+            cache.close()
+    stats = frontier.stats()
+    frontier.close()
+
+    print(f"\nFetched {counts['pages']} pages in {time.monotonic() - started:.1f}s")
+    print(f"Discovered {counts['machines']} machines ({counts['new']} not in scrape state)")
+    print(f"Frontier: {stats['pending']} pending ({stats['pending_new']} new), {stats['done']} done, "
+          f"{stats['failed']} failed; {stats['visited']}/{stats['pages']} pages visited")
+    if stats["visited"] < stats["pages"]:
+        print("Crawl incomplete: run again to resume")
+    if not stats["pending"] and not stats["done"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+lxml/XPath extractor for machine pages.
+
+Produces the same records as `parse_machine_page` in jihanki_scraper.py, but
+never builds a BeautifulSoup tree. The page is parsed once by libxml2 (the
+same parser BeautifulSoup's 'lxml' backend drives) and only the nodes the
+record needs are visited: the info table, the first h1/title, the map element
+and iframe, scripts that could hold coordinates, and <img> tags. The
+whole-document text scan only runs when the address is still missing.
+
+Text is collected with BeautifulSoup's get_text()/stripped_strings rules:
+comments are skipped, and so is text inside script, style, template, rt and
+rp elements.
+"""
+
+from typing import Iterator, Optional
+
+from lxml import etree
+
+from machine_fields import (
+    add_fallback_image,
+    add_machine_image,
+    apply_info_row,
+    apply_iframe_src,
+    apply_map_attributes,
+    coordinates_from_script,
+    empty_record,
+    image_source,
+    is_address_text,
+    name_from_heading,
+    name_from_title,
+)
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Text BeautifulSoup treats as content (not script/style/template/ruby annotations)
+_CONTENT_TEXT = ".//text()[not(ancestor::script or ancestor::style or ancestor::template " \
+                "or ancestor::rt or ancestor::rp)]"
+
+XPATH_CONTENT_TEXT = etree.XPath(_CONTENT_TEXT, smart_strings=False)
+XPATH_INFO_TABLE = etree.XPath(f"(//table[{_has_class('has-fixed-layout')}])[1]")
+XPATH_ROWS = etree.XPath(".//tr")
+XPATH_CELLS = etree.XPath(".//*[self::th or self::td]")
+XPATH_FIRST_H1 = etree.XPath("(//h1)[1]")
+XPATH_FIRST_TITLE = etree.XPath("(//title)[1]")
+XPATH_COORD_SCRIPTS = etree.XPath("//script[contains(., 'lat') or contains(., 'LatLng')]")
+XPATH_MAP_ELEMENT = etree.XPath(
+    "(//*[(@data-lat and @data-lng) or (@data-latitude and @data-longitude)])[1]"
+)
+XPATH_MAP_IFRAME = etree.XPath(
+    "(//iframe[contains(@src, 'maps.google') or contains(@src, 'google.com/maps')])[1]"
+)
+XPATH_IMAGES = etree.XPath("//img")
+
+# Same selectors, in the same order, as FALLBACK_IMAGE_SELECTORS
+XPATH_FALLBACK_IMAGES = [
+    etree.XPath(f"//*[{_has_class('post_content')}]//img"),
+    etree.XPath("//article//img"),
+    etree.XPath(f"//*[{_has_class('content')}]//img"),
+    etree.XPath("//main//img"),
+]
+
+
+def parse_html(html: str):
+    """Parse HTML the way BeautifulSoup(html, 'lxml') feeds it to libxml2.
+
+    Returns None for a document without any elements.
+    """
+    parser = etree.HTMLParser(recover=True)
+    parser.feed(html)
+    return parser.close()
+
+
+def _first(xpath, node):
+    found = xpath(node)
+    return found[0] if found else None
+
+
+def _stripped_strings(node) -> Iterator[str]:
+    for text in XPATH_CONTENT_TEXT(node):
+        stripped = text.strip()
+        if stripped:
+            yield stripped
+
+
+def _text(node) -> str:
+    """Equivalent of BeautifulSoup's get_text(strip=True)."""
+    return "".join(_stripped_strings(node))
+
+
+def _coordinates_from_scripts(root) -> tuple[Optional[float], Optional[float]]:
+    for script in XPATH_COORD_SCRIPTS(root):
+        if script.text:
+            lat, lng = coordinates_from_script(script.text)
+            if lat is not None:
+                return lat, lng
+    return None, None
+
+
+def parse_machine_page_fast(html: str, url: str, machine_id: str) -> dict:
+    """Parse a machine page with lxml. Same output as parse_machine_page."""
+    root = parse_html(html)
+    data = empty_record(url, machine_id)
+    if root is None:
+        return data
+
+    info_table = _first(XPATH_INFO_TABLE, root)
+    if info_table is not None:
+        for row in XPATH_ROWS(info_table):
+            cells = XPATH_CELLS(row)
+            if len(cells) >= 2:
+                apply_info_row(data, _text(cells[0]), _text(cells[1]))
+
+    if not data["name"]:
+        h1 = _first(XPATH_FIRST_H1, root)
+        if h1 is not None:
+            data["name"] = name_from_heading(_text(h1))
+
+    if not data["name"]:
+        title = _first(XPATH_FIRST_TITLE, root)
+        if title is not None:
+            data["name"] = name_from_title(_text(title))
+
+    if not data["location"]["address"]:
+        for text in _stripped_strings(root):
+            if is_address_text(text):
+                data["location"]["address"] = text
+                break
+
+    lat, lng = _coordinates_from_scripts(root)
+    data["location"]["latitude"] = lat
+    data["location"]["longitude"] = lng
+
+    map_element = _first(XPATH_MAP_ELEMENT, root)
+    if map_element is not None:
+        apply_map_attributes(
+            data,
+            map_element.get('data-lat') or map_element.get('data-latitude'),
+            map_element.get('data-lng') or map_element.get('data-longitude'),
+        )
+
+    iframe = _first(XPATH_MAP_IFRAME, root)
+    if iframe is not None and not data["location"]["latitude"]:
+        apply_iframe_src(data, iframe.get('src', ''))
+
+    found_images = set()
+    for img in XPATH_IMAGES(root):
+        src = image_source(img.get)
+        if src:
+            add_machine_image(data, found_images, url, src)
+
+    if not data["images"]:
+        for xpath in XPATH_FALLBACK_IMAGES:
+            for img in xpath(root):
+                src = image_source(img.get)
+                if src:
+                    add_fallback_image(data, found_images, url, src, img.get('width'), img.get('height'))
+
+    return data
@@ -0,0 +1,261 @@
+"""
+Offline duplicate detection over scraped machines.
+
+Mirrors the server-side `check_duplicate_machines` rule: two machines are
+duplicates when they are within `radius` metres of each other and either
+closer than `CLOSE_METERS` or their names have a pg_trgm-style trigram
+similarity above `NAME_SIMILARITY`. Pairs are found with a grid index whose
+cells are at least `radius` wide, so each machine is only compared with the
+machines in its own and the 8 neighbouring cells instead of every other one.
+Matching pairs are merged into clusters with union-find.
+
+Existing machines can be added from a snapshot of the `machines` table
+(JSON array or CSV with id, name, latitude, longitude and optionally address
+and status); only clusters that contain at least one scraped machine are
+reported, and rows whose status is not `active` are ignored, as on the server.
+
+Usage:
+    python find_duplicates.py [../output/machines.json] [--existing db_machines.csv]
+        [--radius 50] [--output ../output/duplicates.json]
+"""
+
+import argparse
+import csv
+import json
+import math
+import re
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+DEFAULT_RADIUS_METERS = 50
+CLOSE_METERS = 15  # closer than this is a duplicate whatever the names
+NAME_SIMILARITY = 0.3  # pg_trgm similarity() threshold used by check_duplicate_machines
+EARTH_RADIUS_METERS = 6_371_008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180
+
+# pg_trgm splits on anything that is not alphanumeric
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+def trigrams(name: Optional[str]) -> frozenset:
+    """Trigram set of a name as pg_trgm builds it: lowercased words padded with
+    two spaces in front and one behind."""
+    grams = set()
+    for word in WORD_PATTERN.findall((name or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """pg_trgm similarity(): shared trigrams over distinct trigrams of both."""
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def distance_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Haversine distance. Within a few hundred metres it agrees with PostGIS's
+    spheroid ST_Distance to well under a metre."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    h = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(h)))
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # Lower index as root keeps cluster ids deterministic
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def scraped_machines(json_path: str) -> list[dict]:
+    """Machines with coordinates from a machines.json, as dedupe candidates."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    candidates = []
+    for record in data.get("machines", []):
+        location = record.get("location") or {}
+        if location.get("latitude") is None or location.get("longitude") is None:
+            continue
+        candidates.append({
+            "source": "scraped",
+            "id": record["source_id"],
+            "name": record.get("name"),
+            "address": location.get("address"),
+            "latitude": float(location["latitude"]),
+            "longitude": float(location["longitude"]),
+        })
+    return candidates
+
+
+def existing_machines(path: str) -> list[dict]:
+    """Active machines from a JSON or CSV export of the machines table."""
+    if path.endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+    candidates = []
+    for row in rows:
+        if row.get("status") not in (None, "", "active"):
+            continue
+        if row.get("latitude") in (None, "") or row.get("longitude") in (None, ""):
+            continue
+        candidates.append({
+            "source": "existing",
+            "id": str(row["id"]),
+            "name": row.get("name") or None,
+            "address": row.get("address") or None,
+            "latitude": float(row["latitude"]),
+            "longitude": float(row["longitude"]),
+        })
+    return candidates
+
+
+def find_duplicate_pairs(machines: list[dict], radius: float = DEFAULT_RADIUS_METERS) -> Iterable[tuple]:
+    """Yield (i, j, distance, name similarity) for every duplicate pair, i < j.
+
+    Pairs where both machines are existing ones are skipped: those are the
+    server's business.
+    """
+    if not machines:
+        return
+    cell_lat = radius / METERS_PER_DEGREE
+    # Longitude degrees shrink towards the poles; size cells for the highest latitude present
+    max_lat = min(max(abs(m["latitude"]) for m in machines), 89.0)
+    cell_lng = cell_lat / math.cos(math.radians(max_lat))
+
+    grid: dict[tuple[int, int], list[int]] = {}
+    for index, m in enumerate(machines):
+        key = (math.floor(m["latitude"] / cell_lat), math.floor(m["longitude"] / cell_lng))
+        grid.setdefault(key, []).append(index)
+
+    names = [trigrams(m["name"]) for m in machines]
+    for (row, col), members in grid.items():
+        # Each unordered pair of cells is visited once: this cell, then 4 of its neighbours
+        neighbours = [members]
+        for dr, dc in ((0, 1), (1, -1), (1, 0), (1, 1)):
+            other = grid.get((row + dr, col + dc))
+            if other:
+                neighbours.append(other)
+        for position, i in enumerate(members):
+            a = machines[i]
+            for group_index, group in enumerate(neighbours):
+                for j in (group[position + 1:] if group_index == 0 else group):
+                    b = machines[j]
+                    if a["source"] == "existing" and b["source"] == "existing":
+                        continue
+                    distance = distance_meters(a["latitude"], a["longitude"], b["latitude"], b["longitude"])
+                    if distance > radius:
+                        continue
+                    score = similarity(names[i], names[j])
+                    if distance < CLOSE_METERS or score > NAME_SIMILARITY:
+                        yield (min(i, j), max(i, j), distance, score)
+
+
+def find_clusters(machines: list[dict], radius: float = DEFAULT_RADIUS_METERS) -> list[dict]:
+    """Group duplicate pairs into clusters. Returns clusters with their members and pairs."""
+    union_find = UnionFind(len(machines))
+    pairs = []
+    for i, j, distance, score in find_duplicate_pairs(machines, radius):
+        union_find.union(i, j)
+        pairs.append((i, j, distance, score))
+
+    clusters: dict[int, dict] = {}
+    for i, j, distance, score in sorted(pairs):
+        cluster = clusters.setdefault(union_find.find(i), {"members": set(), "pairs": []})
+        cluster["members"].update((i, j))
+        cluster["pairs"].append({
+            "a": machines[i]["id"],
+            "b": machines[j]["id"],
+            "distance_meters": round(distance, 1),
+            "name_similarity": round(score, 3),
+        })
+
+    return [
+        {
+            "members": [machines[i] for i in sorted(cluster["members"])],
+            "pairs": cluster["pairs"],
+        }
+        for _, cluster in sorted(clusters.items())
+    ]
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    output_dir = script_dir.parent / "output"
+
+    parser = argparse.ArgumentParser(description="Report clusters of likely duplicate machines")
+    parser.add_argument(
+        "machines_file",
+        nargs="?",
+        default=str(output_dir / "machines.json"),
+        help="machines.json to check (default: ../output/machines.json)"
+    )
+    parser.add_argument("--existing", help="Export of the machines table (JSON array or CSV) to check against")
+    parser.add_argument(
+        "--radius",
+        type=float,
+        default=DEFAULT_RADIUS_METERS,
+        help=f"Search radius in metres (default: {DEFAULT_RADIUS_METERS})"
+    )
+    parser.add_argument(
+        "--output",
+        default=str(output_dir / "duplicates.json"),
+        help="Cluster report to write (default: ../output/duplicates.json)"
+    )
+    args = parser.parse_args()
+    if args.radius <= 0:
+        parser.error("--radius must be positive")
+
+    started = time.perf_counter()
+    machines = scraped_machines(args.machines_file)
+    scraped_count = len(machines)
+    if args.existing:
+        machines += existing_machines(args.existing)
+    clusters = find_clusters(machines, args.radius)
+
+    report = {
+        "radius_meters": args.radius,
+        "close_meters": CLOSE_METERS,
+        "name_similarity": NAME_SIMILARITY,
+        "scraped": scraped_count,
+        "existing": len(machines) - scraped_count,
+        "clusters": clusters,
+    }
+    tmp_path = f"{args.output}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    Path(tmp_path).replace(args.output)
+
+    duplicated = sum(len(c["members"]) for c in clusters)
+    print(f"Checked {scraped_count} scraped and {len(machines) - scraped_count} existing machines "
+          f"in {time.perf_counter() - started:.2f}s")
+    print(f"{len(clusters)} clusters ({duplicated} machines) written to {args.output}")
+    for cluster in clusters[:10]:
+        names = ", ".join(f"{m['name'] or '(no name)'} [{m['source']}:{m['id']}]" for m in cluster["members"])
+        print(f"  {names}")
+    if len(clusters) > 10:
+        print(f"  ... and {len(clusters) - 10} more")
+
+
+if __name__ == "__main__":
+    main()
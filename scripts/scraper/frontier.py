@@ -0,0 +1,163 @@
+"""
+Persistent crawl frontier for URL discovery.
+
+Two SQLite tables: `pages` holds the sitemaps and listing pages the discovery
+crawler walks, `machines` holds every machine found, keyed by source_id with
+its canonical URL. Both dedupe on their primary key, with an in-memory set in
+front so a URL seen thousands of times across listing pages costs one set
+lookup instead of a query.
+
+Machines are handed to the scraper in priority order: IDs the scrape state
+has never seen (PRIORITY_NEW) before known ones (PRIORITY_KNOWN), each in
+discovery order. A crawl that is interrupted is resumed on the next call;
+once every page has been visited the next crawl starts over from the seeds.
+"""
+
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+PRIORITY_NEW = 0
+PRIORITY_KNOWN = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    visited_at TEXT,
+    error TEXT
+);
+
+CREATE TABLE IF NOT EXISTS machines (
+    source_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    discovered_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    scraped_at TEXT,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS machines_pending ON machines (status, priority, seq);
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Frontier:
+    """SQLite-backed frontier of pages to crawl and machines to scrape."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._seen_pages = {row[0] for row in self._conn.execute("SELECT url FROM pages")}
+            self._seen_machines = {row[0] for row in self._conn.execute("SELECT source_id FROM machines")}
+            self._next_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM machines").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # Pages
+
+    def start_crawl(self) -> bool:
+        """Prepare a crawl. Returns True if an interrupted crawl is resumed;
+        otherwise every known page is queued to be visited again."""
+        with self._lock, self._conn:
+            pending = self._conn.execute("SELECT 1 FROM pages WHERE visited_at IS NULL LIMIT 1").fetchone()
+            if pending:
+                return True
+            self._conn.execute("UPDATE pages SET visited_at = NULL, error = NULL")
+            return False
+
+    def add_page(self, url: str, kind: str, depth: int) -> bool:
+        """Queue a sitemap or listing page. Returns False if it is already known."""
+        with self._lock, self._conn:
+            if url in self._seen_pages:
+                return False
+            self._seen_pages.add(url)
+            self._conn.execute(
+                "INSERT OR IGNORE INTO pages (url, kind, depth) VALUES (?, ?, ?)", (url, kind, depth)
+            )
+        return True
+
+    def next_page(self) -> Optional[dict]:
+        """The next unvisited page: sitemaps first, then listings breadth-first."""
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT url, kind, depth FROM pages WHERE visited_at IS NULL
+                ORDER BY kind = 'listing', depth, rowid LIMIT 1
+                """
+            ).fetchone()
+        return dict(row) if row else None
+
+    def mark_page(self, url: str, error: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE pages SET visited_at = ?, error = ? WHERE url = ?", (_now(), error, url))
+
+    # Machines
+
+    def add_machine(self, source_id: str, url: str, priority: int = PRIORITY_NEW) -> bool:
+        """Queue a machine by ID. Returns False if it is already known; a machine
+        that failed to scrape is queued again when it is rediscovered."""
+        with self._lock, self._conn:
+            if source_id in self._seen_machines:
+                self._conn.execute(
+                    "UPDATE machines SET status = 'pending', error = NULL WHERE source_id = ? AND status = 'failed'",
+                    (source_id,),
+                )
+                return False
+            self._seen_machines.add(source_id)
+            self._conn.execute(
+                "INSERT INTO machines (source_id, url, priority, seq, discovered_at) VALUES (?, ?, ?, ?, ?)",
+                (source_id, url, priority, self._next_seq, _now()),
+            )
+            self._next_seq += 1
+        return True
+
+    def pending_urls(self, limit: Optional[int] = None) -> list[str]:
+        """Canonical URLs of machines still to scrape, new IDs first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url FROM machines WHERE status = 'pending' ORDER BY priority, seq LIMIT ?",
+                (-1 if limit is None else limit,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_machine(self, source_id: str, error: Optional[str] = None) -> None:
+        """Record the outcome of scraping a machine."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE machines SET status = ?, scraped_at = ?, error = ? WHERE source_id = ?",
+                ("failed" if error else "done", _now(), error, source_id),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            pages = self._conn.execute(
+                "SELECT COUNT(*), COUNT(visited_at) FROM pages"
+            ).fetchone()
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM machines GROUP BY status").fetchall())
+            new = self._conn.execute(
+                "SELECT COUNT(*) FROM machines WHERE status = 'pending' AND priority = ?", (PRIORITY_NEW,)
+            ).fetchone()[0]
+        return {
+            "pages": pages[0],
+            "visited": pages[1],
+            "pending": counts.get("pending", 0),
+            "pending_new": new,
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+        }
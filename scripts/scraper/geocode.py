@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Offline geocoding for machines whose page has no coordinates.
+
+Addresses are first normalised into a lookup key: NFKC (full-width digits
+and letters become ASCII), postal codes dropped, the dash variants used
+between block numbers (ー, －, ‐, −, の, ...) unified to "-", 丁目/番地/番/号
+written as dashes (with kanji numerals before them, and before 条/線/地割,
+turned into digits), anything after the block number (building names,
+floors, which usually follow a space) cut off, and whitespace dropped.
+Hokkaido 条/線 and Iwate 地割 segments are part of the area, not the block
+number, so they are kept:
+
+    〒162-0063 東京都新宿区市谷薬王寺町５３ー２  ->  東京都新宿区市谷薬王寺町53-2
+    東京都新宿区西新宿二丁目8番1号 都庁      ->  東京都新宿区西新宿2-8-1
+    東京都中央区銀座4-5-6 2F                  ->  東京都中央区銀座4-5-6
+    北海道札幌市中央区北1条西2丁目1           ->  北海道札幌市中央区北1条西2-1
+
+Keys are resolved by a pluggable resolver: any object with a `name` and a
+`resolve(key)` method returning (latitude, longitude, matched key) or None.
+`GazetteerResolver` answers from a local CSV file, either `address,
+latitude, longitude` columns or MLIT 位置参照情報 (都道府県名, 市区町村名,
+大字町丁目名, 街区符号・地番, 緯度, 経度). Without an exact match it falls
+back to the nearest enclosing area: 西新宿2-8-1, then 西新宿2-8, 西新宿2,
+西新宿.
+
+Results, including misses, are kept in a SQLite cache keyed by the
+normalised key, so an address seen in any earlier run, or a spelling
+variant of one, resolves without asking the resolver again. A miss is
+retried once a different resolver (say, a new gazetteer file) is used.
+
+Usage:
+    python geocode.py [../output/machines.json] --gazetteer <file.csv> [--cache <path>]
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+CACHE_NAME = "geocode_cache.db"
+
+POSTAL_CODE_PATTERN = re.compile(r"〒?\s*\d{3}\s*-\s*\d{4}|〒\s*\d{7}")
+COUNTRY_PREFIX_PATTERN = re.compile(r"^(?:日本国?|japan)[、,]?", re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# Dashes, long-vowel marks and の as used between block numbers; only replaced next to a digit
+NUMBER_DASH_PATTERN = re.compile(r"(?<=\d)[-‐‑‒–—―−─━ー〜~のノ](?=\d)")
+# 番 is a block suffix except in town names such as 一番町 and 番丁
+BLOCK_SUFFIX = r"(?:丁目|番地|番(?![町丁])|号)"
+# 北1条, 東2線, 第3地割: numbered areas that come before the block number
+AREA_SUFFIX = r"(?:条|線|地割)"
+KANJI_NUMBER_PATTERN = re.compile(rf"([〇一二三四五六七八九十百]+)(?={BLOCK_SUFFIX}|{AREA_SUFFIX})")
+BLOCK_SUFFIX_PATTERN = re.compile(rf"(?<=\d){BLOCK_SUFFIX}")
+DASH_SPACING_PATTERN = re.compile(r"\s*-\s*")
+DASHES_PATTERN = re.compile(r"-{2,}")
+# Everything up to and including the first run of block numbers after any
+# numbered areas; whitespace still separates it from a building name here
+BLOCK_NUMBER_PATTERN = re.compile(rf"^(\D*?(?:\d+{AREA_SUFFIX}\D*?)*\d+(?:-\d+)*)")
+TRAILING_NUMBER_PATTERN = re.compile(r"-?\d+$")
+
+KANJI_DIGITS = {"〇": 0, "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    address_key TEXT PRIMARY KEY,
+    latitude REAL,
+    longitude REAL,
+    matched TEXT,
+    source TEXT NOT NULL,
+    resolved_at TEXT NOT NULL
+);
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def kanji_to_int(text: str) -> int:
+    """Kanji numeral up to 999 (二十三, 百五) as an int."""
+    total, digit = 0, 0
+    for char in text:
+        if char == "百":
+            total += (digit or 1) * 100
+            digit = 0
+        elif char == "十":
+            total += (digit or 1) * 10
+            digit = 0
+        else:
+            digit = digit * 10 + KANJI_DIGITS[char]
+    return total + digit
+
+
+def normalize_address(address: Optional[str]) -> Optional[str]:
+    """Lookup key for a Japanese address, or None if nothing is left of it."""
+    if not address:
+        return None
+    text = unicodedata.normalize("NFKC", address)
+    text = POSTAL_CODE_PATTERN.sub(" ", text)
+    text = WHITESPACE_PATTERN.sub(" ", text).strip()
+    text = COUNTRY_PREFIX_PATTERN.sub("", text).lstrip()
+    text = KANJI_NUMBER_PATTERN.sub(lambda m: str(kanji_to_int(m.group(1))), text)
+    text = BLOCK_SUFFIX_PATTERN.sub("-", text)
+    text = NUMBER_DASH_PATTERN.sub("-", text)
+    text = DASH_SPACING_PATTERN.sub("-", text)
+    text = DASHES_PATTERN.sub("-", text)
+    # Cut before dropping whitespace, so "銀座4-5-6 2F" does not run on into "4-5-62"
+    match = BLOCK_NUMBER_PATTERN.match(text)
+    if match:
+        text = match.group(1)
+    return WHITESPACE_PATTERN.sub("", text).strip("-") or None
+
+
+def area_keys(key: str) -> list[str]:
+    """`key` and the keys of the areas enclosing it, most specific first:
+    西新宿2-8-1, 西新宿2-8, 西新宿2, 西新宿."""
+    keys = [key]
+    while TRAILING_NUMBER_PATTERN.search(keys[-1]):
+        shorter = TRAILING_NUMBER_PATTERN.sub("", keys[-1])
+        if not shorter:
+            break
+        keys.append(shorter)
+    return keys
+
+
+class GazetteerResolver:
+    """Resolves address keys from a local gazetteer CSV."""
+
+    # MLIT 位置参照情報 columns; the 街区 files add 街区符号・地番 to the 大字・町丁目 ones
+    JAPANESE_ADDRESS_COLUMNS = ("都道府県名", "市区町村名", "大字町丁目名", "大字・丁目名")
+
+    def __init__(self, path: str):
+        self.name = f"gazetteer:{Path(path).name}"
+        self.entries: dict[str, tuple[float, float]] = {}
+        self.conflicts = 0  # keys listed again with other coordinates; the first row is kept
+        for row in self._rows(path):
+            if "address" in row:
+                address = row["address"]
+                latitude, longitude = row.get("latitude"), row.get("longitude")
+            else:
+                address = "".join(row.get(column) or "" for column in self.JAPANESE_ADDRESS_COLUMNS)
+                if row.get("街区符号・地番"):
+                    address += "-" + row["街区符号・地番"]
+                latitude, longitude = row.get("緯度"), row.get("経度")
+            key = normalize_address(address)
+            if key and latitude and longitude:
+                point = (float(latitude), float(longitude))
+                if self.entries.setdefault(key, point) != point:
+                    self.conflicts += 1
+
+    @staticmethod
+    def _rows(path: str) -> Iterable[dict]:
+        # MLIT files are Shift_JIS; everything else is expected to be UTF-8
+        for encoding in ("utf-8-sig", "cp932"):
+            try:
+                with open(path, "r", encoding=encoding, newline="") as f:
+                    return list(csv.DictReader(f))
+            except UnicodeDecodeError:
+                continue
+        raise ValueError(f"{path} is neither UTF-8 nor Shift_JIS")
+
+    def resolve(self, key: str) -> Optional[tuple[float, float, str]]:
+        for candidate in area_keys(key):
+            if candidate in self.entries:
+                return (*self.entries[candidate], candidate)
+        return None
+
+
+class GeocodeCache:
+    """SQLite cache of resolved address keys, misses included."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, dict]:
+        """Cached entries for `keys`, in batches rather than a query per key."""
+        keys = list(keys)
+        entries = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT * FROM geocodes WHERE address_key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                entries.update((row["address_key"], dict(row)) for row in rows)
+        return entries
+
+    def put(self, key: str, result: Optional[tuple[float, float, str]], source: str) -> None:
+        latitude, longitude, matched = result or (None, None, None)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO geocodes (address_key, latitude, longitude, matched, source, resolved_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(address_key) DO UPDATE SET
+                    latitude = excluded.latitude, longitude = excluded.longitude, matched = excluded.matched,
+                    source = excluded.source, resolved_at = excluded.resolved_at
+                """,
+                (key, latitude, longitude, matched, source, _now()),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, misses = self._conn.execute(
+                "SELECT COUNT(*), COUNT(*) - COUNT(latitude) FROM geocodes"
+            ).fetchone()
+        return {"entries": entries, "misses": misses}
+
+
+class Geocoder:
+    """Fills in missing coordinates through an in-memory memo, the cache and a resolver."""
+
+    def __init__(self, cache: GeocodeCache, resolver):
+        self.cache = cache
+        self.resolver = resolver
+        self._memo: dict[str, Optional[tuple[float, float, str]]] = {}
+        self._checked: set[str] = set()  # keys already looked for in the cache
+        self.counts = {"resolved": 0, "unresolved": 0, "cached": 0, "looked_up": 0}
+
+    def prefetch(self, keys: Iterable[str]) -> None:
+        """Load the cache entries for `keys` into memory in one go."""
+        missing = {key for key in keys if key and key not in self._checked}
+        self._checked |= missing
+        for key, entry in self.cache.get_many(missing).items():
+            if entry["latitude"] is not None:
+                self._memo[key] = (entry["latitude"], entry["longitude"], entry["matched"])
+            elif entry["source"] == self.resolver.name:
+                self._memo[key] = None  # a miss for this resolver; another one gets to try
+
+    def locate(self, address: Optional[str]) -> Optional[tuple[float, float, str]]:
+        """(latitude, longitude, matched key) for an address, or None."""
+        key = normalize_address(address)
+        if key is None:
+            return None
+        if key not in self._checked:
+            self.prefetch([key])
+        if key in self._memo:
+            self.counts["cached"] += 1
+            return self._memo[key]
+        result = self.resolver.resolve(key)
+        self.counts["looked_up"] += 1
+        self.cache.put(key, result, self.resolver.name)
+        self._memo[key] = result
+        return result
+
+    def fill(self, record: dict) -> bool:
+        """Set the coordinates of a record that has none from its address.
+        Returns True if it was geocoded; `location.geocoded_from` records the
+        gazetteer key that matched, which may be an enclosing area."""
+        location = record["location"]
+        if location.get("latitude") is not None or not location.get("address"):
+            return False
+        result = self.locate(location["address"])
+        if result is None:
+            self.counts["unresolved"] += 1
+            return False
+        location["latitude"], location["longitude"], location["geocoded_from"] = result
+        self.counts["resolved"] += 1
+        return True
+
+    def fill_all(self, records: list[dict]) -> list[dict]:
+        """Geocode every record missing coordinates. Returns the ones left unresolved."""
+        pending = [r for r in records if r["location"].get("latitude") is None and r["location"].get("address")]
+        self.prefetch(normalize_address(r["location"]["address"]) for r in pending)
+        return [record for record in pending if not self.fill(record)]
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    output_dir = script_dir.parent / "output"
+
+    parser = argparse.ArgumentParser(description="Fill in missing machine coordinates from a local gazetteer")
+    parser.add_argument(
+        "machines_file",
+        nargs="?",
+        default=str(output_dir / "machines.json"),
+        help="machines.json to update in place (default: ../output/machines.json)"
+    )
+    parser.add_argument("--gazetteer", required=True, help="Gazetteer CSV (address,latitude,longitude or MLIT format)")
+    parser.add_argument("--cache", help=f"Geocode cache (default: {CACHE_NAME} next to machines.json)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    resolver = GazetteerResolver(args.gazetteer)
+    cache = GeocodeCache(args.cache or str(Path(args.machines_file).parent / CACHE_NAME))
+    geocoder = Geocoder(cache, resolver)
+
+    with open(args.machines_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    unresolved = geocoder.fill_all(data["machines"])
+    tmp_path = f"{args.machines_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, args.machines_file)
+    stats = cache.stats()
+    cache.close()
+
+    counts = geocoder.counts
+    print(f"Gazetteer: {args.gazetteer} ({len(resolver.entries)} addresses)")
+    if resolver.conflicts:
+        print(f"  Warning: {resolver.conflicts} rows share an address key with different coordinates; "
+              f"the first row of each was kept")
+    print(f"Geocoded {counts['resolved']} machines, {len(unresolved)} unresolved "
+          f"({counts['cached']} from cache, {counts['looked_up']} looked up) "
+          f"in {time.perf_counter() - started:.2f}s")
+    print(f"Cache: {stats['entries']} addresses ({stats['misses']} misses)")
+    for record in unresolved[:10]:
+        print(f"  {record['source_id']}: {record['location']['address']} "
+              f"-> {normalize_address(record['location']['address'])}")
+    if len(unresolved) > 10:
+        print(f"  ... and {len(unresolved) - 10} more")
+
+
+if __name__ == "__main__":
+    main()
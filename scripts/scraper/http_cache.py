@@ -0,0 +1,180 @@
+"""
+Content-addressed on-disk HTTP response cache.
+
+Bodies are stored once per SHA-256 under `blobs/<aa>/<hash>`, zlib-compressed
+for text responses. An SQLite index maps each URL to its blob plus the
+response headers the scraper cares about. Total blob size is capped; the
+least recently used URLs are evicted first.
+
+With `offline=True` the scraper replays responses from the cache only and
+never touches the network.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    blob TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    compressed INTEGER NOT NULL
+);
+"""
+
+
+def _should_compress(headers: dict) -> bool:
+    content_type = (headers.get("Content-Type") or "").lower()
+    return content_type.startswith("text/") or "json" in content_type or "xml" in content_type
+
+
+class HttpCache:
+    """URL -> (headers, body) cache with content-addressed, LRU-evicted blobs."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES, offline: bool = False):
+        self.root = Path(cache_dir)
+        self.blobs_dir = self.root / "blobs"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._conn = sqlite3.connect(str(self.root / "index.db"), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._total = self._conn.execute(
+                "SELECT COALESCE(SUM(stored_size), 0) FROM blobs"
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blobs_dir / digest[:2] / digest
+
+    def get(self, url: str) -> Optional[tuple[dict, bytes]]:
+        """Return (headers, body) for a cached URL, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT e.blob, e.headers, b.compressed FROM entries e JOIN blobs b ON b.hash = e.blob "
+                "WHERE e.url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        digest, headers, compressed = row
+        try:
+            data = self._blob_path(digest).read_bytes()
+        except FileNotFoundError:
+            return None
+        return json.loads(headers), zlib.decompress(data) if compressed else data
+
+    def headers(self, url: str) -> Optional[dict]:
+        """Return the cached headers for a URL without reading the body."""
+        with self._lock:
+            row = self._conn.execute("SELECT headers FROM entries WHERE url = ?", (url,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, url: str, headers, body: bytes) -> str:
+        """Store a response body for `url`. Returns the body's SHA-256."""
+        kept = {name: headers[name] for name in KEPT_HEADERS if headers.get(name)}
+        digest = hashlib.sha256(body).hexdigest()
+        compressed = _should_compress(kept)
+        path = self._blob_path(digest)
+
+        with self._lock:
+            known = self._conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        if not known or not path.exists():
+            data = zlib.compress(body, 6) if compressed else body
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            with self._lock, self._conn:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO blobs (hash, size, stored_size, compressed) VALUES (?, ?, ?, ?)",
+                    (digest, len(body), len(data), int(compressed)),
+                )
+                if cur.rowcount:
+                    self._total += len(data)
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO entries (url, blob, headers, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    blob = excluded.blob, headers = excluded.headers,
+                    stored_at = excluded.stored_at, accessed_at = excluded.accessed_at
+                """,
+                (url, digest, json.dumps(kept), now, now),
+            )
+        if self._total > self.max_bytes:
+            self.evict()
+        return digest
+
+    def evict(self, target_bytes: Optional[int] = None) -> int:
+        """Drop least recently used entries until blobs fit in `target_bytes`.
+
+        Defaults to 90% of the size cap so eviction does not run on every put.
+        Returns the number of blobs removed.
+        """
+        if target_bytes is None:
+            target_bytes = int(self.max_bytes * 0.9)
+        removed = 0
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT url, blob FROM entries ORDER BY accessed_at").fetchall()
+            for url, digest in rows:
+                if self._total <= target_bytes:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+                still_used = self._conn.execute(
+                    "SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (digest,)
+                ).fetchone()
+                if still_used:
+                    continue
+                stored_size = self._conn.execute(
+                    "SELECT stored_size FROM blobs WHERE hash = ?", (digest,)
+                ).fetchone()[0]
+                self._conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+                self._blob_path(digest).unlink(missing_ok=True)
+                self._total -= stored_size
+                removed += 1
+        return removed
+
+    def urls(self, content_type_prefix: str = "") -> list[str]:
+        """All cached URLs, optionally only those whose Content-Type starts with a prefix."""
+        with self._lock:
+            rows = self._conn.execute("SELECT url, headers FROM entries ORDER BY url").fetchall()
+        return [
+            url for url, headers in rows
+            if (json.loads(headers).get("Content-Type") or "").startswith(content_type_prefix)
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            blobs = self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return {"entries": entries, "blobs": blobs, "bytes": self._total, "max_bytes": self.max_bytes}
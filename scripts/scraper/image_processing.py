@@ -0,0 +1,86 @@
+"""
+Post-download image processing with Pillow.
+
+Each downloaded image is decoded to check it is a real image, and its actual
+format and dimensions are recorded. A WebP variant capped at a maximum
+dimension and a small WebP thumbnail are written next to it, so seeding can
+upload small, correctly typed files instead of the originals.
+
+`process_image` is a plain function over file paths so it can run in a
+process pool.
+"""
+
+from pathlib import Path
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+DEFAULT_MAX_DIMENSION = 1600  # longest side of the WebP variant, in pixels
+DEFAULT_THUMB_DIMENSION = 320  # longest side of the thumbnail, in pixels
+WEBP_QUALITY = 80
+THUMB_QUALITY = 70
+
+# Fields process_image adds to an `images` entry; stale once the body changes
+DERIVED_FIELDS = ("format", "width", "height", "webp_path", "thumb_path")
+
+
+def variant_paths(local_path: str) -> tuple[str, str]:
+    """Relative paths of the WebP variant and thumbnail for an image, e.g. images/1/1_large.webp."""
+    path = Path(local_path)
+    return (
+        str(path.with_name(f"{path.stem}_large.webp")),
+        str(path.with_name(f"{path.stem}_thumb.webp")),
+    )
+
+
+def _save_webp(img: Image.Image, path: Path, max_dimension: int, quality: int) -> None:
+    variant = img.copy()
+    variant.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    tmp = path.with_name(f".{path.name}.tmp")
+    variant.save(tmp, "WEBP", quality=quality, method=4)
+    tmp.replace(path)
+
+
+def process_image(output_dir: str, local_path: str,
+                  max_dimension: int = DEFAULT_MAX_DIMENSION,
+                  thumb_dimension: int = DEFAULT_THUMB_DIMENSION) -> dict:
+    """Verify one downloaded image and write its WebP variant and thumbnail.
+
+    `local_path` is relative to `output_dir`. Returns DERIVED_FIELDS for the
+    `images` entry; `format` is the decoded format, whatever the file
+    extension says. Raises ValueError if the file is not a decodable image.
+    """
+    root = Path(output_dir)
+    source = root / local_path
+    try:
+        with Image.open(source) as img:
+            img.verify()
+        with Image.open(source) as img:
+            image_format = img.format
+            img.load()
+            # Variants are stored upright; the original keeps its EXIF orientation
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+            width, height = img.size
+
+            webp_path, thumb_path = variant_paths(local_path)
+            _save_webp(img, root / webp_path, max_dimension, WEBP_QUALITY)
+            _save_webp(img, root / thumb_path, thumb_dimension, THUMB_QUALITY)
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Invalid image {local_path}: {e}") from e
+
+    return {
+        "format": image_format.lower() if image_format else None,
+        "width": width,
+        "height": height,
+        "webp_path": webp_path,
+        "thumb_path": thumb_path,
+    }
+
+
+def is_processed(output_dir: str, img_info: dict) -> bool:
+    """True if an `images` entry already has variants on disk for its current body."""
+    root = Path(output_dir)
+    return all(img_info.get(field) is not None for field in DERIVED_FIELDS) and \
+        (root / img_info["webp_path"]).exists() and (root / img_info["thumb_path"]).exists()
+
@@ -0,0 +1,122 @@
+"""
+Content-addressed image store shared by every machine.
+
+Downloads are streamed through SHA-256 into `blobs/<aa>/<hash>`, so an image
+served under several URLs, or used by several machines, is stored once. An
+SQLite index maps each image URL to its blob; a URL already in the index is
+never fetched again. The per-machine files the rest of the tooling reads
+(`images/<machine_id>/<n>.<ext>`) are hardlinks to the blobs, or copies where
+the filesystem does not support hardlinks.
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+INDEX_NAME = "index.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    blob TEXT NOT NULL,
+    content_type TEXT,
+    stored_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS urls_blob ON urls (blob);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+"""
+
+
+class ImageStore:
+    """URL -> SHA-256 index over a directory of deduplicated image blobs."""
+
+    def __init__(self, store_dir: str):
+        self.root = Path(store_dir)
+        self.blobs_dir = self.root / "blobs"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.root / INDEX_NAME), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blobs_dir / digest[:2] / digest
+
+    def lookup(self, url: str) -> Optional[str]:
+        """SHA-256 of the blob already stored for `url`, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT blob FROM urls WHERE url = ?", (url,)).fetchone()
+        if row and self.blob_path(row[0]).exists():
+            return row[0]
+        return None
+
+    def ingest(self, url: str, chunks: Iterable[bytes], content_type: Optional[str] = None) -> str:
+        """Stream `chunks` into the store, hashing as they are written. Returns the SHA-256.
+
+        A body whose hash is already stored is discarded after hashing.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        tmp = self.blobs_dir / f"incoming.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            path = self.blob_path(digest)
+            if path.exists():
+                tmp.unlink()
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO blobs (hash, size) VALUES (?, ?)", (digest, size))
+            self._conn.execute(
+                """
+                INSERT INTO urls (url, blob, content_type, stored_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    blob = excluded.blob, content_type = excluded.content_type, stored_at = excluded.stored_at
+                """,
+                (url, digest, content_type, time.time()),
+            )
+        return digest
+
+    def link(self, digest: str, dest: Path) -> None:
+        """Make `dest` a hardlink to a blob (a copy if hardlinks are unsupported)."""
+        source = self.blob_path(digest)
+        if dest.exists() and os.path.samefile(source, dest):
+            return
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            os.link(source, tmp)
+        except OSError:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, dest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            urls = self._conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+            blobs, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {"urls": urls, "blobs": blobs, "bytes": size}
@@ -7,29 +7,105 @@ and outputs to JSON with downloaded images.
 
 Usage:
     python jihanki_scraper.py <input_file.md> [--output-dir <dir>]
+    python jihanki_scraper.py --frontier <frontier.db> [--limit N] [--output-dir <dir>]
+    python jihanki_scraper.py --work-queue <queue.db> [--worker-id ID] [--batch-size N]
+        [--lease-seconds S] [--output-dir <dir>]
+        [--concurrency N] [--page-rate RPS] [--image-rate RPS] [--max-rate-factor X]
+        [--state-db <path>] [--full-refresh] [--restart]
+        [--cache-dir <dir>] [--cache-size-mb N] [--offline]
+        [--image-store <dir>] [--no-image-store]
+        [--max-image-size PX] [--thumb-size PX] [--no-image-processing]
+        [--fetch-workers N] [--parse-workers N] [--image-workers N] [--queue-size N]
+        [--parser {soup,lxml}] [--metrics-log <path>] [--metrics-file <path>] [--no-delta] [--columnar]
+        [--site-origin <url>] [--gazetteer <file.csv>] [--geocode-cache <path>]
 """
 
 import argparse
-import json
+import hashlib
 import os
-import random
+import queue
 import re
 import sys
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
-from typing import Optional
-from urllib.parse import urljoin, urlparse
+from typing import Iterable, Iterator, Optional
+from urllib.parse import urlparse
 
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from columnar import write_columnar
+from delta_export import delta_summary, write_delta
+from fast_parser import parse_machine_page_fast
+from frontier import Frontier
+from geocode import CACHE_NAME as GEOCODE_CACHE_NAME, GazetteerResolver, GeocodeCache, Geocoder
+from http_cache import DEFAULT_MAX_BYTES, HttpCache
+from image_processing import (
+    DEFAULT_MAX_DIMENSION,
+    DEFAULT_THUMB_DIMENSION,
+    DERIVED_FIELDS,
+    is_processed,
+    process_image,
+)
+from image_store import ImageStore
+from jsonl_sink import JsonlWriter, compact_jsonl
+from machine_fields import (
+    FALLBACK_IMAGE_SELECTORS,
+    add_fallback_image,
+    add_machine_image,
+    apply_info_row,
+    apply_iframe_src,
+    apply_map_attributes,
+    coordinates_from_script,
+    empty_record,
+    image_source,
+    is_address_text,
+    may_contain_coordinates,
+    name_from_heading,
+    name_from_title,
+)
+from metrics import Metrics
+from pipeline import DONE, run_stage
+from state_store import StateStore
+from throttle import (
+    THROTTLE_STATUSES,
+    CircuitOpenError,
+    HostBudgets,
+    backoff_delay,
+    budget_slot,
+    parse_retry_after,
+    record_response,
+)
+from work_queue import DEFAULT_BATCH_SIZE, DEFAULT_LEASE_SECONDS, WorkQueue, default_worker_id
 
 # Constants
 DEFAULT_OUTPUT_DIR = "../output"
+STATE_DB_NAME = "scrape_state.db"
+CACHE_DIR_NAME = "http_cache"
+IMAGE_STORE_NAME = "image_store"
+JSONL_NAME = "machines.jsonl"
+SHARDS_DIR_NAME = "shards"
 REQUEST_DELAY = 2.5  # seconds between requests (be respectful to small sites)
-MAX_RETRIES = 2
+MAX_RETRIES = 4  # attempts per request; only throttling, 5xx and network errors are retried
 REQUEST_TIMEOUT = 30
 
+# Concurrent engine defaults. Pages and images are budgeted separately per host,
+# so the page rate matches the old serial pacing while images flow alongside.
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PAGE_RATE = 1 / REQUEST_DELAY  # page requests per second per host
+DEFAULT_IMAGE_RATE = 2 / REQUEST_DELAY  # image requests per second per host
+MAX_RATE_FACTOR = 2  # adaptive pacing may speed up to this multiple of the configured rate
+PAGE_WINDOW_FACTOR = 4  # machines in the pipeline ahead of the consumer, per unit of concurrency
+DEFAULT_QUEUE_SIZE = 16  # capacity of each inter-stage queue
+DEFAULT_PARSER = "soup"
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
@@ -39,21 +115,15 @@ HEADERS = {
 
 def extract_urls_from_markdown(file_path: str) -> list[str]:
     """Extract jihanki.sagase.com URLs from a markdown file."""
-    urls = []
     url_pattern = re.compile(r'https?://jihanki\.sagase\.com/[^\s\)\]]+')
 
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    # Find all URLs matching the pattern
+    # Find all URLs matching the pattern, cleaned of trailing punctuation;
+    # a dict dedupes in linear time and keeps first-seen order
     matches = url_pattern.findall(content)
-    for url in matches:
-        # Clean up URL (remove trailing punctuation)
-        url = url.rstrip('.,;:!?')
-        if url not in urls:
-            urls.append(url)
-
-    return urls
+    return list(dict.fromkeys(url.rstrip('.,;:!?') for url in matches))
 
 
 def extract_machine_id(url: str) -> Optional[str]:
@@ -62,81 +132,255 @@ def extract_machine_id(url: str) -> Optional[str]:
     return match.group(1) if match else None
 
 
-def fetch_page(url: str, session: requests.Session) -> Optional[str]:
-    """Fetch a page with retries."""
+def with_origin(url: str, origin: str) -> str:
+    """`url` with its scheme and host replaced by those of `origin`, e.g. to
+    fetch https://jihanki.sagase.com/jihanki/3492/ from http://127.0.0.1:8000."""
+    target = urlparse(origin)
+    return urlparse(url)._replace(scheme=target.scheme, netloc=target.netloc).geturl()
+
+
+def cached_response(url: str, headers: dict, body: bytes) -> requests.Response:
+    """Build a 200 response from a cache entry, decoded the same way as a live one."""
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = body
+    return response
+
+
+def is_retryable(error: requests.RequestException) -> bool:
+    """Only a 4xx other than throttling is final; throttling, server errors,
+    network errors and bodies cut off after a 200 are worth retrying."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status in THROTTLE_STATUSES or status >= 500
+    return True
+
+
+def record_attempt(budgets: Optional[HostBudgets], kind: str, url: str, seconds: float,
+                   response: Optional[requests.Response]) -> None:
+    """Feed one attempt back to the adaptive budget, honouring Retry-After on throttling."""
+    if response is None:
+        record_response(budgets, kind, url, seconds, error=True)
+        return
+    retry_after = None
+    if response.status_code in THROTTLE_STATUSES:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+    record_response(budgets, kind, url, seconds, response.status_code, retry_after=retry_after)
+
+
+def fetch_response(url: str, session: requests.Session,
+                   budgets: Optional[HostBudgets] = None,
+                   extra_headers: Optional[dict] = None,
+                   cache: Optional[HttpCache] = None,
+                   metrics: Optional[Metrics] = None) -> Optional[requests.Response]:
+    """Fetch a page with retries. A 304 Not Modified counts as success.
+
+    Throttling (429/503), server errors and network errors are retried with
+    exponential backoff and jitter; every attempt is fed back to the adaptive
+    page budget. Fails at once while the host's circuit is open.
+
+    With a cache, successful responses are stored and, when the caller sends
+    no validators of its own, the cached copy is revalidated and served on a
+    304. In offline mode only the cache is consulted. With `metrics`, every
+    attempt is recorded as a "page" request.
+    """
+    if cache and cache.offline:
+        entry = cache.get(url)
+        if entry is None:
+            print("  Not in cache (offline)")
+            return None
+        if metrics:
+            metrics.inc("cache_hits_total", kind="page")
+        return cached_response(url, *entry)
+
+    cache_headers = cache.headers(url) if cache and not extra_headers else None
+    if cache_headers:
+        extra_headers = {}
+        if cache_headers.get("ETag"):
+            extra_headers["If-None-Match"] = cache_headers["ETag"]
+        if cache_headers.get("Last-Modified"):
+            extra_headers["If-Modified-Since"] = cache_headers["Last-Modified"]
+
+    headers = {**HEADERS, **extra_headers} if extra_headers else HEADERS
     for attempt in range(MAX_RETRIES):
+        started = time.perf_counter()
+        response = None
         try:
-            response = session.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+            with budget_slot(budgets, "page", url):
+                started = time.perf_counter()
+                response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            record_attempt(budgets, "page", url, time.perf_counter() - started, response)
             response.raise_for_status()
-            return response.text
+            if metrics:
+                metrics.request("page", url, attempt + 1, time.perf_counter() - started,
+                                response.status_code, len(response.content))
+            if cache and response.status_code == 200:
+                cache.put(url, response.headers, response.content)
+            elif cache_headers and response.status_code == 304:
+                entry = cache.get(url)
+                if entry is not None:
+                    if metrics:
+                        metrics.inc("cache_hits_total", kind="page")
+                    return cached_response(url, *entry)
+                # Cached body vanished: fetch it unconditionally
+                headers = HEADERS
+                cache_headers = None
+                continue
+            return response
+        except CircuitOpenError as e:
+            print(f"  Not fetched: {e}")
+            return None
         except requests.RequestException as e:
+            if response is None:
+                record_attempt(budgets, "page", url, time.perf_counter() - started, None)
+            if metrics:
+                metrics.request("page", url, attempt + 1, time.perf_counter() - started,
+                                response.status_code if response is not None else None, error=e)
             print(f"  Attempt {attempt + 1}/{MAX_RETRIES} failed: {e}")
+            if not is_retryable(e):
+                return None
             if attempt < MAX_RETRIES - 1:
-                time.sleep(REQUEST_DELAY)
+                time.sleep(backoff_delay(attempt, base=REQUEST_DELAY))
     return None
 
 
-def download_image(url: str, save_path: Path, session: requests.Session) -> bool:
-    """Download an image with retry."""
+def fetch_page(url: str, session: requests.Session,
+               budgets: Optional[HostBudgets] = None,
+               cache: Optional[HttpCache] = None) -> Optional[str]:
+    """Fetch a page with retries."""
+    response = fetch_response(url, session, budgets, cache=cache)
+    return response.text if response is not None else None
+
+
+def conditional_headers(state: Optional[dict]) -> dict:
+    """Build If-None-Match / If-Modified-Since headers from a stored machine state."""
+    headers = {}
+    if state and state.get("record"):
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+    return headers
+
+
+def save_image_body(url: str, save_path: Path, chunks: Iterator[bytes],
+                    content_type: Optional[str] = None,
+                    store: Optional[ImageStore] = None) -> str:
+    """Write an image body to `save_path`, hashing it on the way. Returns its SHA-256.
+
+    With an image store the body goes into the store once and `save_path`
+    becomes a link to the blob.
+    """
+    if store:
+        digest = store.ingest(url, chunks, content_type)
+        store.link(digest, save_path)
+        return digest
+
+    # Written beside save_path and moved into place, so a hardlink an earlier
+    # store run left there is replaced rather than written through into its blob
+    hasher = hashlib.sha256()
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = save_path.with_name(f".{save_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                hasher.update(chunk)
+                f.write(chunk)
+        os.replace(tmp_path, save_path)
+    except BaseException:
+        # A body cut off mid-read must not be left behind as an image
+        tmp_path.unlink(missing_ok=True)
+        save_path.unlink(missing_ok=True)
+        raise
+    return hasher.hexdigest()
+
+
+def download_image(url: str, save_path: Path, session: requests.Session,
+                   budgets: Optional[HostBudgets] = None,
+                   cache: Optional[HttpCache] = None,
+                   store: Optional[ImageStore] = None,
+                   metrics: Optional[Metrics] = None) -> Optional[str]:
+    """Download an image with retry, through the cache when one is given.
+
+    Retries, backoff, adaptive pacing and the circuit breaker work as in
+    fetch_response, on the image budget; the budget adapts to the time to the
+    response headers, so large bodies do not read as a slow server.
+    Returns the SHA-256 of the saved body, or None if the download failed.
+    With `metrics`, every attempt is recorded as an "image" request.
+    """
+    if cache:
+        entry = cache.get(url)
+        if entry is not None:
+            if metrics:
+                metrics.inc("cache_hits_total", kind="image")
+            headers, body = entry
+            return save_image_body(url, save_path, iter([body]), headers.get("Content-Type"), store)
+        if cache.offline:
+            print("    Not in cache (offline)")
+            return None
+
     for attempt in range(MAX_RETRIES):
+        started = time.perf_counter()
+        response = None
+        received = [0]
         try:
-            response = session.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT, stream=True)
-            response.raise_for_status()
-
-            save_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(save_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return True
+            with budget_slot(budgets, "image", url):
+                started = time.perf_counter()
+                response = session.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT, stream=True)
+                record_attempt(budgets, "image", url, time.perf_counter() - started, response)
+                response.raise_for_status()
+
+                chunks = [] if cache else None
+
+                def body() -> Iterator[bytes]:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        received[0] += len(chunk)
+                        if chunks is not None:
+                            chunks.append(chunk)
+                        yield chunk
+
+                digest = save_image_body(url, save_path, body(), response.headers.get("Content-Type"), store)
+            if metrics:
+                metrics.request("image", url, attempt + 1, time.perf_counter() - started,
+                                response.status_code, received[0])
+            if cache:
+                cache.put(url, response.headers, b"".join(chunks))
+            return digest
+        except CircuitOpenError as e:
+            print(f"    Image not downloaded: {e}")
+            return None
         except requests.RequestException as e:
+            if response is None:
+                record_attempt(budgets, "image", url, time.perf_counter() - started, None)
+            if metrics:
+                metrics.request("image", url, attempt + 1, time.perf_counter() - started,
+                                response.status_code if response is not None else None, received[0], e)
             print(f"    Image download attempt {attempt + 1}/{MAX_RETRIES} failed: {e}")
+            if not is_retryable(e):
+                return None
             if attempt < MAX_RETRIES - 1:
-                time.sleep(REQUEST_DELAY / 2)
-    return False
+                time.sleep(backoff_delay(attempt, base=REQUEST_DELAY / 2))
+    return None
 
 
 def extract_coordinates_from_scripts(soup: BeautifulSoup) -> tuple[Optional[float], Optional[float]]:
     """Try to extract lat/lng from JavaScript in the page."""
     scripts = soup.find_all('script')
     for script in scripts:
-        if script.string:
-            # Look for common patterns like: lat: 35.123, lng: 139.456
-            lat_match = re.search(r'lat[itude]*["\']?\s*[:=]\s*([0-9.]+)', script.string)
-            lng_match = re.search(r'(?:lng|lon)[gitude]*["\']?\s*[:=]\s*([0-9.]+)', script.string)
-            if lat_match and lng_match:
-                try:
-                    return float(lat_match.group(1)), float(lng_match.group(1))
-                except ValueError:
-                    pass
-
-            # Also try LatLng(lat, lng) pattern
-            latlng_match = re.search(r'LatLng\s*\(\s*([0-9.]+)\s*,\s*([0-9.]+)\s*\)', script.string)
-            if latlng_match:
-                try:
-                    return float(latlng_match.group(1)), float(latlng_match.group(2))
-                except ValueError:
-                    pass
+        if script.string and may_contain_coordinates(script.string):
+            lat, lng = coordinates_from_script(script.string)
+            if lat is not None:
+                return lat, lng
     return None, None
 
 
 def parse_machine_page(html: str, url: str, machine_id: str) -> dict:
     """Parse a machine page and extract data."""
     soup = BeautifulSoup(html, 'lxml')
-
-    data = {
-        "source_id": machine_id,
-        "source_url": url,
-        "name": None,
-        "location": {
-            "address": None,
-            "latitude": None,
-            "longitude": None
-        },
-        "merchandise": [],
-        "categories": [],
-        "features": [],
-        "images": []
-    }
+    data = empty_record(url, machine_id)
 
     # jihanki.sagase.com specific: Parse the data table with has-fixed-layout class
     # Table rows: 自販機名, 所在地, 商品, 自販機特徴, ジャンル, 商品価格帯, etc.
@@ -148,53 +392,25 @@ def parse_machine_page(html: str, url: str, machine_id: str) -> dict:
             if len(cells) >= 2:
                 label = cells[0].get_text(strip=True)
                 value = cells[1].get_text(strip=True)
-
-                if '自販機名' in label:
-                    data["name"] = value
-                elif '所在地' in label or '住所' in label:
-                    data["location"]["address"] = value
-                elif label == '商品':
-                    # Actual product sold (e.g., 煎餅, うどん)
-                    items = re.split(r'[、,・\n/]', value)
-                    data["merchandise"] = [item.strip() for item in items if item.strip()]
-                elif 'ジャンル' in label or 'カテゴリ' in label:
-                    # Categories/genres
-                    items = re.split(r'[、,・\n/]', value)
-                    data["categories"] = [item.strip() for item in items if item.strip()]
-                elif '特徴' in label:
-                    if value:
-                        data["features"].append(value)
+                apply_info_row(data, label, value)
 
     # Fallback: Extract name from h1 if not found in table
     if not data["name"]:
         h1 = soup.select_one('h1')
         if h1:
-            name = h1.get_text(strip=True)
             # Clean up common patterns like 「XXX」の詳細情報
-            match = re.search(r'「(.+?)」', name)
-            if match:
-                data["name"] = match.group(1)
-            elif name and len(name) < 200:
-                data["name"] = name
+            data["name"] = name_from_heading(h1.get_text(strip=True))
 
     # Fallback: Try to get title from page title if still no name
     if not data["name"]:
         title_tag = soup.find('title')
         if title_tag:
-            title = title_tag.get_text(strip=True)
-            match = re.search(r'「(.+?)」', title)
-            if match:
-                data["name"] = match.group(1)
-            else:
-                title = re.sub(r'\s*[-|].*$', '', title)
-                if title:
-                    data["name"] = title
+            data["name"] = name_from_title(title_tag.get_text(strip=True))
 
     # Fallback: Extract address from text if not found in table
     if not data["location"]["address"]:
-        prefecture_pattern = re.compile(r'〒?\d{3}-?\d{4}\s*[東京都北海道大阪府京都府].+?[0-9０-９\-ー]+')
         for text in soup.stripped_strings:
-            if prefecture_pattern.search(text) and len(text) < 100:
+            if is_address_text(text):
                 data["location"]["address"] = text
                 break
 
@@ -206,91 +422,46 @@ def parse_machine_page(html: str, url: str, machine_id: str) -> dict:
     # Also check for data attributes on map elements
     map_element = soup.select_one('[data-lat][data-lng], [data-latitude][data-longitude]')
     if map_element:
-        lat = map_element.get('data-lat') or map_element.get('data-latitude')
-        lng = map_element.get('data-lng') or map_element.get('data-longitude')
-        if lat and lng:
-            try:
-                data["location"]["latitude"] = float(lat)
-                data["location"]["longitude"] = float(lng)
-            except ValueError:
-                pass
+        apply_map_attributes(
+            data,
+            map_element.get('data-lat') or map_element.get('data-latitude'),
+            map_element.get('data-lng') or map_element.get('data-longitude'),
+        )
 
     # Try to extract coordinates from Google Maps iframe src
     # jihanki.sagase.com uses: https://maps.google.co.jp/maps?q=35.702839,139.737497&output=embed
     iframe = soup.select_one('iframe[src*="maps.google"], iframe[src*="google.com/maps"]')
     if iframe and not data["location"]["latitude"]:
-        src = iframe.get('src', '')
-        # Try q=lat,lng pattern first (most common on jihanki.sagase.com)
-        coord_match = re.search(r'[?&]q=(-?[0-9.]+),(-?[0-9.]+)', src)
-        if coord_match:
-            try:
-                data["location"]["latitude"] = float(coord_match.group(1))
-                data["location"]["longitude"] = float(coord_match.group(2))
-            except ValueError:
-                pass
-        else:
-            # Try !2d!3d pattern (Google Maps embed format)
-            coord_match = re.search(r'!2d(-?[0-9.]+)!3d(-?[0-9.]+)', src)
-            if coord_match:
-                try:
-                    data["location"]["longitude"] = float(coord_match.group(1))
-                    data["location"]["latitude"] = float(coord_match.group(2))
-                except ValueError:
-                    pass
+        apply_iframe_src(data, iframe.get('src', ''))
 
     # Extract images - prioritize machine images from wp-content/uploads/jihanki/
     found_images = set()
 
     # First, look for jihanki-specific images in wp-content/uploads/jihanki/
     for img in soup.find_all('img'):
-        src = img.get('src') or img.get('data-src') or img.get('data-lazy-src')
+        src = image_source(img.get)
         if src:
-            img_url = urljoin(url, src)
-            # Prioritize images from the jihanki uploads folder
-            if '/uploads/jihanki/' in img_url and img_url not in found_images:
-                found_images.add(img_url)
-                data["images"].append({
-                    "url": img_url,
-                    "local_path": None
-                })
+            add_machine_image(data, found_images, url, src)
 
     # If no jihanki-specific images, fall back to other image selectors
     if not data["images"]:
-        image_selectors = [
-            '.post_content img',
-            'article img',
-            '.content img',
-            'main img',
-        ]
-
-        for selector in image_selectors:
-            images = soup.select(selector)
-            for img in images:
-                src = img.get('src') or img.get('data-src') or img.get('data-lazy-src')
+        for selector in FALLBACK_IMAGE_SELECTORS:
+            for img in soup.select(selector):
+                src = image_source(img.get)
                 if src:
-                    img_url = urljoin(url, src)
-                    # Skip small icons, logos, navigation elements
-                    if any(x in img_url.lower() for x in ['icon', 'logo', 'avatar', 'button', 'arrow', 'sprite', 'gravatar']):
-                        continue
-                    # Skip very small images
-                    width = img.get('width')
-                    height = img.get('height')
-                    if width and height:
-                        try:
-                            if int(width) < 100 or int(height) < 100:
-                                continue
-                        except ValueError:
-                            pass
-                    if img_url not in found_images:
-                        found_images.add(img_url)
-                        data["images"].append({
-                            "url": img_url,
-                            "local_path": None
-                        })
+                    add_fallback_image(data, found_images, url, src, img.get('width'), img.get('height'))
 
     return data
 
 
+# Page parsers selectable with --parser; both produce identical records
+# (check with compare_parsers.py), "lxml" is several times faster.
+PARSERS = {
+    "soup": parse_machine_page,
+    "lxml": parse_machine_page_fast,
+}
+
+
 def get_image_extension(url: str, content_type: Optional[str] = None) -> str:
     """Determine image extension from URL or content type."""
     # Try to get from URL first
@@ -303,98 +474,542 @@ def get_image_extension(url: str, content_type: Optional[str] = None) -> str:
     return '.jpg'
 
 
-def scrape_machines(input_file: str, output_dir: str) -> dict:
-    """Main scraping function."""
-    output_path = Path(output_dir)
-    images_path = output_path / "images"
-
-    # Ensure output directories exist
-    output_path.mkdir(parents=True, exist_ok=True)
-    images_path.mkdir(parents=True, exist_ok=True)
+def create_session(pool_size: int) -> requests.Session:
+    """Create a session whose connection pool can serve `pool_size` threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def set_image_body(img_info: dict, local_path: str, digest: str) -> None:
+    """Record a downloaded image; processing results are dropped if the body changed."""
+    if img_info.get("sha256") != digest:
+        for field in (*DERIVED_FIELDS, "error"):
+            img_info.pop(field, None)
+    img_info["local_path"] = local_path
+    img_info["sha256"] = digest
+
+
+def download_machine_image(img_info: dict, machine_id: str, index: int, images_path: Path,
+                           session: requests.Session, budgets: HostBudgets,
+                           state: Optional[StateStore] = None,
+                           cache: Optional[HttpCache] = None,
+                           store: Optional[ImageStore] = None,
+                           metrics: Optional[Metrics] = None) -> bool:
+    """Download one image of a machine and record its local path and hash on success.
+
+    With an image store, a URL the store already holds is linked into place
+    without any request; otherwise images the state store already has on disk
+    are not downloaded again.
+    """
+    img_url = img_info["url"]
+    ext = get_image_extension(img_url)
+    local_filename = f"{index + 1}{ext}"
+    local_path = f"images/{machine_id}/{local_filename}"
+    save_path = images_path / machine_id / local_filename
+
+    digest = store.lookup(img_url) if store else None
+    if digest:
+        if metrics:
+            metrics.inc("cache_hits_total", kind="image_store")
+        store.link(digest, save_path)
+        set_image_body(img_info, local_path, digest)
+        if state:
+            state.save_image(machine_id, img_url, local_path, "ok")
+        return True
+
+    if state and not store:
+        known = state.get_image(machine_id, img_url)
+        if known and known["status"] == "ok" and known["local_path"] == local_path \
+                and (images_path.parent / local_path).exists():
+            img_info["local_path"] = local_path
+            return True
 
-    # Extract URLs from input file
-    print(f"Reading URLs from: {input_file}")
-    urls = extract_urls_from_markdown(input_file)
-    print(f"Found {len(urls)} URLs to scrape")
+    digest = download_image(img_url, save_path, session, budgets, cache, store, metrics)
+    if digest:
+        # Store relative path from output dir
+        set_image_body(img_info, local_path, digest)
+        if state:
+            state.save_image(machine_id, img_url, local_path, "ok")
+        return True
 
-    if not urls:
-        print("No jihanki.sagase.com URLs found in input file.")
-        return {"machines": [], "errors": []}
+    if state:
+        state.save_image(machine_id, img_url, None, "failed")
+    return False
 
-    # Create session for connection pooling
-    session = requests.Session()
 
-    result = {
-        "scraped_at": datetime.now(timezone.utc).isoformat(),
-        "source": "jihanki.sagase.com",
-        "machines": [],
-        "errors": []
-    }
-
-    for i, url in enumerate(urls):
-        print(f"\n[{i+1}/{len(urls)}] Scraping: {url}")
-
-        machine_id = extract_machine_id(url)
-        if not machine_id:
-            print(f"  Could not extract machine ID from URL, skipping")
-            result["errors"].append({"url": url, "error": "Could not extract machine ID"})
-            continue
-
-        # Fetch page
-        html = fetch_page(url, session)
-        if not html:
-            print(f"  Failed to fetch page, skipping")
-            result["errors"].append({"url": url, "error": "Failed to fetch page"})
-            continue
-
-        # Parse page
+def fetch_machine(item: dict, session: requests.Session, budgets: HostBudgets,
+                  state: Optional[StateStore] = None, run_id: Optional[int] = None,
+                  full_refresh: bool = False, cache: Optional[HttpCache] = None,
+                  metrics: Optional[Metrics] = None) -> dict:
+    """Fetch stage: resolve a machine page to HTML, or to a stored record.
+
+    Sets `machine_id`, `fetch_info` and either `html` (needs parsing) or
+    `machine_data` (unchanged or resumed) on the pipeline item. `fetch_info`
+    carries the HTTP validators and content hash to persist, and a `status`
+    of "new", "changed", "unchanged" or "resumed".
+    """
+    url = item["url"]
+    fetch_info = {"status": "new", "etag": None, "last_modified": None, "content_hash": None}
+    item.update(fetch_info=fetch_info, html=None, machine_data=None)
+
+    machine_id = extract_machine_id(url)
+    item["machine_id"] = machine_id
+    if not machine_id:
+        item["error"] = "Could not extract machine ID"
+        return item
+
+    known = state.get_machine(machine_id) if state else None
+    if known and known["record"]:
+        fetch_info.update(
+            status="changed",
+            etag=known["etag"],
+            last_modified=known["last_modified"],
+            content_hash=known["content_hash"],
+        )
+        # Already completed by the run we are resuming: no request at all
+        if known["run_id"] == run_id:
+            fetch_info["status"] = "resumed"
+            item["machine_data"] = known["record"]
+            return item
+
+    extra_headers = None if full_refresh else conditional_headers(known)
+    response = fetch_response(url, session, budgets, extra_headers, cache, metrics)
+    if response is None:
+        item["error"] = "Failed to fetch page"
+        return item
+
+    if response.status_code == 304:
+        fetch_info["status"] = "unchanged"
+        item["machine_data"] = known["record"]
+        return item
+
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    fetch_info.update(
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        content_hash=content_hash,
+    )
+    if known and known["record"] and known["content_hash"] == content_hash and not full_refresh:
+        fetch_info["status"] = "unchanged"
+        item["machine_data"] = known["record"]
+    else:
+        item["html"] = response.text
+    return item
+
+
+def parse_machine(item: dict, parse_pool: Optional[ProcessPoolExecutor] = None,
+                  parser: str = DEFAULT_PARSER, metrics: Optional[Metrics] = None) -> dict:
+    """Parse stage: turn fetched HTML into a record, in `parse_pool` if given."""
+    if item["machine_data"] is None:
+        parse = PARSERS[parser]
+        args = (item.pop("html"), item["url"], item["machine_id"])
+        started = time.perf_counter()
         try:
-            machine_data = parse_machine_page(html, url, machine_id)
+            if parse_pool:
+                item["machine_data"] = parse_pool.submit(parse, *args).result()
+            else:
+                item["machine_data"] = parse(*args)
+        except Exception as e:
+            item["error"] = f"Parse error: {str(e)}"
+        if metrics:
+            metrics.observe("parse_seconds", time.perf_counter() - started, parser=parser)
+    return item
+
+
+def download_machine_images(item: dict, images_path: Path, session: requests.Session,
+                            budgets: HostBudgets, state: Optional[StateStore] = None,
+                            cache: Optional[HttpCache] = None,
+                            store: Optional[ImageStore] = None,
+                            metrics: Optional[Metrics] = None) -> dict:
+    """Download stage: fetch a machine's images."""
+    if item["fetch_info"]["status"] == "resumed":
+        return item
+
+    for j, img_info in enumerate(item["machine_data"]["images"]):
+        download_machine_image(img_info, item["machine_id"], j, images_path, session, budgets,
+                               state, cache, store, metrics)
+    return item
+
+
+def process_machine_images(item: dict, output_dir: str,
+                           process_pool: Optional[ProcessPoolExecutor] = None,
+                           image_sizes: Optional[tuple[int, int]] = (DEFAULT_MAX_DIMENSION,
+                                                                      DEFAULT_THUMB_DIMENSION),
+                           state: Optional[StateStore] = None,
+                           run_id: Optional[int] = None) -> dict:
+    """Process stage: verify images and write WebP variants, then mark the machine complete.
+
+    `image_sizes` is (variant, thumbnail) maximum dimension, or None to skip
+    processing. Images are processed in `process_pool` if given, all of a
+    machine's images at once; ones whose variants already exist for the
+    same body are skipped. An image that does not decode loses its
+    `local_path` and gets an `error` instead.
+    """
+    machine_data = item["machine_data"]
+    fetch_info = item["fetch_info"]
+    if fetch_info["status"] == "resumed":
+        return item
+
+    if image_sizes:
+        pending = []
+        for img_info in machine_data["images"]:
+            if not img_info["local_path"] or is_processed(output_dir, img_info):
+                continue
+            args = (output_dir, img_info["local_path"], *image_sizes)
+            future = process_pool.submit(process_image, *args) if process_pool else None
+            pending.append((img_info, future, args))
+
+        for img_info, future, args in pending:
+            try:
+                img_info.update(future.result() if future else process_image(*args))
+            except ValueError as e:
+                img_info["local_path"] = None
+                img_info["error"] = str(e)
+
+    if state:
+        state.save_machine(
+            machine_data["source_id"], item["url"], machine_data, run_id,
+            fetch_info["etag"], fetch_info["last_modified"], fetch_info["content_hash"],
+        )
+    return item
+
+
+def iter_machines(urls: Iterable[str], output_dir: str,
+                  concurrency: int = DEFAULT_CONCURRENCY,
+                  page_rate: float = DEFAULT_PAGE_RATE,
+                  image_rate: float = DEFAULT_IMAGE_RATE,
+                  state: Optional[StateStore] = None,
+                  run_id: Optional[int] = None,
+                  full_refresh: bool = False,
+                  cache: Optional[HttpCache] = None,
+                  fetch_workers: Optional[int] = None,
+                  parse_workers: Optional[int] = None,
+                  image_workers: Optional[int] = None,
+                  queue_size: int = DEFAULT_QUEUE_SIZE,
+                  parser: str = DEFAULT_PARSER,
+                  image_store: Optional[ImageStore] = None,
+                  image_sizes: Optional[tuple[int, int]] = (DEFAULT_MAX_DIMENSION, DEFAULT_THUMB_DIMENSION),
+                  metrics: Optional[Metrics] = None,
+                  max_rate_factor: float = MAX_RATE_FACTOR,
+                  ) -> Iterator[tuple[str, Optional[dict], Optional[str], str]]:
+    """Scrape `urls` and yield (url, machine_data, error, status) in input order.
+
+    Work flows through four stages connected by bounded queues of
+    `queue_size` items:
+
+        fetch (threads) -> parse (process pool) -> download images (threads)
+            -> process images (process pool)
+
+    Each stage has its own worker count: `fetch_workers` and `image_workers`
+    default to `concurrency`, `parse_workers` to the number of CPUs (0 parses
+    and processes images in-process, without a process pool); parsing and
+    image processing share the pool. Requests are additionally
+    capped at `concurrency` in flight per host and paced by a token bucket per
+    (kind, host). At most `concurrency * PAGE_WINDOW_FACTOR` machines are in
+    the pipeline at once, so memory stays flat however long `urls` is; it is
+    read lazily and may be a generator.
+    The token buckets adapt to the host's responses, between a fraction of
+    the configured rates and `max_rate_factor` times them.
+    `parser` picks the page parser from PARSERS. With `image_store`, images
+    are deduplicated into the store and linked into `images/<machine_id>/`.
+    `image_sizes` is passed to process_machine_images (None skips processing).
+    With `metrics`, requests, parse times and per-stage times are recorded.
+
+    `status` is "new", "changed", "unchanged" or "resumed" (see fetch_machine).
+    With a state store, each machine is marked complete before it is yielded.
+    """
+    images_path = Path(output_dir) / "images"
+    images_path.mkdir(parents=True, exist_ok=True)
+
+    fetch_workers = fetch_workers or concurrency
+    image_workers = image_workers or concurrency
+    if parse_workers is None:
+        parse_workers = os.cpu_count() or 1
+
+    budgets = HostBudgets({
+        "page": (page_rate, concurrency, page_rate * max_rate_factor),
+        "image": (image_rate, concurrency, image_rate * max_rate_factor),
+    })
+    # Create session for connection pooling (shared by both network stages)
+    session = create_session(pool_size=fetch_workers + image_workers)
+    window = threading.Semaphore(concurrency * PAGE_WINDOW_FACTOR)
+
+    fetch_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    parse_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    download_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    process_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    done_queue: queue.Queue = queue.Queue()
+
+    cpu_pool = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else None
+    parse_threads = max(parse_workers, 1)
+
+    def feed():
+        for seq, url in enumerate(urls):
+            window.acquire()
+            fetch_queue.put({"seq": seq, "url": url})
+        for _ in range(fetch_workers):
+            fetch_queue.put(DONE)
+
+    threading.Thread(target=feed, name="feed", daemon=True).start()
+    run_stage("fetch", partial(fetch_machine, session=session, budgets=budgets, state=state,
+                               run_id=run_id, full_refresh=full_refresh, cache=cache, metrics=metrics),
+              fetch_workers, fetch_queue, parse_queue, parse_threads, metrics)
+    run_stage("parse", partial(parse_machine, parse_pool=cpu_pool, parser=parser, metrics=metrics),
+              parse_threads, parse_queue, download_queue, image_workers, metrics)
+    run_stage("download", partial(download_machine_images, images_path=images_path, session=session,
+                                  budgets=budgets, state=state, cache=cache, store=image_store,
+                                  metrics=metrics),
+              image_workers, download_queue, process_queue, parse_threads, metrics)
+    run_stage("process", partial(process_machine_images, output_dir=output_dir, process_pool=cpu_pool,
+                                 image_sizes=image_sizes, state=state, run_id=run_id),
+              parse_threads, process_queue, done_queue, 1, metrics)
+
+    try:
+        # Reorder completed machines back into input order
+        completed: dict[int, dict] = {}
+        next_seq = 0
+        while True:
+            item = done_queue.get()
+            if item is DONE:
+                break
+            completed[item["seq"]] = item
+            while next_seq in completed:
+                item = completed.pop(next_seq)
+                next_seq += 1
+                window.release()
+                yield item["url"], item["machine_data"], item.get("error"), item["fetch_info"]["status"]
+    finally:
+        if cpu_pool:
+            cpu_pool.shutdown(cancel_futures=True)
+
+
+def scrape_machines(input_file: Optional[str], output_dir: str,
+                    concurrency: int = DEFAULT_CONCURRENCY,
+                    page_rate: float = DEFAULT_PAGE_RATE,
+                    image_rate: float = DEFAULT_IMAGE_RATE,
+                    state_db: Optional[str] = None,
+                    full_refresh: bool = False,
+                    restart: bool = False,
+                    cache_dir: Optional[str] = None,
+                    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+                    offline: bool = False,
+                    fetch_workers: Optional[int] = None,
+                    parse_workers: Optional[int] = None,
+                    image_workers: Optional[int] = None,
+                    queue_size: int = DEFAULT_QUEUE_SIZE,
+                    parser: str = DEFAULT_PARSER,
+                    image_store_dir: Optional[str] = None,
+                    image_sizes: Optional[tuple[int, int]] = (DEFAULT_MAX_DIMENSION,
+                                                               DEFAULT_THUMB_DIMENSION),
+                    frontier_db: Optional[str] = None,
+                    limit: Optional[int] = None,
+                    metrics: Optional[Metrics] = None,
+                    max_rate_factor: float = MAX_RATE_FACTOR,
+                    work_queue_db: Optional[str] = None,
+                    worker_id: Optional[str] = None,
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                    delta: bool = True,
+                    columnar: bool = False,
+                    site_origin: Optional[str] = None,
+                    gazetteer: Optional[str] = None,
+                    geocode_cache_db: Optional[str] = None) -> dict:
+    """Main scraping function.
+
+    Streams every record from `iter_machines` into `<output_dir>/machines.jsonl`
+    as it completes, then compacts that file into machines.json. Returns a
+    summary with the machine count, the errors and the output paths.
+
+    With `state_db`, pages are fetched conditionally, unchanged machines reuse
+    their stored record and images, and an interrupted run is resumed (unless
+    `restart`); a resumed run appends to the existing JSONL file.
+    `full_refresh` ignores stored validators and re-parses every page.
+
+    With `cache_dir`, every response is kept in an on-disk HTTP cache;
+    `offline` replays pages and images from that cache only, re-parsing every
+    page without any network I/O or rate limiting.
+
+    With `image_store_dir`, image bodies are stored once per SHA-256 and image
+    URLs already in the store are not downloaded again.
+
+    With `frontier_db`, URLs come from the discovery frontier (see
+    discover.py) instead of `input_file`: pending machines, new IDs first, at
+    most `limit` of them. Each machine is marked done or failed as it completes.
+
+    With `work_queue_db`, this run is one worker of a sharded scrape (see
+    work_queue.py): URLs are leased from the shared queue as `worker_id`, in
+    batches of `batch_size`, until none are left, and each job is completed
+    as its machine is. `output_dir` is then the worker's own shard, combined
+    with the others afterwards by merge_shards.py.
+
+    With `delta`, machines.json is also diffed against the last acknowledged
+    export into machines.delta.json (see delta_export.py); a frontier run counts as
+    partial, so machines it did not cover are not reported removed. Shards
+    get no delta of their own: merge_shards.py writes one for the merge.
+    With `columnar`, machines.json is also written as machines.col, a
+    memory-mappable columnar export (see columnar.py); shards get none either.
+
+    With `site_origin`, every URL is fetched from that origin instead, e.g.
+    the local stand-in site used for load tests (see benchmarks/load_test.py).
+
+    With `gazetteer`, machines whose page gave no coordinates are geocoded
+    from their address against that local gazetteer file, through the
+    persistent cache at `geocode_cache_db` (see geocode.py).
+
+    Worker counts, queue size, parser, image sizes, `metrics` and
+    `max_rate_factor` are passed through to `iter_machines`; machines are
+    also counted by status in `metrics`.
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    jsonl_path = output_path / JSONL_NAME
+    json_path = output_path / "machines.json"
+
+    frontier = None
+    work_queue = None
+    if work_queue_db:
+        work_queue = WorkQueue(work_queue_db)
+        worker_id = worker_id or default_worker_id()
+        stats = work_queue.stats()
+        print(f"Leasing URLs from work queue: {work_queue_db} as {worker_id} "
+              f"({stats['pending']} pending, {stats['expired']} expired leases)")
+        # Leased lazily in batches, so the total is not known up front
+        urls = work_queue.iter_urls(worker_id, batch_size, lease_seconds)
+        total = "?"
+    else:
+        if frontier_db:
+            frontier = Frontier(frontier_db)
+            print(f"Reading URLs from frontier: {frontier_db}")
+            urls = frontier.pending_urls(limit)
+        else:
+            # Extract URLs from input file
+            print(f"Reading URLs from: {input_file}")
+            urls = extract_urls_from_markdown(input_file)
+        total = len(urls)
+        print(f"Found {total} URLs to scrape")
+
+    if not work_queue and not urls:
+        print("No jihanki.sagase.com URLs to scrape.")
+        if frontier:
+            frontier.close()
+        return {"machines": 0, "errors": [], "jsonl_path": None, "json_path": None}
+    if site_origin:
+        print(f"Fetching from: {site_origin}")
+        urls = (with_origin(url, site_origin) for url in urls)
+
+    cache = None
+    if cache_dir:
+        cache = HttpCache(cache_dir, max_bytes=cache_max_bytes, offline=offline)
+        stats = cache.stats()
+        print(f"Cache: {cache_dir} ({stats['entries']} entries, {stats['bytes'] / 1e6:.1f} MB)"
+              + (" [offline]" if offline else ""))
+    if offline:
+        # Replaying the cache is for re-parsing; never short-circuit on stored hashes
+        full_refresh = True
+
+    image_store = None
+    if image_store_dir:
+        image_store = ImageStore(image_store_dir)
+        stats = image_store.stats()
+        print(f"Image store: {image_store_dir} ({stats['urls']} URLs, {stats['blobs']} blobs, "
+              f"{stats['bytes'] / 1e6:.1f} MB)")
+
+    geocoder = None
+    if gazetteer:
+        geocode_cache_db = geocode_cache_db or str(output_path / GEOCODE_CACHE_NAME)
+        geocoder = Geocoder(GeocodeCache(geocode_cache_db), GazetteerResolver(gazetteer))
+        stats = geocoder.cache.stats()
+        print(f"Gazetteer: {gazetteer} ({len(geocoder.resolver.entries)} addresses) | "
+              f"geocode cache: {geocode_cache_db} ({stats['entries']} addresses)")
+        if geocoder.resolver.conflicts:
+            print(f"  Warning: {geocoder.resolver.conflicts} gazetteer rows share an address key "
+                  f"with different coordinates; the first row of each was kept")
+
+    state = StateStore(state_db) if state_db else None
+    run_id = None
+    resumed = False
+    if state:
+        run_id, resumed = state.begin_run(restart=restart)
+        print(f"State: {state_db} ({'resuming' if resumed else 'starting'} run {run_id})")
+    counts = {"new": 0, "changed": 0, "unchanged": 0, "resumed": 0}
+
+    print(f"Concurrency: {concurrency} | page rate: {page_rate:.2f}/s | image rate: {image_rate:.2f}/s"
+          + (f" (adaptive, up to x{max_rate_factor:g})" if max_rate_factor > 1 else ""))
+    started = time.monotonic()
+
+    with JsonlWriter(str(jsonl_path), truncate=not resumed) as sink:
+        sink.write_run(datetime.now(timezone.utc).isoformat())
+        machines = iter_machines(
+            urls, output_dir, concurrency, page_rate, image_rate,
+            state, run_id, full_refresh, cache,
+            fetch_workers, parse_workers, image_workers, queue_size, parser, image_store, image_sizes,
+            metrics, max_rate_factor,
+        )
+        scraped = 0
+        for i, (url, machine_data, error, status) in enumerate(machines):
+            scraped += 1
+            print(f"\n[{i+1}/{total}] Scraping: {url}")
+            if frontier:
+                frontier.mark_machine(extract_machine_id(url), error)
+            if work_queue:
+                work_queue.complete(extract_machine_id(url), worker_id, error)
+            if metrics:
+                metrics.inc("machines_total", status="failed" if error else status)
+            if error:
+                print(f"  {error}, skipping")
+                sink.write_error(url, error)
+                continue
+
+            counts[status] += 1
+            if status in ("unchanged", "resumed"):
+                print(f"  {status.capitalize()}: {machine_data['name']}")
             print(f"  Name: {machine_data['name']}")
             print(f"  Address: {machine_data['location']['address']}")
+            if geocoder and geocoder.fill(machine_data):
+                print(f"  Geocoded from: {machine_data['location']['geocoded_from']}")
             if machine_data['location']['latitude']:
                 print(f"  Coordinates: {machine_data['location']['latitude']}, {machine_data['location']['longitude']}")
             if machine_data['merchandise']:
                 print(f"  Products: {', '.join(machine_data['merchandise'])}")
             print(f"  Found {len(machine_data['images'])} images")
-        except Exception as e:
-            print(f"  Error parsing page: {e}")
-            result["errors"].append({"url": url, "error": f"Parse error: {str(e)}"})
-            continue
-
-        # Download images
-        machine_images_dir = images_path / machine_id
-        for j, img_info in enumerate(machine_data["images"]):
-            img_url = img_info["url"]
-            ext = get_image_extension(img_url)
-            local_filename = f"{j+1}{ext}"
-            local_path = machine_images_dir / local_filename
-
-            print(f"    Downloading image {j+1}/{len(machine_data['images'])}...")
-            if download_image(img_url, local_path, session):
-                # Store relative path from output dir
-                img_info["local_path"] = f"images/{machine_id}/{local_filename}"
-            else:
-                print(f"    Failed to download: {img_url}")
-
-            time.sleep(REQUEST_DELAY / 2)  # Rate limit
-
-        result["machines"].append(machine_data)
-
-        # Rate limiting between pages (randomized to look more human)
-        if i < len(urls) - 1:
-            delay = REQUEST_DELAY + random.uniform(0, 1.5)
-            time.sleep(delay)
-
-    return result
-
-
-def save_results(data: dict, output_dir: str) -> str:
-    """Save results to JSON file."""
-    output_path = Path(output_dir) / "machines.json"
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    return str(output_path)
+            for img_info in machine_data["images"]:
+                if img_info.get("error"):
+                    print(f"    {img_info['error']}")
+                elif not img_info["local_path"]:
+                    print(f"    Failed to download: {img_info['url']}")
+
+            sink.write_machine(machine_data)
+
+    if frontier:
+        frontier.close()
+    if work_queue:
+        work_queue.close()
+    if cache:
+        cache.close()
+    if image_store:
+        image_store.close()
+    if geocoder:
+        geocoder.cache.close()
+        print(f"\nGeocoded: {geocoder.counts['resolved']} | unresolved: {geocoder.counts['unresolved']} "
+              f"({geocoder.counts['cached']} from cache, {geocoder.counts['looked_up']} looked up)")
+    if state:
+        state.finish_run(run_id)
+        state.close()
+        print(f"\nNew: {counts['new']} | changed: {counts['changed']} | "
+              f"unchanged: {counts['unchanged']} | resumed: {counts['resumed']}")
+    print(f"\nScraped {scraped} URLs in {time.monotonic() - started:.1f}s")
+
+    summary = compact_jsonl(str(jsonl_path), str(json_path))
+    summary.update(jsonl_path=str(jsonl_path), json_path=str(json_path), delta=None, columnar=None)
+    if delta and not work_queue:
+        summary["delta"] = write_delta(str(json_path), partial=frontier_db is not None,
+                                       image_store_dirs=[image_store_dir] if image_store_dir else [])
+    if columnar and not work_queue:
+        summary["columnar"] = write_columnar(str(json_path))
+    return summary
 
 
 def main():
@@ -403,54 +1018,332 @@ def main():
     )
     parser.add_argument(
         "input_file",
+        nargs="?",
         help="Markdown file containing jihanki.sagase.com URLs"
     )
+    parser.add_argument(
+        "--frontier",
+        help="Scrape pending machines from a discovery frontier (see discover.py) instead of a markdown file"
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="With --frontier, scrape at most this many machines"
+    )
+    parser.add_argument(
+        "--work-queue",
+        help="Run as one worker of a sharded scrape, leasing URLs from this shared queue (see work_queue.py)"
+    )
+    parser.add_argument(
+        "--worker-id",
+        help="With --work-queue, name of this worker; it writes to <output-dir>/shards/<worker-id> "
+             "(default: <hostname>-<pid>)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"With --work-queue, URLs to lease at a time (default: {DEFAULT_BATCH_SIZE})"
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help=f"With --work-queue, seconds before another worker may take over an unfinished lease "
+             f"(default: {DEFAULT_LEASE_SECONDS})"
+    )
     parser.add_argument(
         "--output-dir", "-o",
         default=DEFAULT_OUTPUT_DIR,
         help=f"Output directory (default: {DEFAULT_OUTPUT_DIR})"
     )
 
+    parser.add_argument(
+        "--concurrency", "-c",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Max in-flight requests per host for pages and for images (default: {DEFAULT_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--page-rate",
+        type=float,
+        default=DEFAULT_PAGE_RATE,
+        help=f"Page requests per second per host (default: {DEFAULT_PAGE_RATE:.2f})"
+    )
+    parser.add_argument(
+        "--image-rate",
+        type=float,
+        default=DEFAULT_IMAGE_RATE,
+        help=f"Image requests per second per host (default: {DEFAULT_IMAGE_RATE:.2f})"
+    )
+
+    parser.add_argument(
+        "--max-rate-factor",
+        type=float,
+        default=MAX_RATE_FACTOR,
+        help=f"Let healthy hosts be paced up to this multiple of --page-rate/--image-rate; "
+             f"1 never exceeds them (default: {MAX_RATE_FACTOR})"
+    )
+
+    parser.add_argument(
+        "--state-db",
+        help=f"SQLite scrape state for incremental runs (default: <output-dir>/{STATE_DB_NAME})"
+    )
+    parser.add_argument(
+        "--no-state",
+        action="store_true",
+        help="Do not read or write scrape state (always fetch and parse everything)"
+    )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Ignore stored ETag/Last-Modified and content hashes, re-parse every page"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Start a new run instead of resuming an interrupted one"
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        help="Keep an on-disk HTTP cache of pages and images in this directory"
+    )
+    parser.add_argument(
+        "--cache-size-mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help=f"HTTP cache size cap in MB, least recently used evicted first "
+             f"(default: {DEFAULT_MAX_BYTES // (1024 * 1024)})"
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help=f"Replay pages and images from the HTTP cache only "
+             f"(default cache: <output-dir>/{CACHE_DIR_NAME})"
+    )
+
+    parser.add_argument(
+        "--image-store",
+        help=f"Content-addressed image store shared by all machines "
+             f"(default: <output-dir>/{IMAGE_STORE_NAME})"
+    )
+    parser.add_argument(
+        "--no-image-store",
+        action="store_true",
+        help="Write every image file separately, without deduplication"
+    )
+
+    parser.add_argument(
+        "--max-image-size",
+        type=int,
+        default=DEFAULT_MAX_DIMENSION,
+        help=f"Longest side of the WebP variant of each image, in pixels (default: {DEFAULT_MAX_DIMENSION})"
+    )
+    parser.add_argument(
+        "--thumb-size",
+        type=int,
+        default=DEFAULT_THUMB_DIMENSION,
+        help=f"Longest side of each image thumbnail, in pixels (default: {DEFAULT_THUMB_DIMENSION})"
+    )
+    parser.add_argument(
+        "--no-image-processing",
+        action="store_true",
+        help="Do not verify images or write WebP variants and thumbnails"
+    )
+    parser.add_argument(
+        "--no-delta",
+        action="store_true",
+        help="Do not diff machines.json against the previous export into machines.delta.json"
+    )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Also write machines.col, a memory-mappable columnar export of machines.json"
+    )
+    parser.add_argument(
+        "--site-origin",
+        help="Fetch every URL from this origin instead, e.g. a local stand-in site (http://127.0.0.1:8000)"
+    )
+    parser.add_argument(
+        "--gazetteer",
+        help="Geocode machines without coordinates from this gazetteer CSV (see geocode.py)"
+    )
+    parser.add_argument(
+        "--geocode-cache",
+        help=f"Geocode cache database (default: <output-dir>/{GEOCODE_CACHE_NAME})"
+    )
+
+    parser.add_argument(
+        "--fetch-workers",
+        type=int,
+        help="Page fetch threads (default: --concurrency)"
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        help="HTML parser processes, 0 to parse in-process (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--image-workers",
+        type=int,
+        help="Image download threads (default: --concurrency)"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=f"Capacity of each queue between stages (default: {DEFAULT_QUEUE_SIZE})"
+    )
+
+    parser.add_argument(
+        "--parser",
+        choices=sorted(PARSERS),
+        default=DEFAULT_PARSER,
+        help=f"Page parser: BeautifulSoup or the faster lxml extractor (default: {DEFAULT_PARSER})"
+    )
+
+    parser.add_argument(
+        "--metrics-log",
+        help="Append one JSON line per request and stage error to this file"
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="Write run metrics in Prometheus text format to this file at the end (e.g. scrape.prom)"
+    )
+
     args = parser.parse_args()
+    if sum(source is not None for source in (args.input_file, args.frontier, args.work_queue)) != 1:
+        parser.error("give exactly one of an input file, --frontier or --work-queue")
+    if args.batch_size < 1 or args.lease_seconds <= 0:
+        parser.error("--batch-size must be at least 1 and --lease-seconds positive")
+    if args.limit is not None and args.limit < 1:
+        parser.error("--limit must be at least 1")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.page_rate <= 0 or args.image_rate <= 0:
+        parser.error("--page-rate and --image-rate must be positive")
+    if args.max_rate_factor < 1:
+        parser.error("--max-rate-factor must be at least 1")
+    if any(n is not None and n < 1 for n in (args.fetch_workers, args.image_workers)) or args.queue_size < 1:
+        parser.error("--fetch-workers, --image-workers and --queue-size must be at least 1")
+    if args.parse_workers is not None and args.parse_workers < 0:
+        parser.error("--parse-workers cannot be negative")
+    if args.max_image_size < 1 or args.thumb_size < 1:
+        parser.error("--max-image-size and --thumb-size must be at least 1")
 
     # Resolve paths relative to script location
     script_dir = Path(__file__).parent
-    input_file = Path(args.input_file)
+    input_file = Path(args.input_file or args.frontier or args.work_queue)
     if not input_file.is_absolute():
         input_file = script_dir / input_file
 
     output_dir = Path(args.output_dir)
     if not output_dir.is_absolute():
         output_dir = script_dir / output_dir
+    worker_id = args.worker_id or default_worker_id()
+    geocode_cache_db = None
+    if args.gazetteer:
+        # Shared by every worker of a sharded run, so an address is resolved once
+        geocode_cache_db = Path(args.geocode_cache) if args.geocode_cache else output_dir / GEOCODE_CACHE_NAME
+    if args.work_queue:
+        # Each worker has its own state, cache and output; merge_shards.py combines them
+        output_dir = output_dir / SHARDS_DIR_NAME / worker_id
+
+    state_db = None
+    if not args.no_state:
+        state_db = Path(args.state_db) if args.state_db else output_dir / STATE_DB_NAME
+
+    cache_dir = Path(args.cache_dir) if args.cache_dir else None
+    if args.offline and cache_dir is None:
+        cache_dir = output_dir / CACHE_DIR_NAME
+
+    image_store_dir = None
+    if not args.no_image_store:
+        image_store_dir = Path(args.image_store) if args.image_store else output_dir / IMAGE_STORE_NAME
 
     # Check input file exists
     if not input_file.exists():
         print(f"Error: Input file not found: {input_file}")
         sys.exit(1)
+    if args.gazetteer and not Path(args.gazetteer).is_file():
+        print(f"Error: Gazetteer not found: {args.gazetteer}")
+        sys.exit(1)
 
     print("=" * 50)
     print("Jihanki Sagase Scraper")
     print("=" * 50)
 
-    # Run scraper
-    results = scrape_machines(str(input_file), str(output_dir))
-
-    # Save results
-    json_path = save_results(results, str(output_dir))
-
-    # Print summary
-    print("\n" + "=" * 50)
-    print("SUMMARY")
-    print("=" * 50)
-    print(f"Total URLs processed: {len(results['machines']) + len(results['errors'])}")
-    print(f"Successfully scraped: {len(results['machines'])}")
-    print(f"Failed: {len(results['errors'])}")
-    print(f"Output saved to: {json_path}")
-
-    if results['errors']:
-        print("\nErrors:")
-        for err in results['errors']:
-            print(f"  - {err['url']}: {err['error']}")
+    metrics = Metrics(args.metrics_log)
+
+    # Metrics from an interrupted or failed run are still written out
+    try:
+        # Run scraper
+        results = scrape_machines(
+            str(input_file) if args.input_file else None,
+            str(output_dir),
+            concurrency=args.concurrency,
+            page_rate=args.page_rate,
+            image_rate=args.image_rate,
+            state_db=str(state_db) if state_db else None,
+            full_refresh=args.full_refresh,
+            restart=args.restart,
+            cache_dir=str(cache_dir) if cache_dir else None,
+            cache_max_bytes=args.cache_size_mb * 1024 * 1024,
+            offline=args.offline,
+            fetch_workers=args.fetch_workers,
+            parse_workers=args.parse_workers,
+            image_workers=args.image_workers,
+            queue_size=args.queue_size,
+            parser=args.parser,
+            image_store_dir=str(image_store_dir) if image_store_dir else None,
+            image_sizes=None if args.no_image_processing else (args.max_image_size, args.thumb_size),
+            frontier_db=str(input_file) if args.frontier else None,
+            limit=args.limit,
+            metrics=metrics,
+            max_rate_factor=args.max_rate_factor,
+            work_queue_db=str(input_file) if args.work_queue else None,
+            worker_id=worker_id,
+            batch_size=args.batch_size,
+            lease_seconds=args.lease_seconds,
+            delta=not args.no_delta,
+            columnar=args.columnar,
+            site_origin=args.site_origin,
+            gazetteer=args.gazetteer,
+            geocode_cache_db=str(geocode_cache_db) if geocode_cache_db else None,
+        )
+
+        # Print summary
+        print("\n" + "=" * 50)
+        print("SUMMARY")
+        print("=" * 50)
+        print(f"Total URLs processed: {results['machines'] + len(results['errors'])}")
+        print(f"Successfully scraped: {results['machines']}")
+        print(f"Failed: {len(results['errors'])}")
+        if results['json_path']:
+            print(f"Records streamed to: {results['jsonl_path']}")
+            print(f"Output saved to: {results['json_path']}")
+        if results.get('delta'):
+            print(delta_summary(results['delta']))
+        if results.get('columnar'):
+            columnar = results['columnar']
+            print(f"Columnar export: {columnar['columnar_path']} ({columnar['columnar_bytes'] / 1e6:.1f} MB, "
+                  f"machines.json {columnar['json_bytes'] / 1e6:.1f} MB)")
+
+        if results['errors']:
+            print("\nErrors:")
+            for err in results['errors']:
+                print(f"  - {err['url']}: {err['error']}")
+
+        print("\n" + "=" * 50)
+        print("METRICS")
+        print("=" * 50)
+        print(metrics.summary())
+    finally:
+        if args.metrics_file:
+            metrics.write_prometheus(args.metrics_file)
+            print(f"Metrics written to: {args.metrics_file}")
+        metrics.close()
 
 
 if __name__ == "__main__":
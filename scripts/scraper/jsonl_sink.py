@@ -0,0 +1,234 @@
+"""
+Append-only JSONL sink for scrape results, and compaction to machines.json.
+
+Each line is one JSON object with a "type":
+
+    {"type": "run", "scraped_at": "...", "source": "jihanki.sagase.com"}
+    {"type": "machine", "data": {...machine record...}}
+    {"type": "error", "url": "...", "error": "..."}
+
+Every line is flushed and fsynced as it is written, so a crash loses at most
+the record in flight. A resumed run appends to the same file; compaction keeps
+the last record per source_id and produces the machines.json document that
+seed-machines.ts reads, without holding all records in memory. The JSONL
+files of several scrape shards can be merged into one machines.json the same
+way (see merge_shards.py).
+
+Usage:
+    python jsonl_sink.py ../output/machines.jsonl ../output/machines.json
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+SOURCE = "jihanki.sagase.com"
+
+
+class JsonlWriter:
+    """Appends scrape events to a JSONL file, one durable line at a time."""
+
+    def __init__(self, path: str, truncate: bool = False):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._file = open(path, "w" if truncate else "a", encoding="utf-8")
+
+    def _write(self, event: dict) -> None:
+        self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def write_run(self, scraped_at: str, source: str = SOURCE) -> None:
+        self._write({"type": "run", "scraped_at": scraped_at, "source": source})
+
+    def write_machine(self, record: dict) -> None:
+        self._write({"type": "machine", "data": record})
+
+    def write_error(self, url: str, error: str) -> None:
+        self._write({"type": "error", "url": url, "error": error})
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _index_jsonl(path: str) -> tuple[Optional[dict], dict[str, int], dict[str, int]]:
+    """One pass over the file: first run header, and byte offsets of the last
+    record per source_id and last error per URL, in first-seen order."""
+    header = None
+    machines: dict[str, int] = {}
+    errors: dict[str, int] = {}
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            event = json.loads(line)
+            kind = event.get("type")
+            if kind == "run" and header is None:
+                header = event
+            elif kind == "machine":
+                machines[event["data"]["source_id"]] = offset
+            elif kind == "error":
+                errors[event["url"]] = offset
+            offset += len(line)
+    return header, machines, errors
+
+
+def _read_at(f, offset: int) -> dict:
+    f.seek(offset)
+    return json.loads(f.readline())
+
+
+def _indented(value, level: int) -> str:
+    """json.dumps(indent=2) of `value`, as it would appear nested `level` deep."""
+    text = json.dumps(value, ensure_ascii=False, indent=2)
+    return text.replace("\n", "\n" + "  " * level)
+
+
+def _write_document(out, scraped_at: Optional[str], source: str, records: Iterator[dict]) -> tuple[int, set]:
+    """Write the head of machines.json and its machines array. Returns the
+    record count and the source URLs written."""
+    out.write("{\n")
+    out.write(f'  "scraped_at": {json.dumps(scraped_at)},\n')
+    out.write(f'  "source": {json.dumps(source, ensure_ascii=False)},\n')
+
+    out.write('  "machines": [')
+    scraped_urls = set()
+    count = 0
+    for record in records:
+        scraped_urls.add(record["source_url"])
+        out.write(",\n    " if count else "\n    ")
+        out.write(_indented(record, 2))
+        count += 1
+    out.write("\n  ],\n" if count else "],\n")
+    return count, scraped_urls
+
+
+def compact_jsonl(jsonl_path: str, json_path: str) -> dict:
+    """Write machines.json from a JSONL results file.
+
+    Keeps the last record per source_id and drops errors for URLs that were
+    later scraped successfully. The output is byte-identical to
+    `json.dump(result, f, ensure_ascii=False, indent=2)`, but records are
+    streamed from the JSONL file one at a time. Returns counts and the errors.
+    """
+    header, machine_offsets, error_offsets = _index_jsonl(jsonl_path)
+    scraped_at = header["scraped_at"] if header else None
+    source = header["source"] if header else SOURCE
+
+    tmp_path = f"{json_path}.tmp"
+    errors = []
+    with open(jsonl_path, "rb") as src, open(tmp_path, "w", encoding="utf-8") as out:
+        records = (_read_at(src, offset)["data"] for offset in machine_offsets.values())
+        count, scraped_urls = _write_document(out, scraped_at, source, records)
+
+        for offset in error_offsets.values():
+            event = _read_at(src, offset)
+            if event["url"] not in scraped_urls:
+                errors.append({"url": event["url"], "error": event["error"]})
+        out.write(f'  "errors": {_indented(errors, 1)}\n')
+        out.write("}")
+    os.replace(tmp_path, json_path)
+
+    return {"machines": count, "errors": errors}
+
+
+def _downloaded_images(record: dict) -> int:
+    return sum(1 for image in record.get("images", []) if image.get("local_path"))
+
+
+def _source_order(source_id: str) -> tuple:
+    return (0, int(source_id), "") if source_id.isdigit() else (1, 0, source_id)
+
+
+def merge_jsonl(jsonl_paths: list[str], json_path: str) -> dict:
+    """Write one machines.json from the JSONL files of several scrape shards.
+
+    A machine scraped by more than one shard (a lease that expired while its
+    worker was still busy, or shards from separate runs) keeps the record
+    from the most recent run, then the one with more downloaded images, then
+    the one from the earliest shard in `jsonl_paths`. Machines are written in
+    source_id order so the output does not depend on how work was split;
+    errors are kept only for URLs no shard scraped. `scraped_at` is that of
+    the latest run. Returns counts, the errors and the winning shard index
+    per source_id.
+    """
+    # source_id -> (sort key, shard index, byte offset)
+    best: dict[str, tuple[tuple, int, int]] = {}
+    error_offsets: dict[str, tuple[int, int]] = {}
+    scraped_at = None
+    source = SOURCE
+    for shard, path in enumerate(jsonl_paths):
+        run_at = ""
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                event = json.loads(line)
+                kind = event.get("type")
+                if kind == "run":
+                    run_at = event.get("scraped_at") or ""
+                    source = event.get("source", source)
+                    if scraped_at is None or run_at > scraped_at:
+                        scraped_at = run_at
+                elif kind == "machine":
+                    record = event["data"]
+                    key = (run_at, _downloaded_images(record), -shard)
+                    # Within a shard the last record wins, as in compact_jsonl
+                    current = best.get(record["source_id"])
+                    if current is None or key >= current[0]:
+                        best[record["source_id"]] = (key, shard, offset)
+                elif kind == "error":
+                    error_offsets[event["url"]] = (shard, offset)
+                offset += len(line)
+
+    sources = [open(path, "rb") for path in jsonl_paths]
+    tmp_path = f"{json_path}.tmp"
+    errors = []
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            records = (
+                _read_at(sources[best[source_id][1]], best[source_id][2])["data"]
+                for source_id in sorted(best, key=_source_order)
+            )
+            count, scraped_urls = _write_document(out, scraped_at, source, records)
+
+            for url in sorted(error_offsets):
+                shard, offset = error_offsets[url]
+                event = _read_at(sources[shard], offset)
+                if url not in scraped_urls:
+                    errors.append({"url": url, "error": event["error"]})
+            out.write(f'  "errors": {_indented(errors, 1)}\n')
+            out.write("}")
+    finally:
+        for f in sources:
+            f.close()
+    os.replace(tmp_path, json_path)
+
+    owners = {source_id: shard for source_id, (_, shard, _) in best.items()}
+    return {"machines": count, "errors": errors, "owners": owners}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compact a machines.jsonl results file into machines.json"
+    )
+    parser.add_argument("jsonl_file", help="JSONL file written by jihanki_scraper.py")
+    parser.add_argument("json_file", help="machines.json to write")
+    args = parser.parse_args()
+
+    summary = compact_jsonl(args.jsonl_file, args.json_file)
+    print(f"Wrote {summary['machines']} machines and {len(summary['errors'])} errors to {args.json_file}")
+
+
+if __name__ == "__main__":
+    main()
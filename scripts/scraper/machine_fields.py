@@ -0,0 +1,188 @@
+"""
+Field extraction rules shared by the BeautifulSoup and lxml page parsers.
+
+Both parsers locate the same pieces of a jihanki.sagase.com machine page
+(info table rows, headings, scripts, map attributes, images) and hand the
+raw strings to these helpers, so the records they build are identical.
+Regexes are compiled once at import time.
+"""
+
+import re
+from typing import Optional
+from urllib.parse import urljoin
+
+# Coordinates in inline scripts, e.g. `lat: 35.123, lng: 139.456` or `LatLng(35.1, 139.4)`
+SCRIPT_LAT_PATTERN = re.compile(r'lat[itude]*["\']?\s*[:=]\s*([0-9.]+)')
+SCRIPT_LNG_PATTERN = re.compile(r'(?:lng|lon)[gitude]*["\']?\s*[:=]\s*([0-9.]+)')
+SCRIPT_LATLNG_PATTERN = re.compile(r'LatLng\s*\(\s*([0-9.]+)\s*,\s*([0-9.]+)\s*\)')
+
+# Google Maps iframe src: `?q=lat,lng` (most common on jihanki.sagase.com) or `!2d<lng>!3d<lat>`
+IFRAME_Q_PATTERN = re.compile(r'[?&]q=(-?[0-9.]+),(-?[0-9.]+)')
+IFRAME_EMBED_PATTERN = re.compile(r'!2d(-?[0-9.]+)!3d(-?[0-9.]+)')
+
+LIST_SEPARATOR_PATTERN = re.compile(r'[、,・\n/]')
+QUOTED_NAME_PATTERN = re.compile(r'「(.+?)」')
+TITLE_SUFFIX_PATTERN = re.compile(r'\s*[-|].*$')
+PREFECTURE_PATTERN = re.compile(r'〒?\d{3}-?\d{4}\s*[東京都北海道大阪府京都府].+?[0-9０-９\-ー]+')
+
+MACHINE_IMAGE_PATH = '/uploads/jihanki/'
+FALLBACK_IMAGE_SELECTORS = [
+    '.post_content img',
+    'article img',
+    '.content img',
+    'main img',
+]
+SKIPPED_IMAGE_WORDS = ['icon', 'logo', 'avatar', 'button', 'arrow', 'sprite', 'gravatar']
+
+
+def empty_record(url: str, machine_id: str) -> dict:
+    return {
+        "source_id": machine_id,
+        "source_url": url,
+        "name": None,
+        "location": {
+            "address": None,
+            "latitude": None,
+            "longitude": None
+        },
+        "merchandise": [],
+        "categories": [],
+        "features": [],
+        "images": []
+    }
+
+
+def split_list(value: str) -> list[str]:
+    items = LIST_SEPARATOR_PATTERN.split(value)
+    return [item.strip() for item in items if item.strip()]
+
+
+def apply_info_row(data: dict, label: str, value: str) -> None:
+    """Apply one row of the info table (自販機名, 所在地, 商品, ジャンル, ...)."""
+    if '自販機名' in label:
+        data["name"] = value
+    elif '所在地' in label or '住所' in label:
+        data["location"]["address"] = value
+    elif label == '商品':
+        # Actual product sold (e.g., 煎餅, うどん)
+        data["merchandise"] = split_list(value)
+    elif 'ジャンル' in label or 'カテゴリ' in label:
+        # Categories/genres
+        data["categories"] = split_list(value)
+    elif '特徴' in label:
+        if value:
+            data["features"].append(value)
+
+
+def name_from_heading(text: str) -> Optional[str]:
+    """Name from an h1 like 「XXX」の詳細情報, or the whole heading if short."""
+    match = QUOTED_NAME_PATTERN.search(text)
+    if match:
+        return match.group(1)
+    if text and len(text) < 200:
+        return text
+    return None
+
+
+def name_from_title(text: str) -> Optional[str]:
+    """Name from a <title>, dropping a trailing ` - site` / ` | site` suffix."""
+    match = QUOTED_NAME_PATTERN.search(text)
+    if match:
+        return match.group(1)
+    title = TITLE_SUFFIX_PATTERN.sub('', text)
+    return title or None
+
+
+def is_address_text(text: str) -> bool:
+    return bool(PREFECTURE_PATTERN.search(text)) and len(text) < 100
+
+
+def coordinates_from_script(text: str) -> tuple[Optional[float], Optional[float]]:
+    """Find lat/lng in one script body, or (None, None)."""
+    lat_match = SCRIPT_LAT_PATTERN.search(text)
+    lng_match = SCRIPT_LNG_PATTERN.search(text)
+    if lat_match and lng_match:
+        try:
+            return float(lat_match.group(1)), float(lng_match.group(1))
+        except ValueError:
+            pass
+
+    latlng_match = SCRIPT_LATLNG_PATTERN.search(text)
+    if latlng_match:
+        try:
+            return float(latlng_match.group(1)), float(latlng_match.group(2))
+        except ValueError:
+            pass
+    return None, None
+
+
+def may_contain_coordinates(text: str) -> bool:
+    """Cheap pre-check: every script coordinate pattern needs one of these substrings."""
+    return 'lat' in text or 'LatLng' in text
+
+
+def apply_map_attributes(data: dict, lat: Optional[str], lng: Optional[str]) -> None:
+    """Apply data-lat/data-lng (or data-latitude/data-longitude) from a map element."""
+    if lat and lng:
+        try:
+            data["location"]["latitude"] = float(lat)
+            data["location"]["longitude"] = float(lng)
+        except ValueError:
+            pass
+
+
+def apply_iframe_src(data: dict, src: str) -> None:
+    """Apply coordinates from a Google Maps iframe src."""
+    coord_match = IFRAME_Q_PATTERN.search(src)
+    if coord_match:
+        try:
+            data["location"]["latitude"] = float(coord_match.group(1))
+            data["location"]["longitude"] = float(coord_match.group(2))
+        except ValueError:
+            pass
+    else:
+        coord_match = IFRAME_EMBED_PATTERN.search(src)
+        if coord_match:
+            try:
+                data["location"]["longitude"] = float(coord_match.group(1))
+                data["location"]["latitude"] = float(coord_match.group(2))
+            except ValueError:
+                pass
+
+
+def image_source(get) -> Optional[str]:
+    """The image URL of an <img>, given its attribute getter."""
+    return get('src') or get('data-src') or get('data-lazy-src')
+
+
+def add_machine_image(data: dict, found: set, page_url: str, src: str) -> None:
+    """Add an image if it lives in the jihanki uploads folder."""
+    img_url = urljoin(page_url, src)
+    if MACHINE_IMAGE_PATH in img_url and img_url not in found:
+        found.add(img_url)
+        data["images"].append({
+            "url": img_url,
+            "local_path": None
+        })
+
+
+def add_fallback_image(data: dict, found: set, page_url: str, src: str,
+                       width: Optional[str], height: Optional[str]) -> None:
+    """Add a generic content image, skipping icons, logos and tiny images."""
+    img_url = urljoin(page_url, src)
+    # Skip small icons, logos, navigation elements
+    if any(x in img_url.lower() for x in SKIPPED_IMAGE_WORDS):
+        return
+    # Skip very small images
+    if width and height:
+        try:
+            if int(width) < 100 or int(height) < 100:
+                return
+        except ValueError:
+            pass
+    if img_url not in found:
+        found.add(img_url)
+        data["images"].append({
+            "url": img_url,
+            "local_path": None
+        })
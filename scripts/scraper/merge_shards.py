@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Merge the output of sharded scraper workers into one machines.json.
+
+Each worker started with `--work-queue` writes to its own shard directory,
+`<output-dir>/shards/<worker-id>/`, with a machines.jsonl and images/. This
+combines the shards' JSONL files into `<output-dir>/machines.json` (see
+`merge_jsonl` for how machines scraped by several workers are resolved) and
+hardlinks each machine's images from the shard whose record was kept into
+`<output-dir>/images/<machine_id>/` (replacing what it held), copying where
+hardlinks are unsupported. The merged machines.json is then diffed against the
+previous export into machines.delta.json (see delta_export.py).
+
+Usage:
+    python merge_shards.py [../output/shards] [../output] [--partial] [--no-delta] [--columnar]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from columnar import write_columnar
+from delta_export import delta_summary, write_delta
+from jihanki_scraper import DEFAULT_OUTPUT_DIR, IMAGE_STORE_NAME, JSONL_NAME, SHARDS_DIR_NAME
+from jsonl_sink import merge_jsonl
+
+
+def shard_dirs(shards_path: Path) -> list[Path]:
+    """Shard directories with results, in name order."""
+    return sorted(path for path in shards_path.iterdir() if (path / JSONL_NAME).is_file())
+
+
+def link_images(source: Path, dest: Path) -> int:
+    """Hardlink (or copy) every file in `source` into `dest`, replacing what
+    `dest` held before, so no image of an older run or of a shard whose record
+    lost the merge is left behind. Returns the file count."""
+    staging = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    count = 0
+    for path in sorted(source.iterdir()):
+        if not path.is_file():
+            continue
+        count += 1
+        try:
+            os.link(path, staging / path.name)
+        except OSError:
+            shutil.copyfile(path, staging / path.name)
+    remove_images(dest)
+    os.replace(staging, dest)
+    return count
+
+
+def remove_images(dest: Path) -> None:
+    """Remove an images/<machine_id>/ directory, if there is one."""
+    if dest.is_dir():
+        old = dest.with_name(f".{dest.name}.{os.getpid()}.old")
+        os.replace(dest, old)
+        shutil.rmtree(old)
+
+
+def merge_shards(shards: list[Path], output_dir: Path) -> dict:
+    """Merge `shards` into `output_dir`. Returns the merge summary plus the image count."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    summary = merge_jsonl([str(shard / JSONL_NAME) for shard in shards], str(output_dir / "machines.json"))
+    images = 0
+    for source_id, shard in summary["owners"].items():
+        source = shards[shard] / "images" / source_id
+        if source.is_dir():
+            images += link_images(source, output_dir / "images" / source_id)
+        else:
+            remove_images(output_dir / "images" / source_id)
+    summary["images"] = images
+    return summary
+
+
+def main():
+    script_dir = Path(__file__).parent
+    default_output = script_dir / DEFAULT_OUTPUT_DIR
+
+    parser = argparse.ArgumentParser(description="Merge sharded scraper output into one machines.json")
+    parser.add_argument(
+        "shards_dir",
+        nargs="?",
+        default=str(default_output / SHARDS_DIR_NAME),
+        help=f"Directory of worker shards (default: {DEFAULT_OUTPUT_DIR}/{SHARDS_DIR_NAME})"
+    )
+    parser.add_argument(
+        "output_dir",
+        nargs="?",
+        default=str(default_output),
+        help=f"Where to write machines.json and images/ (default: {DEFAULT_OUTPUT_DIR})"
+    )
+    parser.add_argument(
+        "--partial",
+        action="store_true",
+        help="The queue held only some machines: do not report the others as removed in the delta"
+    )
+    parser.add_argument("--no-delta", action="store_true", help="Do not write machines.delta.json")
+    parser.add_argument("--columnar", action="store_true", help="Also write machines.col (see columnar.py)")
+    args = parser.parse_args()
+
+    shards_path = Path(args.shards_dir)
+    if not shards_path.is_dir():
+        print(f"Error: shards directory not found: {shards_path}")
+        sys.exit(1)
+    shards = shard_dirs(shards_path)
+    if not shards:
+        print(f"Error: no shard in {shards_path} has a {JSONL_NAME}")
+        sys.exit(1)
+
+    output_dir = Path(args.output_dir)
+    summary = merge_shards(shards, output_dir)
+    print(f"Merged {len(shards)} shards: {summary['machines']} machines, {summary['images']} images, "
+          f"{len(summary['errors'])} errors -> {output_dir / 'machines.json'}")
+    for index, shard in enumerate(shards):
+        kept = sum(1 for owner in summary["owners"].values() if owner == index)
+        print(f"  {shard.name}: {kept} machines")
+    if not args.no_delta:
+        delta = write_delta(str(output_dir / "machines.json"), partial=args.partial,
+                            image_store_dirs=[str(shard / IMAGE_STORE_NAME) for shard in shards])
+        print(delta_summary(delta))
+    if args.columnar:
+        columnar = write_columnar(str(output_dir / "machines.json"))
+        print(f"Columnar export: {columnar['rows']} machines -> {columnar['columnar_path']}")
+
+
+if __name__ == "__main__":
+    main()
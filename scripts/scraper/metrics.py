@@ -0,0 +1,256 @@
+"""
+Run metrics for the scraper: counters and histograms, JSON event logs, and
+a Prometheus textfile and summary report at the end of a run.
+
+A single `Metrics` object is shared by all scraper threads. Every HTTP
+request is recorded with its latency, bytes, status and error type; pipeline
+stages record their time per item. With `log_path`, each request and stage
+error is also written as one JSON line as it happens, for ad hoc analysis:
+
+    {"ts": 1718000000.1, "event": "request", "kind": "page", "url": "...",
+     "status": 200, "seconds": 0.412, "bytes": 48213, "attempt": 1}
+
+`write_prometheus` writes everything in the Prometheus text format (for the
+node_exporter textfile collector or a one-off look), and `summary` renders
+the numbers that matter for tuning concurrency and rate limits.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+PREFIX = "jihanki_scraper"
+# Seconds; covers cache hits through slow image downloads
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    "requests_total": "HTTP requests by kind and outcome (status code or error type)",
+    "request_seconds": "HTTP request latency, including the body download",
+    "request_bytes_total": "Response body bytes received",
+    "retries_total": "Request attempts after the first",
+    "errors_total": "Failed request attempts by error type",
+    "cache_hits_total": "Responses served from the HTTP cache or image store without a request",
+    "stage_seconds": "Time spent on one item in a pipeline stage",
+    "stage_errors_total": "Items that failed in a pipeline stage",
+    "parse_seconds": "Time to parse one machine page",
+    "machines_total": "Machines completed by status",
+    "run_seconds": "Wall time of the run",
+}
+
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus exposes them."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        lower_bound, lower_count = 0.0, 0
+        for bound, cumulative in zip(self.buckets, self.counts):
+            if cumulative >= rank:
+                if cumulative == lower_count:
+                    return bound
+                return lower_bound + (bound - lower_bound) * (rank - lower_count) / (cumulative - lower_count)
+            lower_bound, lower_count = bound, cumulative
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Thread-safe registry of counters and histograms, with an optional JSON event log."""
+
+    def __init__(self, log_path: Optional[str] = None):
+        self.started = time.monotonic()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._lock = threading.Lock()
+        self._log = None
+        if log_path:
+            Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+            self._log = open(log_path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log:
+                self._log.close()
+                self._log = None
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _key(labels)
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def log(self, event: str, **fields) -> None:
+        """Append one JSON event line to the log, if there is one."""
+        if self._log is None:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, ensure_ascii=False)
+        with self._lock:
+            if self._log:
+                self._log.write(line + "\n")
+                self._log.flush()
+
+    def request(self, kind: str, url: str, attempt: int, seconds: float,
+                status: Optional[int] = None, nbytes: int = 0, error: Optional[Exception] = None) -> None:
+        """Record one HTTP request attempt (`attempt` counts from 1). An attempt
+        with an `error` is a failure even if it got a status code."""
+        if status is None and error is None:
+            raise ValueError("a request needs a status or an error")
+        # HTTP errors are counted by status code, everything else (including a
+        # body cut off after a 200) by exception type
+        outcome = str(status) if status and (error is None or status >= 400) else type(error).__name__
+        self.inc("requests_total", kind=kind, outcome=outcome)
+        self.observe("request_seconds", seconds, kind=kind)
+        if nbytes:
+            self.inc("request_bytes_total", nbytes, kind=kind)
+        if attempt > 1:
+            self.inc("retries_total", kind=kind)
+        if error:
+            self.inc("errors_total", kind=kind, type=outcome)
+        self.log("request", kind=kind, url=url, status=status, seconds=round(seconds, 4), bytes=nbytes,
+                 attempt=attempt, error=str(error) if error else None)
+
+    # Reading
+
+    def counter(self, name: str, **labels) -> float:
+        """Sum of a counter over every series matching `labels`."""
+        with self._lock:
+            return sum(
+                value for key, value in self._counters.get(name, {}).items()
+                if all(pair in key for pair in labels.items())
+            )
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        """Merge of every series of a histogram matching `labels`, or None."""
+        with self._lock:
+            matching = [
+                h for key, h in self._histograms.get(name, {}).items()
+                if all(pair in key for pair in labels.items())
+            ]
+        if not matching:
+            return None
+        merged = Histogram(matching[0].buckets)
+        for h in matching:
+            merged.count += h.count
+            merged.sum += h.sum
+            merged.counts = [a + b for a, b in zip(merged.counts, h.counts)]
+        return merged
+
+    def label_values(self, name: str, label: str) -> list[str]:
+        with self._lock:
+            series = list(self._counters.get(name, {})) + list(self._histograms.get(name, {}))
+        return sorted({value for key in series for k, value in key if k == label})
+
+    # Export
+
+    def write_prometheus(self, path: str) -> None:
+        """Write every metric in the Prometheus text exposition format, atomically."""
+        lines = [
+            f"# HELP {PREFIX}_run_seconds {HELP['run_seconds']}",
+            f"# TYPE {PREFIX}_run_seconds gauge",
+            f"{PREFIX}_run_seconds {time.monotonic() - self.started:.3f}",
+        ]
+        with self._lock:
+            for name in sorted(set(self._counters) | set(self._histograms)):
+                full_name = f"{PREFIX}_{name}"
+                if name in HELP:
+                    lines.append(f"# HELP {full_name} {HELP[name]}")
+                if name in self._counters:
+                    lines.append(f"# TYPE {full_name} counter")
+                    for key, value in sorted(self._counters[name].items()):
+                        lines.append(f"{full_name}{_format_labels(key)} {value:g}")
+                else:
+                    lines.append(f"# TYPE {full_name} histogram")
+                    for key, h in sorted(self._histograms[name].items()):
+                        for bound, count in zip(h.buckets, h.counts):
+                            lines.append(f"{full_name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count}")
+                        lines.append(f"{full_name}_bucket{_format_labels(key, ('le', '+Inf'))} {h.count}")
+                        lines.append(f"{full_name}_sum{_format_labels(key)} {h.sum:.6f}")
+                        lines.append(f"{full_name}_count{_format_labels(key)} {h.count}")
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def summary(self) -> str:
+        """Human-readable report of request, stage and parse metrics."""
+        lines = [f"Run time: {time.monotonic() - self.started:.1f}s"]
+
+        for kind in self.label_values("requests_total", "kind"):
+            total = self.counter("requests_total", kind=kind)
+            errors = self.counter("errors_total", kind=kind)
+            retries = self.counter("retries_total", kind=kind)
+            nbytes = self.counter("request_bytes_total", kind=kind)
+            latency = self.histogram("request_seconds", kind=kind)
+            lines.append(
+                f"{kind.capitalize()} requests: {total:g} ({errors:g} failed, {retries:g} retries), "
+                f"latency p50 {latency.quantile(0.5):.2f}s p95 {latency.quantile(0.95):.2f}s, "
+                f"{nbytes / 1e6:.1f} MB"
+            )
+            if nbytes and latency.sum:
+                lines.append(f"  throughput {nbytes / 1e6 / latency.sum:.2f} MB/s per request, "
+                             f"{nbytes / 1e6 / max(time.monotonic() - self.started, 1e-9):.2f} MB/s overall")
+            for error_type in self.label_values("errors_total", "type"):
+                count = self.counter("errors_total", kind=kind, type=error_type)
+                if count:
+                    lines.append(f"  {error_type}: {count:g}")
+
+        for kind in self.label_values("cache_hits_total", "kind"):
+            lines.append(f"Cache hits ({kind}): {self.counter('cache_hits_total', kind=kind):g}")
+
+        parse = self.histogram("parse_seconds")
+        if parse:
+            lines.append(f"Parsed {parse.count} pages, avg {parse.sum / parse.count * 1000:.0f} ms, "
+                         f"p95 {parse.quantile(0.95) * 1000:.0f} ms")
+
+        for stage in self.label_values("stage_seconds", "stage"):
+            h = self.histogram("stage_seconds", stage=stage)
+            failed = self.counter("stage_errors_total", stage=stage)
+            lines.append(f"Stage {stage}: {h.count} items, {h.sum:.1f}s busy, "
+                         f"avg {h.sum / h.count:.3f}s, p95 {h.quantile(0.95):.2f}s"
+                         + (f", {failed:g} failed" if failed else ""))
+
+        statuses = self.label_values("machines_total", "status")
+        if statuses:
+            lines.append("Machines: " + ", ".join(
+                f"{status} {self.counter('machines_total', status=status):g}" for status in statuses
+            ))
+        return "\n".join(lines)
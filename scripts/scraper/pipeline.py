@@ -0,0 +1,64 @@
+"""
+Minimal staged pipeline: worker threads connected by bounded queues.
+
+Each stage pulls dict items from its inbox, applies a function and pushes
+the result to its outbox. Bounded queues give backpressure: a slow stage
+fills its inbox and the stage feeding it blocks. Items that already carry an
+"error" pass through later stages untouched, so every input item reaches
+the end of the pipeline exactly once.
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from metrics import Metrics
+
+DONE = object()  # end-of-stream marker, one per downstream worker
+
+
+def run_stage(name: str, fn: Callable[[dict], dict], workers: int,
+              inbox: queue.Queue, outbox: queue.Queue, downstream_workers: int,
+              metrics: Optional[Metrics] = None) -> list[threading.Thread]:
+    """Start `workers` threads applying `fn` to items from `inbox`.
+
+    When the last worker sees DONE, it forwards one DONE per downstream worker.
+    An exception from `fn` is recorded on the item as "<name> error: ...".
+    With `metrics`, the time `fn` takes per item and failed items are recorded.
+    """
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = inbox.get()
+            if item is DONE:
+                break
+            if not item.get("error"):
+                started = time.perf_counter()
+                try:
+                    item = fn(item)
+                except Exception as e:
+                    item["error"] = f"{name.capitalize()} error: {e}"
+                if metrics:
+                    metrics.observe("stage_seconds", time.perf_counter() - started, stage=name)
+                    if item.get("error"):
+                        metrics.inc("stage_errors_total", stage=name)
+                        metrics.log("stage_error", stage=name, url=item.get("url"), error=item["error"])
+            outbox.put(item)
+
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(downstream_workers):
+                outbox.put(DONE)
+
+    threads = [
+        threading.Thread(target=worker, name=f"{name}-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
@@ -0,0 +1,147 @@
+"""
+Persistent scrape state, keyed by source_id.
+
+Stores HTTP validators (ETag / Last-Modified), a content hash and the last
+parsed record for every machine, plus per-image download status. Each scraper
+invocation is a "run"; a run that never finished (crash, Ctrl-C) is picked up
+again by the next invocation so completed machines are not fetched twice.
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS machines (
+    source_id TEXT PRIMARY KEY,
+    source_url TEXT NOT NULL,
+    fetched_at TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    record TEXT,
+    run_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS images (
+    source_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    local_path TEXT,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (source_id, url)
+);
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class StateStore:
+    """SQLite-backed scrape state. Safe to share between scraper threads."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # Runs
+
+    def begin_run(self, restart: bool = False) -> tuple[int, bool]:
+        """Return (run_id, resumed). Reuses the latest unfinished run unless `restart`."""
+        with self._lock, self._conn:
+            if not restart:
+                row = self._conn.execute(
+                    "SELECT id FROM runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1"
+                ).fetchone()
+                if row:
+                    return row["id"], True
+            cur = self._conn.execute("INSERT INTO runs (started_at) VALUES (?)", (_now(),))
+            return cur.lastrowid, False
+
+    def finish_run(self, run_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE runs SET finished_at = ? WHERE id = ?", (_now(), run_id))
+
+    # Machines
+
+    def get_machine(self, source_id: str) -> Optional[dict]:
+        """Return the stored state for a machine, with `record` decoded, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM machines WHERE source_id = ?", (source_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        state = dict(row)
+        state["record"] = json.loads(state["record"]) if state["record"] else None
+        return state
+
+    def source_ids(self) -> set[str]:
+        """IDs of every machine scraped so far."""
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT source_id FROM machines")}
+
+    def save_machine(self, source_id: str, source_url: str, record: dict, run_id: int,
+                     etag: Optional[str], last_modified: Optional[str],
+                     content_hash: Optional[str]) -> None:
+        """Mark a machine as completed in `run_id` with its final record and validators."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO machines (source_id, source_url, fetched_at, etag, last_modified,
+                                      content_hash, record, run_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source_id) DO UPDATE SET
+                    source_url = excluded.source_url,
+                    fetched_at = excluded.fetched_at,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    content_hash = excluded.content_hash,
+                    record = excluded.record,
+                    run_id = excluded.run_id
+                """,
+                (source_id, source_url, _now(), etag, last_modified, content_hash,
+                 json.dumps(record, ensure_ascii=False), run_id),
+            )
+
+    # Images
+
+    def get_image(self, source_id: str, url: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM images WHERE source_id = ? AND url = ?", (source_id, url)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def save_image(self, source_id: str, url: str, local_path: Optional[str], status: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO images (source_id, url, local_path, status, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(source_id, url) DO UPDATE SET
+                    local_path = excluded.local_path,
+                    status = excluded.status,
+                    updated_at = excluded.updated_at
+                """,
+                (source_id, url, local_path, status, _now()),
+            )
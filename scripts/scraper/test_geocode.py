@@ -0,0 +1,80 @@
+"""
+Tests for the address normaliser and gazetteer lookup in geocode.py.
+
+Usage:
+    python -m unittest test_geocode
+"""
+
+import csv
+import os
+import tempfile
+import unittest
+
+from geocode import GazetteerResolver, area_keys, normalize_address
+
+
+class NormalizeAddressTest(unittest.TestCase):
+    def test_full_width_and_postal_code(self):
+        self.assertEqual(normalize_address("〒162-0063 東京都新宿区市谷薬王寺町５３ー２"),
+                         "東京都新宿区市谷薬王寺町53-2")
+
+    def test_block_suffixes_and_building(self):
+        self.assertEqual(normalize_address("東京都新宿区西新宿二丁目8番1号 都庁"), "東京都新宿区西新宿2-8-1")
+
+    def test_floor_after_space_is_cut(self):
+        self.assertEqual(normalize_address("東京都中央区銀座4-5-6 2F"), "東京都中央区銀座4-5-6")
+        self.assertEqual(normalize_address("東京都中央区銀座4-5-6　銀座ビル3階"), "東京都中央区銀座4-5-6")
+
+    def test_spaces_inside_address(self):
+        self.assertEqual(normalize_address("東京都 中央区 銀座4丁目 5番 6号"), "東京都中央区銀座4-5-6")
+
+    def test_jou_segments_are_kept(self):
+        self.assertEqual(normalize_address("北海道札幌市中央区北1条西2丁目1"), "北海道札幌市中央区北1条西2-1")
+        self.assertEqual(normalize_address("北海道札幌市中央区北1条西9丁目3"), "北海道札幌市中央区北1条西9-3")
+        self.assertEqual(normalize_address("北海道札幌市中央区北一条西二丁目1 ビル"), "北海道札幌市中央区北1条西2-1")
+
+    def test_sen_and_chiwari_segments_are_kept(self):
+        self.assertEqual(normalize_address("北海道旭川市東2線3号"), "北海道旭川市東2線3")
+        self.assertEqual(normalize_address("岩手県滝沢市第1地割12-3"), "岩手県滝沢市第1地割12-3")
+
+    def test_town_names_with_ban(self):
+        self.assertEqual(normalize_address("宮城県仙台市青葉区一番町1-2-3"), "宮城県仙台市青葉区一番町1-2-3")
+
+    def test_empty(self):
+        self.assertIsNone(normalize_address(None))
+        self.assertIsNone(normalize_address("〒100-0001"))
+
+    def test_area_keys_stop_at_jou(self):
+        self.assertEqual(area_keys("北海道札幌市中央区北1条西2-1"),
+                         ["北海道札幌市中央区北1条西2-1", "北海道札幌市中央区北1条西2", "北海道札幌市中央区北1条西"])
+
+
+class GazetteerResolverTest(unittest.TestCase):
+    def _resolver(self, rows: list[dict]) -> GazetteerResolver:
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        self.addCleanup(os.unlink, f.name)
+        return GazetteerResolver(f.name)
+
+    def test_jou_blocks_resolve_separately(self):
+        resolver = self._resolver([
+            {"address": "北海道札幌市中央区北1条西2丁目1", "latitude": "43.0621", "longitude": "141.3544"},
+            {"address": "北海道札幌市中央区北1条西9丁目3", "latitude": "43.0600", "longitude": "141.3440"},
+        ])
+        self.assertEqual(resolver.conflicts, 0)
+        self.assertEqual(resolver.resolve(normalize_address("北海道札幌市中央区北1条西9丁目3 3F"))[:2],
+                         (43.0600, 141.3440))
+
+    def test_conflicting_rows_are_counted(self):
+        resolver = self._resolver([
+            {"address": "東京都中央区銀座4-5-6", "latitude": "35.6717", "longitude": "139.7650"},
+            {"address": "東京都中央区銀座4丁目5番6号", "latitude": "35.0000", "longitude": "139.0000"},
+        ])
+        self.assertEqual(resolver.conflicts, 1)
+        self.assertEqual(resolver.resolve("東京都中央区銀座4-5-6")[:2], (35.6717, 139.7650))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+"""
+Politeness budgets for the scraper.
+
+Each budget pairs a token bucket (requests per second, with a small burst)
+with a concurrency cap. Budgets are keyed by (kind, host) so page fetches
+and image downloads are paced independently even when they hit the same host.
+
+Budgets adapt to how the host responds (AIMD): every fast, successful
+response raises the rate a little, up to the budget's maximum; a 429/503 or a
+slow response cuts it, down to a floor of the configured rate / MIN_RATE_DIVISOR.
+A Retry-After header pauses the whole budget. After CIRCUIT_FAILURES
+consecutive failures the budget's circuit opens: requests fail fast with
+CircuitOpenError until a cooldown passes, then one trial request decides
+whether it closes again.
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlparse
+
+INCREASE_FRACTION = 0.05  # additive increase per healthy response, as a fraction of the configured rate
+THROTTLE_FACTOR = 0.5  # multiplicative decrease on 429/503
+SLOW_FACTOR = 0.8  # multiplicative decrease on a slow response
+SLOW_LATENCY = 5.0  # seconds; slower responses count as congestion
+MIN_RATE_DIVISOR = 8
+THROTTLE_STATUSES = (429, 503)
+CIRCUIT_FAILURES = 5
+CIRCUIT_COOLDOWN = 30.0  # seconds, doubled on each failed trial
+MAX_CIRCUIT_COOLDOWN = 600.0
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of making a request while a budget's circuit is open."""
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Exponential backoff with full jitter for retry `attempt` (0 for the first retry)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds, fractions
+    allowed, or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.replace(".", "", 1).isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` saved."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for `seconds`, and none saved up afterwards."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until it is available. Returns time waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._refill(max(now, self._updated))
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return waited
+                    delay = (1.0 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class HostBudget:
+    """An adaptive rate limit, a cap on in-flight requests and a circuit breaker
+    for one (kind, host)."""
+
+    def __init__(self, rate: float, concurrency: int, burst: float = 1.0,
+                 max_rate: Optional[float] = None):
+        self.bucket = TokenBucket(rate, burst)
+        self.slots = threading.BoundedSemaphore(max(concurrency, 1))
+        self.min_rate = rate / MIN_RATE_DIVISOR
+        self.max_rate = max(max_rate or rate, rate)
+        self.increase = rate * INCREASE_FRACTION
+        self._failures = 0
+        self._open_until = 0.0
+        self._cooldown = CIRCUIT_COOLDOWN
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def _check_circuit(self) -> None:
+        with self._lock:
+            if self._failures < CIRCUIT_FAILURES:
+                return
+            now = time.monotonic()
+            if now < self._open_until or self._trial:
+                raise CircuitOpenError(f"circuit open, retry in {max(self._open_until - now, 0):.0f}s")
+            self._trial = True  # half-open: let one request through
+
+    @contextmanager
+    def slot(self):
+        """Hold a concurrency slot and spend one token for the duration of a request.
+
+        Raises CircuitOpenError without waiting while the circuit is open.
+        """
+        self._check_circuit()
+        with self.slots:
+            self.bucket.acquire()
+            yield
+
+    def record(self, seconds: float, status: Optional[int] = None, error: bool = False,
+               retry_after: Optional[float] = None) -> None:
+        """Adapt to the outcome of one request: its latency, HTTP status (if
+        any), whether it failed, and the server's Retry-After in seconds."""
+        throttled = status in THROTTLE_STATUSES
+        failed = error or throttled or (status is not None and status >= 500)
+        with self._lock:
+            if throttled:
+                rate = max(self.min_rate, self.rate * THROTTLE_FACTOR)
+            elif seconds > SLOW_LATENCY:
+                rate = max(self.min_rate, self.rate * SLOW_FACTOR)
+            elif not failed:
+                rate = min(self.max_rate, self.rate + self.increase)
+            else:
+                rate = self.rate
+
+            if failed:
+                self._failures += 1
+                if self._trial:
+                    self._cooldown = min(self._cooldown * 2, MAX_CIRCUIT_COOLDOWN)
+                if self._failures >= CIRCUIT_FAILURES:
+                    self._open_until = time.monotonic() + self._cooldown
+            else:
+                self._failures = 0
+                self._cooldown = CIRCUIT_COOLDOWN
+            self._trial = False
+
+        if rate != self.rate:
+            self.bucket.set_rate(rate)
+        if retry_after:
+            self.bucket.pause(retry_after)
+
+
+class HostBudgets:
+    """Lazily created HostBudget per (kind, host), configured per kind."""
+
+    def __init__(self, limits: dict[str, tuple]):
+        # limits: kind -> (requests per second, max concurrent requests[, max requests per second])
+        self.limits = limits
+        self._budgets: dict[tuple[str, str], HostBudget] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, url: str) -> HostBudget:
+        host = urlparse(url).netloc.lower()
+        key = (kind, host)
+        with self._lock:
+            budget = self._budgets.get(key)
+            if budget is None:
+                rate, concurrency, *max_rate = self.limits[kind]
+                budget = HostBudget(rate, concurrency, max_rate=max_rate[0] if max_rate else None)
+                self._budgets[key] = budget
+            return budget
+
+    @contextmanager
+    def slot(self, kind: str, url: str):
+        with self.get(kind, url).slot():
+            yield
+
+
+def budget_slot(budgets: Optional[HostBudgets], kind: str, url: str):
+    """Context manager that is a no-op when no budgets are configured."""
+    if budgets is None:
+        return _null_slot()
+    return budgets.slot(kind, url)
+
+
+def record_response(budgets: Optional[HostBudgets], kind: str, url: str, seconds: float,
+                    status: Optional[int] = None, error: bool = False,
+                    retry_after: Optional[float] = None) -> None:
+    """Feed a request outcome back to its budget; a no-op without budgets."""
+    if budgets is not None:
+        budgets.get(kind, url).record(seconds, status, error, retry_after)
+
+
+@contextmanager
+def _null_slot():
+    yield
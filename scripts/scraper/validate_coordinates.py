@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Batch validation of scraped coordinates and prefecture assignment.
+
+Coordinates come out of inline scripts and map iframes by regex, so a swapped
+`!2d!3d` pair or a stray match can put a machine in the sea or in the wrong
+prefecture. This checks every machine in a machines.json at once, with NumPy
+arrays over the whole file instead of a loop per record:
+
+- `missing`: no coordinates at all.
+- `out_of_bounds`: outside Japan's bounding box (`JAPAN_BOUNDS`).
+- `swapped`: out of bounds, but inside them with latitude and longitude
+  swapped. `--fix-swapped` writes the swapped pair back.
+- `outside_boundaries`: inside the bounding box but in no prefecture polygon
+  (the sea, or a coastline the boundary file simplifies away).
+- `prefecture_mismatch`: in a prefecture other than the one the address
+  starts with.
+
+Prefecture polygons come from a local GeoJSON file, such as MLIT's 国土数値情報
+N03 administrative areas (the name is read from `N03_001`, `nam_ja`,
+`prefecture` or `name`). Every polygon goes into an R-tree packed with the
+Sort-Tile-Recursive algorithm; all points descend it together, level by
+level, so only the polygons whose box holds a point get an even-odd
+point-in-polygon test. Each polygon's edges are also cut into horizontal
+slabs, so that test only looks at the few edges at the point's height, for
+all points at once.
+
+Each record gets `location.prefecture`: the prefecture the address names,
+otherwise the one its coordinates fall in. Issues are written to a report
+next to machines.json.
+
+Usage:
+    python validate_coordinates.py [../output/machines.json] --boundaries <prefectures.geojson>
+        [--report <path>] [--fix-swapped] [--dry-run]
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import unicodedata
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+REPORT_NAME = "coordinate_issues.json"
+
+# (min latitude, min longitude, max latitude, max longitude): Okinotorishima,
+# Yonaguni, Etorofu and Minamitorishima with a little margin
+JAPAN_BOUNDS = (20.0, 122.0, 46.0, 154.0)
+NODE_CAPACITY = 16  # R-tree entries per node
+EDGES_PER_SLAB = 8  # average polygon edges per horizontal slab of the edge index
+PIP_CHUNK = 2_000_000  # point-edge pairs per point-in-polygon step, bounds memory
+
+PREFECTURES = (
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
+    "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県",
+    "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県",
+    "静岡県", "愛知県", "三重県", "滋賀県", "京都府", "大阪府", "兵庫県",
+    "奈良県", "和歌山県", "鳥取県", "島根県", "岡山県", "広島県", "山口県",
+    "徳島県", "香川県", "愛媛県", "高知県", "福岡県", "佐賀県", "長崎県",
+    "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県",
+)
+# 東京都 is tried before the 京都府 inside it because the alternation matches leftmost first
+ADDRESS_PREFECTURE_PATTERN = re.compile("|".join(PREFECTURES))
+POSTAL_CODE_PATTERN = re.compile(r"〒?\s*\d{3}\s*-\s*\d{4}")
+NAME_PROPERTIES = ("N03_001", "nam_ja", "prefecture", "name")
+
+ISSUES = ("missing", "out_of_bounds", "swapped", "outside_boundaries", "prefecture_mismatch")
+
+
+def address_prefecture(address: Optional[str]) -> Optional[str]:
+    """The prefecture an address starts with, or None if it names none."""
+    if not address:
+        return None
+    text = POSTAL_CODE_PATTERN.sub("", unicodedata.normalize("NFKC", address)).lstrip()
+    match = ADDRESS_PREFECTURE_PATTERN.match(text) or ADDRESS_PREFECTURE_PATTERN.search(text[:20])
+    return match.group(0) if match else None
+
+
+def in_bounds(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    min_lat, min_lng, max_lat, max_lng = JAPAN_BOUNDS
+    return (lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)
+
+
+def str_order(boxes: np.ndarray, capacity: int) -> np.ndarray:
+    """Sort-Tile-Recursive order of boxes (min x, min y, max x, max y): sorted
+    by centre x into vertical slices of whole nodes, each slice by centre y."""
+    count = len(boxes)
+    centre_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    centre_y = (boxes[:, 1] + boxes[:, 3]) / 2
+    nodes = -(-count // capacity)
+    slice_size = capacity * int(np.ceil(np.sqrt(nodes)))
+    by_x = np.argsort(centre_x, kind="stable")
+    slice_of = np.empty(count, dtype=np.int64)
+    slice_of[by_x] = np.arange(count) // slice_size
+    return np.lexsort((centre_y, slice_of))
+
+
+class STRtree:
+    """Static R-tree over boxes, packed bottom-up with Sort-Tile-Recursive.
+
+    Each level is a (ids, boxes) pair in packed order: the node at index k of
+    the level above covers entries k*capacity .. (k+1)*capacity - 1, and ids
+    point into the level below (into the input boxes at the bottom level).
+    """
+
+    def __init__(self, boxes: np.ndarray, capacity: int = NODE_CAPACITY):
+        self.capacity = capacity
+        self.levels: list[tuple[np.ndarray, np.ndarray]] = []
+        ids = np.arange(len(boxes))
+        while True:
+            order = str_order(boxes, capacity)
+            ids, boxes = ids[order], boxes[order]
+            self.levels.append((ids, boxes))
+            if len(boxes) <= capacity:
+                break
+            starts = np.arange(0, len(boxes), capacity)
+            boxes = np.column_stack([
+                np.minimum.reduceat(boxes[:, 0], starts),
+                np.minimum.reduceat(boxes[:, 1], starts),
+                np.maximum.reduceat(boxes[:, 2], starts),
+                np.maximum.reduceat(boxes[:, 3], starts),
+            ])
+            ids = np.arange(len(boxes))
+
+    def query_points(self, x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(point index, box index) for every box containing a point. All
+        points descend the tree together, one array step per level."""
+        if not self.levels or not len(x):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # The root holds the whole top level
+        top = len(self.levels[-1][0])
+        points = np.repeat(np.arange(len(x)), top)
+        entries = np.tile(np.arange(top), len(x))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            ids, boxes = self.levels[depth]
+            box = boxes[entries]
+            px, py = x[points], y[points]
+            hit = (px >= box[:, 0]) & (px <= box[:, 2]) & (py >= box[:, 1]) & (py <= box[:, 3])
+            points, entries = points[hit], ids[entries[hit]]
+            if depth == 0:
+                break
+            # Expand each node into its children on the level below
+            below = len(self.levels[depth - 1][0])
+            starts = entries * self.capacity
+            counts = np.minimum(starts + self.capacity, below) - starts
+            points = np.repeat(points, counts)
+            entries = expand(starts, counts)
+        return points, entries
+
+
+class PrefectureIndex:
+    """Prefecture polygons from a GeoJSON file, with an STR tree over their
+    parts (one per polygon of a MultiPolygon; holes stay with their part)."""
+
+    def __init__(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        self.names: list[str] = []
+        part_names, boxes, edges, edge_counts = [], [], [], []
+        name_ids: dict[str, int] = {}
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            name = next((properties[p] for p in NAME_PROPERTIES if properties.get(p)), None)
+            if name is None or geometry.get("type") not in ("Polygon", "MultiPolygon"):
+                continue
+            name = unicodedata.normalize("NFKC", name)
+            if name not in name_ids:
+                name_ids[name] = len(self.names)
+                self.names.append(name)
+            polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+            for rings in polygons:
+                part_edges = []
+                for ring in rings:
+                    ring = np.asarray(ring, dtype=np.float64)[:, :2]
+                    if len(ring) < 3:
+                        continue
+                    part_edges.append(np.hstack([ring, np.roll(ring, -1, axis=0)]))
+                if not part_edges:
+                    continue
+                outer = np.asarray(rings[0], dtype=np.float64)[:, :2]
+                boxes.append((*outer.min(axis=0), *outer.max(axis=0)))
+                edges.append(np.vstack(part_edges))
+                edge_counts.append(len(edges[-1]))
+                part_names.append(name_ids[name])
+        if not boxes:
+            raise ValueError(f"{path} has no named Polygon or MultiPolygon features")
+        self.part_names = np.asarray(part_names)
+        self.edges = np.vstack(edges)  # x1, y1, x2, y2 per edge (GeoJSON x is longitude)
+        boxes = np.asarray(boxes, dtype=np.float64)
+        self.tree = STRtree(boxes)
+        self._index_edges(boxes, np.asarray(edge_counts))
+
+    def _index_edges(self, boxes: np.ndarray, edge_counts: np.ndarray) -> None:
+        """Cut every part into horizontal slabs of about EDGES_PER_SLAB edges
+        and list the edges whose y range reaches into each slab, so a point
+        is only tested against the edges at its own height."""
+        self.slab_count = -(-edge_counts // EDGES_PER_SLAB)
+        self.slab_offset = np.concatenate([[0], np.cumsum(self.slab_count)[:-1]])
+        self.slab_bottom = boxes[:, 1]
+        self.slab_height = np.maximum(boxes[:, 3] - boxes[:, 1], 1e-12) / self.slab_count
+        edge_part = np.repeat(np.arange(len(edge_counts)), edge_counts)
+        low = np.minimum(self.edges[:, 1], self.edges[:, 3])
+        high = np.maximum(self.edges[:, 1], self.edges[:, 3])
+        first = self._slab(edge_part, low)
+        counts = self._slab(edge_part, high) - first + 1
+        edge_ids = np.repeat(np.arange(len(self.edges)), counts)
+        slabs = expand(first, counts) + self.slab_offset[edge_part[edge_ids]]
+        order = np.argsort(slabs, kind="stable")
+        self.slab_edges = edge_ids[order]
+        self.slab_starts = np.concatenate([[0], np.cumsum(np.bincount(slabs, minlength=self.slab_count.sum()))])
+
+    def _slab(self, parts: np.ndarray, y: np.ndarray) -> np.ndarray:
+        slab = np.floor((y - self.slab_bottom[parts]) / self.slab_height[parts]).astype(np.int64)
+        return np.clip(slab, 0, self.slab_count[parts] - 1)
+
+    def locate(self, lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+        """Index into `names` of the prefecture each point is in, -1 for none.
+        A point on a shared border goes to the first part that contains it."""
+        points, parts = self.tree.query_points(lng, lat)
+        slabs = self._slab(parts, lat[points]) + self.slab_offset[parts]
+        starts = self.slab_starts[slabs]
+        counts = self.slab_starts[slabs + 1] - starts
+        # Even-odd ray casting towards +x, in chunks of about PIP_CHUNK point-edge pairs
+        found = np.full(len(lat), len(self.part_names), dtype=np.int64)
+        ends = np.cumsum(counts)
+        bounds = list(np.unique(np.searchsorted(ends, np.arange(PIP_CHUNK, ends[-1], PIP_CHUNK)))) if len(ends) else []
+        for begin, end in zip([0, *bounds], [*bounds, len(points)]):
+            pair = np.repeat(np.arange(begin, end), counts[begin:end])
+            x1, y1, x2, y2 = self.edges[self.slab_edges[expand(starts[begin:end], counts[begin:end])]].T
+            px, py = lng[points[pair]], lat[points[pair]]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossings = ((y1 > py) != (y2 > py)) & (px < x1 + (py - y1) * (x2 - x1) / (y2 - y1))
+            inside = np.bincount(pair[crossings] - begin, minlength=end - begin) % 2 == 1
+            np.minimum.at(found, points[begin:end][inside], parts[begin:end][inside])
+        result = np.full(len(lat), -1, dtype=np.int64)
+        located = found < len(self.part_names)
+        result[located] = self.part_names[found[located]]
+        return result
+
+
+def expand(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """starts[i], starts[i] + 1, ..., starts[i] + counts[i] - 1 for every i, concatenated."""
+    offsets = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(starts, counts)
+
+
+def validate(records: list[dict], index: PrefectureIndex, fix_swapped: bool = False) -> list[dict]:
+    """Check the coordinates of every record, set `location.prefecture`, and
+    return one issue entry per record with a problem."""
+    count = len(records)
+    lat = np.full(count, np.nan)
+    lng = np.full(count, np.nan)
+    for i, record in enumerate(records):
+        location = record.get("location") or {}
+        if location.get("latitude") is not None and location.get("longitude") is not None:
+            lat[i], lng[i] = location["latitude"], location["longitude"]
+
+    missing = np.isnan(lat) | np.isnan(lng)
+    bounded = in_bounds(lat, lng)
+    swapped = ~bounded & ~missing & in_bounds(lng, lat)
+    # Swapped points are looked up where they were meant to be
+    point_lat = np.where(swapped, lng, lat)
+    point_lng = np.where(swapped, lat, lng)
+    located = bounded | swapped
+    point_prefectures = np.full(count, -1, dtype=np.int64)
+    point_prefectures[located] = index.locate(point_lat[located], point_lng[located])
+
+    issues = []
+    for i, record in enumerate(records):
+        location = record.setdefault("location", {})
+        named = address_prefecture(location.get("address"))
+        found = index.names[point_prefectures[i]] if point_prefectures[i] >= 0 else None
+        location["prefecture"] = named or found
+        if missing[i]:
+            issue = "missing"
+        elif swapped[i]:
+            issue = "swapped"
+            if fix_swapped:
+                location["latitude"], location["longitude"] = float(point_lat[i]), float(point_lng[i])
+        elif not bounded[i]:
+            issue = "out_of_bounds"
+        elif found is None:
+            issue = "outside_boundaries"
+        elif named and named != found:
+            issue = "prefecture_mismatch"
+        else:
+            continue
+        issues.append({
+            "source_id": record.get("source_id"),
+            "issue": issue,
+            "latitude": None if np.isnan(lat[i]) else float(lat[i]),
+            "longitude": None if np.isnan(lng[i]) else float(lng[i]),
+            "address": location.get("address"),
+            "address_prefecture": named,
+            "point_prefecture": found,
+        })
+    return issues
+
+
+def main():
+    script_dir = Path(__file__).resolve().parent
+    output_dir = script_dir.parent / "output"
+
+    parser = argparse.ArgumentParser(description="Validate machine coordinates and assign prefectures")
+    parser.add_argument(
+        "machines_file",
+        nargs="?",
+        default=str(output_dir / "machines.json"),
+        help="machines.json to check and update in place (default: ../output/machines.json)"
+    )
+    parser.add_argument("--boundaries", required=True, help="Prefecture boundaries as GeoJSON (e.g. MLIT N03)")
+    parser.add_argument("--report", help=f"Issue report to write (default: {REPORT_NAME} next to machines.json)")
+    parser.add_argument("--fix-swapped", action="store_true", help="Swap back coordinates flagged as swapped")
+    parser.add_argument("--dry-run", action="store_true", help="Write the report only, leave machines.json unchanged")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = PrefectureIndex(args.boundaries)
+    loaded = time.perf_counter()
+    with open(args.machines_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    checked = time.perf_counter()
+    issues = validate(data["machines"], index, args.fix_swapped)
+    validated = time.perf_counter()
+
+    counts = {issue: 0 for issue in ISSUES}
+    for entry in issues:
+        counts[entry["issue"]] += 1
+    report_path = args.report or str(Path(args.machines_file).parent / REPORT_NAME)
+    report = {"machines": len(data["machines"]), "counts": counts, "issues": issues}
+    for path, content in ((report_path, report), (None if args.dry_run else args.machines_file, data)):
+        if path is None:
+            continue
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(content, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    print(f"Boundaries: {args.boundaries} ({len(index.names)} prefectures, {len(index.part_names)} polygons, "
+          f"{len(index.edges)} edges) loaded in {loaded - started:.2f}s")
+    print(f"Validated {len(data['machines'])} machines in {validated - checked:.2f}s")
+    print("  " + " | ".join(f"{issue}: {count}" for issue, count in counts.items()))
+    print(f"Report written to {report_path}")
+    for entry in issues[:10]:
+        print(f"  {entry['source_id']}: {entry['issue']} ({entry['latitude']}, {entry['longitude']}) "
+              f"address={entry['address_prefecture']} point={entry['point_prefecture']}")
+    if len(issues) > 10:
+        print(f"  ... and {len(issues) - 10} more")
+
+
+if __name__ == "__main__":
+    main()
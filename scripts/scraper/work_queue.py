@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Shared work queue for sharded scraping.
+
+One SQLite file holds a job per source_id. Any number of scraper workers
+(processes, or machines sharing a filesystem with working file locks) lease
+jobs from it in batches; every lease is taken in an IMMEDIATE transaction,
+so the database lock makes it atomic across processes. A lease expires after
+`lease_seconds`; an expired job goes back to whichever worker asks next, so
+a crashed worker's machines are picked up by the others. A job that has been
+leased MAX_ATTEMPTS times without completing is marked failed.
+
+Usage:
+    python work_queue.py enqueue <queue.db> (--input <file.md> | --frontier <frontier.db>)
+    python work_queue.py status <queue.db>
+    python work_queue.py requeue <queue.db>      # failed jobs back to pending
+
+Workers: python jihanki_scraper.py --work-queue <queue.db> --worker-id <name>
+"""
+
+import argparse
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_LEASE_SECONDS = 900  # long enough for a batch of slow machines with many images
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    source_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """Leased job queue in SQLite, safe to share between processes and threads."""
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction holding the database lock from its first statement."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _write(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._transaction() as conn:
+            return conn.execute(sql, params)
+
+    def enqueue(self, jobs: Iterable[tuple[str, str]]) -> int:
+        """Add (source_id, url) jobs, skipping IDs already queued. Returns the number added."""
+        now = time.time()
+        with self._transaction() as conn:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM jobs").fetchone()[0]
+            added = 0
+            for source_id, url in jobs:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (source_id, url, seq, updated_at) VALUES (?, ?, ?, ?)",
+                    (source_id, url, seq + 1, now),
+                )
+                if cursor.rowcount:
+                    seq += 1
+                    added += 1
+        return added
+
+    def lease(self, worker: str, batch_size: int = DEFAULT_BATCH_SIZE,
+              lease_seconds: float = DEFAULT_LEASE_SECONDS) -> list[dict]:
+        """Lease up to `batch_size` jobs, pending or with an expired lease, in queue order.
+
+        Also extends the leases `worker` already holds. Jobs out of attempts
+        are marked failed instead of being handed out again.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE status = 'leased' AND worker = ?",
+                (now + lease_seconds, now, worker),
+            )
+            conn.execute(
+                """
+                UPDATE jobs SET status = 'failed', error = 'Lease expired too many times', updated_at = ?
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+                """,
+                (now, now, MAX_ATTEMPTS),
+            )
+            rows = conn.execute(
+                """
+                SELECT source_id, url, attempts FROM jobs
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY seq LIMIT ?
+                """,
+                (now, batch_size),
+            ).fetchall()
+            conn.executemany(
+                """
+                UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?,
+                                attempts = attempts + 1, updated_at = ?
+                WHERE source_id = ?
+                """,
+                [(worker, now + lease_seconds, now, row["source_id"]) for row in rows],
+            )
+        return [dict(row) for row in rows]
+
+    def complete(self, source_id: str, worker: str, error: Optional[str] = None) -> None:
+        """Mark a leased job done, or failed with `error`.
+
+        A failed job is handed out again (up to MAX_ATTEMPTS leases in total)
+        unless another worker already finished it.
+        """
+        now = time.time()
+        if error is None:
+            self._write(
+                "UPDATE jobs SET status = 'done', worker = ?, error = NULL, updated_at = ? WHERE source_id = ?",
+                (worker, now, source_id),
+            )
+        else:
+            self._write(
+                """
+                UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                worker = ?, error = ?, updated_at = ?
+                WHERE source_id = ? AND status != 'done'
+                """,
+                (MAX_ATTEMPTS, worker, error, now, source_id),
+            )
+
+    def iter_urls(self, worker: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                  lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Iterator[str]:
+        """Yield URLs leased in batches until the queue has nothing left to hand out."""
+        while True:
+            batch = self.lease(worker, batch_size, lease_seconds)
+            if not batch:
+                return
+            for job in batch:
+                yield job["url"]
+
+    def requeue_failed(self) -> int:
+        cursor = self._write(
+            "UPDATE jobs SET status = 'pending', attempts = 0, error = NULL, updated_at = ? WHERE status = 'failed'",
+            (time.time(),),
+        )
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            expired = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'leased' AND lease_expires < ?", (time.time(),)
+            ).fetchone()[0]
+            workers = dict(self._conn.execute(
+                "SELECT worker, COUNT(*) FROM jobs WHERE status = 'done' GROUP BY worker"
+            ).fetchall())
+        return {
+            "pending": counts.get("pending", 0),
+            "leased": counts.get("leased", 0),
+            "expired": expired,
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "done_by_worker": workers,
+        }
+
+
+def main():
+    # Imported here so workers importing this module do not pull in the scraper
+    from frontier import Frontier
+    from jihanki_scraper import extract_machine_id, extract_urls_from_markdown
+
+    parser = argparse.ArgumentParser(description="Manage the shared work queue for sharded scraping")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="Add machine URLs to the queue")
+    enqueue.add_argument("queue_db")
+    source = enqueue.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Markdown file containing jihanki.sagase.com URLs")
+    source.add_argument("--frontier", help="Discovery frontier; its pending machines are queued")
+    status = commands.add_parser("status", help="Show job counts")
+    status.add_argument("queue_db")
+    requeue = commands.add_parser("requeue", help="Put failed jobs back in the queue")
+    requeue.add_argument("queue_db")
+    args = parser.parse_args()
+
+    work_queue = WorkQueue(args.queue_db)
+    if args.command == "enqueue":
+        if args.input:
+            urls = extract_urls_from_markdown(args.input)
+        else:
+            frontier = Frontier(args.frontier)
+            urls = frontier.pending_urls()
+            frontier.close()
+        jobs = [(extract_machine_id(url), url) for url in urls]
+        added = work_queue.enqueue(job for job in jobs if job[0])
+        print(f"Queued {added} of {len(jobs)} URLs ({len(jobs) - added} already queued or without an ID)")
+    elif args.command == "requeue":
+        print(f"Requeued {work_queue.requeue_failed()} failed jobs")
+
+    stats = work_queue.stats()
+    print(f"Pending: {stats['pending']} | leased: {stats['leased']} ({stats['expired']} expired) | "
+          f"done: {stats['done']} | failed: {stats['failed']}")
+    for worker, count in sorted(stats["done_by_worker"].items()):
+        print(f"  {worker}: {count} done")
+    work_queue.close()
+
+
+if __name__ == "__main__":
+    main()
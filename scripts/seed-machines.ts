@@ -1,4 +1,5 @@
 import { createClient } from '@supabase/supabase-js';
+import * as crypto from 'crypto';
 import * as fs from 'fs';
 import * as path from 'path';
 
@@ -13,6 +14,8 @@ if (!supabaseUrl || !supabaseServiceKey) {
 
 const supabase = createClient(supabaseUrl, supabaseServiceKey);
 
+const outputDir = path.join(__dirname, 'output');
+
 // Category mapping from Japanese to slug
 const categoryMap: Record<string, string> = {
   '飲み物': 'eats',
@@ -41,17 +44,26 @@ interface MachineJSON {
   images: {
     url: string | null;
     local_path: string;
+    sha256?: string;
+    format?: string;
+    width?: number;
+    height?: number;
+    webp_path?: string;
+    thumb_path?: string;
   }[];
 }
 
+type MachineImage = MachineJSON['images'][number];
+
 interface MachinesData {
   scraped_at: string;
   source: string;
   machines: MachineJSON[];
 }
 
-async function getContentType(filePath: string): Promise<string> {
-  const ext = path.extname(filePath).toLowerCase();
+async function getContentType(filePath: string, format?: string): Promise<string> {
+  // The scraper records the decoded format, which beats a guessed extension
+  const ext = format ? `.${format}` : path.extname(filePath).toLowerCase();
   const types: Record<string, string> = {
     '.jpg': 'image/jpeg',
     '.jpeg': 'image/jpeg',
@@ -62,29 +74,49 @@ async function getContentType(filePath: string): Promise<string> {
   return types[ext] || 'image/jpeg';
 }
 
-async function uploadImage(localPath: string, machineId: string): Promise<string | null> {
-  const fullPath = path.join(__dirname, 'output', localPath);
+// Storage paths of content-addressed images already uploaded in this run
+const uploadedBlobs = new Set<string>();
+
+async function uploadImage(
+  localPath: string,
+  machineId: string,
+  sha256?: string,
+  format?: string
+): Promise<string | null> {
+  const fullPath = path.join(outputDir, localPath);
 
   if (!fs.existsSync(fullPath)) {
     console.log(`  ⚠ Image not found: ${fullPath}`);
     return null;
   }
 
-  const fileBuffer = fs.readFileSync(fullPath);
-  const fileName = path.basename(localPath);
-  const storagePath = `machines/${machineId}/${fileName}`;
-  const contentType = await getContentType(fullPath);
-
-  const { error } = await supabase.storage
-    .from('machine-photos')
-    .upload(storagePath, fileBuffer, {
-      contentType,
-      upsert: true,
-    });
-
-  if (error) {
-    console.log(`  ⚠ Upload failed: ${error.message}`);
-    return null;
+  // Images with a content hash are stored once, however many machines use them.
+  // Variants keep their suffix: 1_thumb.webp -> <variant sha256>_thumb.webp
+  const suffix = path.basename(localPath).replace(/^\d+/, '');
+  const storagePath = sha256
+    ? `machines/blobs/${sha256}${suffix}`
+    : `machines/${machineId}/${path.basename(localPath)}`;
+
+  if (!uploadedBlobs.has(storagePath)) {
+    const fileBuffer = fs.readFileSync(fullPath);
+    const contentType = await getContentType(fullPath, format);
+
+    const { error } = await supabase.storage
+      .from('machine-photos')
+      .upload(storagePath, fileBuffer, {
+        contentType,
+        // A blob path always holds the same bytes, so an existing one is kept as-is
+        upsert: !sha256,
+      });
+
+    const alreadyStored = sha256 && error && /already exists/i.test(error.message);
+    if (error && !alreadyStored) {
+      console.log(`  ⚠ Upload failed: ${error.message}`);
+      return null;
+    }
+    if (sha256) {
+      uploadedBlobs.add(storagePath);
+    }
   }
 
   const { data: urlData } = supabase.storage
@@ -94,6 +126,30 @@ async function uploadImage(localPath: string, machineId: string): Promise<string
   return urlData.publicUrl;
 }
 
+// Variants are addressed by their own bytes, not the original's sha256, so one
+// regenerated at another size or quality gets a new blob instead of the stale one
+function variantSha256(localPath: string, sha256?: string): string | undefined {
+  const fullPath = path.join(outputDir, localPath);
+  if (!sha256 || !fs.existsSync(fullPath)) {
+    return undefined;
+  }
+  return crypto.createHash('sha256').update(fs.readFileSync(fullPath)).digest('hex');
+}
+
+// Uploads the WebP variant and thumbnail when the scraper produced them, else the original
+async function uploadMachineImage(
+  img: MachineImage,
+  machineId: string
+): Promise<{ photoUrl: string | null; thumbnailUrl: string | null }> {
+  const photoUrl = img.webp_path
+    ? await uploadImage(img.webp_path, machineId, variantSha256(img.webp_path, img.sha256))
+    : await uploadImage(img.local_path, machineId, img.sha256, img.format);
+  const thumbnailUrl = img.thumb_path
+    ? await uploadImage(img.thumb_path, machineId, variantSha256(img.thumb_path, img.sha256))
+    : null;
+  return { photoUrl, thumbnailUrl };
+}
+
 async function getCategoryIds(): Promise<Record<string, string>> {
   const { data, error } = await supabase
     .from('categories')
@@ -111,11 +167,337 @@ async function getCategoryIds(): Promise<Record<string, string>> {
   return map;
 }
 
+// Written by scraper/delta_export.py: only what changed since the last acknowledged export
+interface MachinesDelta {
+  scraped_at: string;
+  added: { machine: MachineJSON }[];
+  changed: { machine: MachineJSON }[];
+  removed: string[];
+}
+
+// Inserts the machine's photos and category links. Returns the linked category
+// slugs and how many uploads or inserts failed.
+async function addPhotosAndCategories(
+  machine: MachineJSON,
+  machineId: string,
+  categoryIds: Record<string, string>
+): Promise<{ slugs: string[]; failures: number }> {
+  let failures = 0;
+  const isPlaceholder = machine.images.length === 1 &&
+    machine.images[0].local_path.includes('placeholder/');
+
+  if (isPlaceholder) {
+    // Upload placeholder and mark as needs_photo
+    const img = machine.images[0];
+    const { photoUrl, thumbnailUrl } = await uploadMachineImage(img, machineId);
+    if (!photoUrl) {
+      failures++;
+    } else {
+      const { error: photoError } = await supabase
+        .from('machine_photos')
+        .insert({
+          machine_id: machineId,
+          photo_url: photoUrl,
+          thumbnail_url: thumbnailUrl,
+          is_primary: true,
+          status: 'needs_photo',
+        });
+
+      if (photoError) {
+        console.log(`  ⚠ Placeholder photo insert failed: ${photoError.message}`);
+        failures++;
+      } else {
+        console.log(`  📷 Placeholder photo set (needs user photo)`);
+      }
+    }
+  } else {
+    for (let i = 0; i < machine.images.length; i++) {
+      const img = machine.images[i];
+      if (!img.local_path) continue;
+
+      const { photoUrl, thumbnailUrl } = await uploadMachineImage(img, machineId);
+      if (!photoUrl) {
+        failures++;
+      } else {
+        const { error: photoError } = await supabase
+          .from('machine_photos')
+          .insert({
+            machine_id: machineId,
+            photo_url: photoUrl,
+            thumbnail_url: thumbnailUrl,
+            is_primary: i === 0,
+            status: 'active',
+          });
+
+        if (photoError) {
+          console.log(`  ⚠ Photo insert failed: ${photoError.message}`);
+          failures++;
+        } else {
+          console.log(`  📷 Uploaded photo ${i + 1}`);
+        }
+      }
+    }
+  }
+
+  // Link to categories
+  const categorySlugs = machine.categories
+    .map(cat => categoryMap[cat] || cat.toLowerCase())
+    .filter(slug => categoryIds[slug]);
+
+  const uniqueSlugs = [...new Set(categorySlugs)];
+
+  for (const slug of uniqueSlugs) {
+    const categoryId = categoryIds[slug];
+    if (categoryId) {
+      const { error: catError } = await supabase
+        .from('machine_categories')
+        .insert({
+          machine_id: machineId,
+          category_id: categoryId,
+        });
+
+      if (catError && !catError.message.includes('duplicate')) {
+        console.log(`  ⚠ Category link failed: ${catError.message}`);
+        failures++;
+      }
+    }
+  }
+  return { slugs: uniqueSlugs, failures };
+}
+
+function machineFields(machine: MachineJSON) {
+  // Build description from features
+  const description = machine.features.join(' ');
+  return {
+    source_id: machine.source_id,
+    name: machine.name,
+    description: description || null,
+    address: machine.location.address,
+    latitude: machine.location.latitude,
+    longitude: machine.location.longitude,
+    location: `SRID=4326;POINT(${machine.location.longitude} ${machine.location.latitude})`,
+  };
+}
+
+// Inserts a new machine, or with `existingId` refreshes a seeded one in place
+// (keeping its id, visits and user photos, replacing scraped photos and categories).
+// `reactivate` puts a machine removed by an earlier delta back on the map.
+async function seedMachine(
+  machine: MachineJSON,
+  categoryIds: Record<string, string>,
+  existingId?: string,
+  reactivate = false
+): Promise<boolean> {
+  console.log(`Processing: ${machine.name} (${machine.source_id})`);
+
+  try {
+    // Generate UUID for a new machine
+    const machineId = existingId ?? crypto.randomUUID();
+
+    if (existingId) {
+      const { error: machineError } = await supabase
+        .from('machines')
+        .update(reactivate ? { ...machineFields(machine), status: 'active' } : machineFields(machine))
+        .eq('id', machineId);
+      if (machineError) {
+        console.log(`  ✗ Machine update failed: ${machineError.message}`);
+        return false;
+      }
+      // Seeded photos have no uploader
+      const { error: photoDelError } = await supabase
+        .from('machine_photos')
+        .delete()
+        .eq('machine_id', machineId)
+        .is('uploaded_by', null);
+      if (photoDelError) {
+        console.log(`  ✗ Removing old photos failed: ${photoDelError.message}`);
+        return false;
+      }
+      const { error: catDelError } = await supabase
+        .from('machine_categories')
+        .delete()
+        .eq('machine_id', machineId);
+      if (catDelError) {
+        console.log(`  ✗ Removing old categories failed: ${catDelError.message}`);
+        return false;
+      }
+    } else {
+      const { error: machineError } = await supabase
+        .from('machines')
+        .insert({ id: machineId, ...machineFields(machine), status: 'active' });
+      if (machineError) {
+        console.log(`  ✗ Machine insert failed: ${machineError.message}`);
+        return false;
+      }
+    }
+
+    const { slugs, failures } = await addPhotosAndCategories(machine, machineId, categoryIds);
+    if (failures) {
+      // Counted as an error so the delta is not acknowledged and the next run retries
+      console.log(`  ✗ ${failures} photo or category failures (categories: ${slugs.join(', ')})`);
+      return false;
+    }
+    console.log(`  ✓ Success (categories: ${slugs.join(', ')})`);
+    return true;
+  } catch (err) {
+    console.log(`  ✗ Error: ${err}`);
+    return false;
+  }
+}
+
+// Seeded machine ids by source_id
+async function seededIds(sourceIds: string[]): Promise<Map<string, string>> {
+  const ids = new Map<string, string>();
+  for (let i = 0; i < sourceIds.length; i += 200) {
+    const { data, error } = await supabase
+      .from('machines')
+      .select('id, source_id')
+      .in('source_id', sourceIds.slice(i, i + 200));
+    if (error) throw new Error(`Failed to look up machines: ${error.message}`);
+    for (const row of data || []) ids.set(row.source_id, row.id);
+  }
+  return ids;
+}
+
+// Seeded machines (those without a contributor) from before the source_id
+// column. A delta cannot find them, so it would insert them a second time.
+async function unkeyedSeededCount(): Promise<number> {
+  const { count, error } = await supabase
+    .from('machines')
+    .select('id', { count: 'exact', head: true })
+    .is('source_id', null)
+    .is('contributor_id', null);
+  if (error) throw new Error(`Failed to count machines without source_id: ${error.message}`);
+  return count ?? 0;
+}
+
+// Fills source_id of machines seeded before the column existed, matching
+// machines.json on the name and address they were seeded with
+async function backfillSourceIds() {
+  const data: MachinesData = JSON.parse(fs.readFileSync(path.join(outputDir, 'machines.json'), 'utf-8'));
+  console.log(`🔑 Backfilling source_id from ${data.machines.length} machines\n`);
+
+  let filled = 0;
+  let unmatched = 0;
+  let errorCount = 0;
+  for (const machine of data.machines) {
+    const { data: rows, error } = await supabase
+      .from('machines')
+      .update({ source_id: machine.source_id })
+      .eq('name', machine.name)
+      .eq('address', machine.location.address)
+      .is('source_id', null)
+      .is('contributor_id', null)
+      .select('id');
+    if (error) {
+      // Two seeded rows with the same name and address hit the unique index
+      console.log(`✗ ${machine.name} (${machine.source_id}): ${error.message}`);
+      errorCount++;
+    } else if (rows?.length) {
+      filled++;
+    } else {
+      unmatched++;
+    }
+  }
+
+  console.log('\n' + '='.repeat(50));
+  console.log(`   Filled: ${filled}`);
+  console.log(`   Not matched: ${unmatched}`);
+  console.log(`   Errors: ${errorCount}`);
+  console.log(`   Seeded machines still without source_id: ${await unkeyedSeededCount()}`);
+}
+
+// Tells delta_export.py the export scraped at `scrapedAt` is uploaded, so the
+// next delta is diffed against it (same as `python delta_export.py --ack`)
+function acknowledgeDelta(scrapedAt: string) {
+  const pendingPath = path.join(outputDir, 'machines.fingerprints.pending.json');
+  if (!fs.existsSync(pendingPath)) return;
+  const pending = JSON.parse(fs.readFileSync(pendingPath, 'utf-8'));
+  if (pending.scraped_at !== scrapedAt) {
+    console.log(`⚠ Pending delta is from ${pending.scraped_at}, not ${scrapedAt}: not acknowledged`);
+    return;
+  }
+  fs.renameSync(pendingPath, path.join(outputDir, 'machines.fingerprints.json'));
+  console.log(`📌 Delta acknowledged (${scrapedAt})`);
+}
+
+async function seedDelta(categoryIds: Record<string, string>) {
+  const deltaPath = path.join(outputDir, 'machines.delta.json');
+  const delta: MachinesDelta = JSON.parse(fs.readFileSync(deltaPath, 'utf-8'));
+
+  const unkeyed = await unkeyedSeededCount();
+  if (unkeyed) {
+    console.error(`✗ ${unkeyed} seeded machines have no source_id: run seed-machines.ts ` +
+      `--backfill-source-ids (or a full seed) before applying a delta`);
+    process.exitCode = 1;
+    return;
+  }
+
+  console.log(`📦 Delta: ${delta.added.length} added, ${delta.changed.length} changed, ` +
+    `${delta.removed.length} removed\n`);
+
+  const added = new Set(delta.added.map(entry => entry.machine.source_id));
+  const machines = [...delta.added, ...delta.changed].map(entry => entry.machine);
+  const existing = await seededIds(machines.map(m => m.source_id));
+
+  let successCount = 0;
+  let errorCount = 0;
+  for (const machine of machines) {
+    const existingId = existing.get(machine.source_id);
+    if (await seedMachine(machine, categoryIds, existingId, added.has(machine.source_id))) {
+      successCount++;
+    } else {
+      errorCount++;
+    }
+  }
+
+  // Removed machines keep their visits and history; they are only taken off the map
+  let removedCount = 0;
+  for (let i = 0; i < delta.removed.length; i += 200) {
+    const { data, error } = await supabase
+      .from('machines')
+      .update({ status: 'removed' })
+      .in('source_id', delta.removed.slice(i, i + 200))
+      .select('id');
+    if (error) {
+      console.log(`✗ Removing machines failed: ${error.message}`);
+      errorCount++;
+    } else {
+      removedCount += data?.length ?? 0;
+    }
+  }
+
+  console.log('\n' + '='.repeat(50));
+  console.log(`✅ Delta applied!`);
+  console.log(`   Success: ${successCount}`);
+  console.log(`   Removed: ${removedCount}`);
+  console.log(`   Errors: ${errorCount}`);
+  if (errorCount === 0) {
+    acknowledgeDelta(delta.scraped_at);
+  } else {
+    console.log('   Delta not acknowledged: fix the errors and run again');
+  }
+}
+
 async function seedMachines() {
   console.log('🚀 Starting machine seeding...\n');
 
+  if (process.argv.includes('--backfill-source-ids')) {
+    await backfillSourceIds();
+    return;
+  }
+
+  // Get category IDs
+  const categoryIds = await getCategoryIds();
+  console.log('📁 Categories:', Object.keys(categoryIds).join(', '), '\n');
+
+  if (process.argv.includes('--delta')) {
+    await seedDelta(categoryIds);
+    return;
+  }
+
   // Load machines.json
-  const dataPath = path.join(__dirname, 'output', 'machines.json');
+  const dataPath = path.join(outputDir, 'machines.json');
   const rawData = fs.readFileSync(dataPath, 'utf-8');
   const data: MachinesData = JSON.parse(rawData);
 
@@ -131,120 +513,13 @@ async function seedMachines() {
   if (delMachErr) console.log(`  ⚠ machines cleanup: ${delMachErr.message}`);
   console.log('✅ Cleanup complete\n');
 
-  // Get category IDs
-  const categoryIds = await getCategoryIds();
-  console.log('📁 Categories:', Object.keys(categoryIds).join(', '), '\n');
-
   let successCount = 0;
   let errorCount = 0;
 
   for (const machine of data.machines) {
-    console.log(`Processing: ${machine.name} (${machine.source_id})`);
-
-    try {
-      // Generate UUID for this machine
-      const machineId = crypto.randomUUID();
-
-      // Build description from features
-      const description = machine.features.join(' ');
-
-      // Insert machine
-      const { error: machineError } = await supabase
-        .from('machines')
-        .insert({
-          id: machineId,
-          name: machine.name,
-          description: description || null,
-          address: machine.location.address,
-          latitude: machine.location.latitude,
-          longitude: machine.location.longitude,
-          location: `SRID=4326;POINT(${machine.location.longitude} ${machine.location.latitude})`,
-          status: 'active',
-        });
-
-      if (machineError) {
-        console.log(`  ✗ Machine insert failed: ${machineError.message}`);
-        errorCount++;
-        continue;
-      }
-
-      // Upload images and create photo records
-      const isPlaceholder = machine.images.length === 1 &&
-        machine.images[0].local_path.includes('placeholder/');
-
-      if (isPlaceholder) {
-        // Upload placeholder and mark as needs_photo
-        const img = machine.images[0];
-        const photoUrl = await uploadImage(img.local_path, machineId);
-        if (photoUrl) {
-          const { error: photoError } = await supabase
-            .from('machine_photos')
-            .insert({
-              machine_id: machineId,
-              photo_url: photoUrl,
-              is_primary: true,
-              status: 'needs_photo',
-            });
-
-          if (photoError) {
-            console.log(`  ⚠ Placeholder photo insert failed: ${photoError.message}`);
-          } else {
-            console.log(`  📷 Placeholder photo set (needs user photo)`);
-          }
-        }
-      } else {
-        for (let i = 0; i < machine.images.length; i++) {
-          const img = machine.images[i];
-          if (!img.local_path) continue;
-
-          const photoUrl = await uploadImage(img.local_path, machineId);
-          if (photoUrl) {
-            const { error: photoError } = await supabase
-              .from('machine_photos')
-              .insert({
-                machine_id: machineId,
-                photo_url: photoUrl,
-                is_primary: i === 0,
-                status: 'active',
-              });
-
-            if (photoError) {
-              console.log(`  ⚠ Photo insert failed: ${photoError.message}`);
-            } else {
-              console.log(`  📷 Uploaded photo ${i + 1}`);
-            }
-          }
-        }
-      }
-
-      // Link to categories
-      const categorySlugs = machine.categories
-        .map(cat => categoryMap[cat] || cat.toLowerCase())
-        .filter(slug => categoryIds[slug]);
-
-      const uniqueSlugs = [...new Set(categorySlugs)];
-
-      for (const slug of uniqueSlugs) {
-        const categoryId = categoryIds[slug];
-        if (categoryId) {
-          const { error: catError } = await supabase
-            .from('machine_categories')
-            .insert({
-              machine_id: machineId,
-              category_id: categoryId,
-            });
-
-          if (catError && !catError.message.includes('duplicate')) {
-            console.log(`  ⚠ Category link failed: ${catError.message}`);
-          }
-        }
-      }
-
-      console.log(`  ✓ Success (categories: ${uniqueSlugs.join(', ')})`);
+    if (await seedMachine(machine, categoryIds)) {
       successCount++;
-
-    } catch (err) {
-      console.log(`  ✗ Error: ${err}`);
+    } else {
       errorCount++;
     }
   }
@@ -253,6 +528,10 @@ async function seedMachines() {
   console.log(`✅ Seeding complete!`);
   console.log(`   Success: ${successCount}`);
   console.log(`   Errors: ${errorCount}`);
+  // A full seed uploads the same export the pending delta was written from
+  if (errorCount === 0) {
+    acknowledgeDelta(data.scraped_at);
+  }
 }
 
 seedMachines().catch(console.error);
@@ -8,6 +8,7 @@ const supabase = createClient(
 );
 
 interface Machine {
+  source_id: string;
   name: string;
   location: { address: string };
   features: string[];
@@ -17,33 +18,76 @@ interface MachinesData {
   machines: Machine[];
 }
 
-async function updateMachines() {
+// Written by scraper/delta_export.py: only what changed since the last acknowledged export
+interface MachinesDelta {
+  added: { machine: Machine }[];
+  changed: { machine: Machine }[];
+  removed: string[];
+}
+
+function loadMachines(): Machine[] {
+  if (process.argv.includes('--delta')) {
+    const deltaPath = path.join(__dirname, 'output', 'machines.delta.json');
+    const delta: MachinesDelta = JSON.parse(fs.readFileSync(deltaPath, 'utf-8'));
+    if (delta.added.length || delta.removed.length) {
+      console.log(`Delta: ${delta.added.length} added, ${delta.removed.length} removed ` +
+        `(apply those with seed-machines.ts --delta)`);
+    }
+    return delta.changed.map(c => c.machine);
+  }
   const dataPath = path.join(__dirname, 'output', 'machines.json');
   const data: MachinesData = JSON.parse(fs.readFileSync(dataPath, 'utf-8'));
+  return data.machines;
+}
+
+async function updateMachines() {
+  // Machines seeded before the source_id column would all be reported missing
+  const { count: unkeyed, error: countError } = await supabase
+    .from('machines')
+    .select('id', { count: 'exact', head: true })
+    .is('source_id', null)
+    .is('contributor_id', null);
+  if (countError) {
+    console.error(`Failed to count machines without source_id: ${countError.message}`);
+    process.exit(1);
+  }
+  if (unkeyed) {
+    console.error(`${unkeyed} seeded machines have no source_id: run seed-machines.ts --backfill-source-ids first`);
+    process.exit(1);
+  }
+
+  const machines = loadMachines();
 
-  console.log(`Updating ${data.machines.length} machines...\n`);
+  console.log(`Updating ${machines.length} machines...\n`);
 
   let updated = 0;
+  let notFound = 0;
   let errors = 0;
 
-  for (const m of data.machines) {
-    const { error } = await supabase
+  for (const m of machines) {
+    // Keyed on the scraped source_id, which survives a change of name
+    const { data, error } = await supabase
       .from('machines')
       .update({
         address: m.location.address,
         description: m.features[0] || null,
       })
-      .eq('name', m.name);
+      .eq('source_id', m.source_id)
+      .select('id');
 
     if (error) {
       console.log(`✗ ${m.name}: ${error.message}`);
       errors++;
+    } else if (!data?.length) {
+      console.log(`? ${m.name} (${m.source_id}): not in the database`);
+      notFound++;
     } else {
       updated++;
     }
   }
 
   console.log(`\n✅ Updated: ${updated}`);
+  console.log(`❓ Not found: ${notFound}`);
   console.log(`❌ Errors: ${errors}`);
 }
 
@@ -444,6 +444,7 @@ export type Database = {
           rejection_reason: string | null
           reviewed_at: string | null
           reviewed_by: string | null
+          source_id: string | null
           status: Database["public"]["Enums"]["machine_status"] | null
           updated_at: string | null
           verification_count: number | null
@@ -468,6 +469,7 @@ export type Database = {
           rejection_reason?: string | null
           reviewed_at?: string | null
           reviewed_by?: string | null
+          source_id?: string | null
           status?: Database["public"]["Enums"]["machine_status"] | null
           updated_at?: string | null
           verification_count?: number | null
@@ -492,6 +494,7 @@ export type Database = {
           rejection_reason?: string | null
           reviewed_at?: string | null
           reviewed_by?: string | null
+          source_id?: string | null
           status?: Database["public"]["Enums"]["machine_status"] | null
           updated_at?: string | null
           verification_count?: number | null
@@ -0,0 +1,16 @@
+-- Add source_id column to machines table
+-- The jihanki.sagase.com machine ID of scraped machines, so seed and update
+-- scripts can find a machine again after its name or address changes.
+-- The source IDs are only in the scraper output, not in the database, so rows
+-- seeded before this migration are backfilled by
+-- `seed-machines.ts --backfill-source-ids` (matching name and address); the
+-- delta and update scripts refuse to run until no seeded row is left without one.
+
+ALTER TABLE machines
+ADD COLUMN IF NOT EXISTS source_id TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS machines_source_id_key
+ON machines (source_id)
+WHERE source_id IS NOT NULL;
+
+COMMENT ON COLUMN machines.source_id IS 'ID of the machine on the scraped source site (scripts/scraper), null for user submissions';